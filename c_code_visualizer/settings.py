@@ -120,6 +120,108 @@ STATICFILES_DIRS = [
 ]
 SESSION_ENGINE = 'django.contrib.sessions.backends.db'
 
+# Compiled binaries and gcc diagnostics, keyed by a hash of source, compiler and flags
+COMPILE_CACHE_DIR = os.path.join(BASE_DIR, '.compile_cache')
+COMPILE_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# libclang translation units kept parsed in memory per process (LRU beyond this).
+CLANG_TU_CACHE_SIZE = 32
+
+# Bounded pool for gcc and user program runs (None = one worker per CPU).
+# Submissions beyond the queue size get a 503 with Retry-After.
+BUILD_WORKERS = None
+BUILD_QUEUE_SIZE = 32
+
+# Limits for submitted programs, both /run_code/ and debugged ones (0 = unlimited).
+# WALL_TIME is per run for /run_code/ and per step while debugging. NPROC is
+# counted per user, so MAX_PROCESSES includes every process of the user the
+# server runs as (and does not apply to root).
+SANDBOX_WALL_TIME = 5
+SANDBOX_CPU_TIME = 2
+SANDBOX_MEMORY_BYTES = 256 * 1024 * 1024
+SANDBOX_MAX_PROCESSES = 256
+SANDBOX_MAX_OUTPUT_BYTES = 1024 * 1024
+
+# "mi" drives gdb through its machine interface over pipes; "console" is the
+# original wexpect-based backend (Windows only).
+GDB_BACKEND = 'mi'
+GDB_PATH = 'gdb'
+GDB_TIMEOUT = 10
+# Steps recorded by the record-once "trace" mode before it stops the program
+TRACE_STEP_LIMIT = 1000
+
+# Idle, pre-initialised gdb processes kept ready for new MI sessions; each is
+# retired after GDB_POOL_MAX_USES sessions. GDB_POOL_PREWARM starts filling
+# the pool when the app loads instead of on the first session.
+GDB_POOL_SIZE = 2
+GDB_POOL_MAX_USES = 20
+GDB_POOL_PREWARM = False
+
+# Debugging sessions idle for longer than this many seconds are stopped by a
+# background reaper; the caps stop the least recently used session.
+DEBUG_SESSION_IDLE_TIMEOUT = 600
+DEBUG_SESSION_MAX = 50
+DEBUG_SESSION_MAX_PER_USER = 2
+DEBUG_SESSION_REAP_INTERVAL = 30
+# Count anonymous users' sessions per IP address rather than per browser
+# session. Only for deployments where every user has an address of their own.
+DEBUG_SESSION_OWNER_BY_IP = False
+
+# Steps, rewinds, reads and teardown of one session take turns on its lock;
+# a request that waited this many seconds for it gives up as busy.
+DEBUG_SESSION_LOCK_TIMEOUT = 60
+
+# Unix socket paths of session broker shards (`manage.py run_session_broker`).
+# Empty keeps sessions inside the web process, which then must be the only worker.
+DEBUG_SESSION_BROKER_SOCKETS = []
+DEBUG_SESSION_BROKER_TIMEOUT = 30
+
+# Step history per session: a full memory_state every KEYFRAME_INTERVAL steps,
+# deltas in between, and the oldest steps dropped beyond MAX_STEPS.
+DEBUG_HISTORY_KEYFRAME_INTERVAL = 16
+DEBUG_HISTORY_MAX_STEPS = 10000
+
+# Reverse stepping: fork a gdb checkpoint of the program every INTERVAL steps
+# (0 disables), keeping at most MAX of them per session.
+DEBUG_CHECKPOINT_INTERVAL = 25
+DEBUG_CHECKPOINT_MAX = 20
+
+# Arrays bigger than SUMMARY_BYTES are sent with each step as a summary: type,
+# length, base address and their first PREVIEW elements. /array_elements/
+# reads other ranges from the stopped program, at most PAGE_MAX per request.
+DEBUG_ARRAY_SUMMARY_BYTES = 4096
+DEBUG_ARRAY_PREVIEW = 16
+DEBUG_ARRAY_PAGE_MAX = 4096
+
+# Bulk frame reads (mi mode): locals of plain data types are not formatted by
+# gdb but decoded from their declarations' layouts, after one read of the
+# frame's memory (ranges less than READ_GAP apart are read together). DIRECT
+# reads go straight to /proc/<pid>/mem, falling back to gdb where it cannot
+# be opened. /memory_dump/ returns at most DUMP_MAX bytes.
+DEBUG_BULK_FRAME_READS = True
+DEBUG_DIRECT_MEMORY_READS = True
+DEBUG_MEMORY_READ_GAP = 4096
+DEBUG_MEMORY_DUMP_MAX = 4096
+
+# Heap tracking (mi mode): debugged programs get an allocator shim preloaded
+# that logs malloc/free into a shared ring of RING_EVENTS events, drained at
+# every stop. Steps carry the MAX_BLOCKS lowest live blocks plus totals.
+DEBUG_HEAP_TRACKING = True
+DEBUG_HEAP_RING_EVENTS = 65536
+DEBUG_HEAP_MAX_BLOCKS = 256
+
+# Steps carry the call stack, at most BACKTRACE_MAX frames. Outer frames'
+# locals are read only when /frame_locals/ asks for them, and reused (mi mode)
+# until their memory changes.
+DEBUG_BACKTRACE_MAX = 64
+
+# Step streams (/stream_steps/): unacknowledged events allowed in flight, the
+# fastest play rate in steps per second, and how long a client may hold a full
+# window before the stream gives up on it.
+DEBUG_STREAM_WINDOW = 4
+DEBUG_STREAM_MAX_RATE = 50
+DEBUG_STREAM_ACK_TIMEOUT = 30
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
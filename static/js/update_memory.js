@@ -2,6 +2,15 @@ let currentLine = null;
 let memoryData = [];
 let debuggingSessionStarted = false; // Track if the session has started
 let highlightedLine = null; /// Track if the session has started
+let currentMemoryState = {}; // Memory state as of the last applied step
+let lastSeq = null; // Sequence number of that step
+let stepStream = null; // EventSource while playing or running to the end
+let loadedElements = {}; // Pages of summarized arrays fetched at the current step, by variable
+let currentHeap = null; // Live heap blocks at the current step, when the server tracks them
+let currentBacktrace = []; // Call stack at the current step, innermost frame first
+const ELEMENT_PAGE_SIZE = 64;
+// Buttons that step the session themselves; the server would only make them wait for the stream's steps
+const MANUAL_STEP_BUTTONS = ["back-button", "next-button", "step-into-btn", "step-out-btn"];
 const variablePositions = {};
 const variableAddressMap = {};
 
@@ -38,8 +47,22 @@ async function updateMemoryVisualization(memoryState, functionName) {
         }
     });
 
-    Object.entries(memoryState).forEach(([variable, [value, address, type]]) => {
-        if (typeof value === "string" && value.startsWith("{")) {
+    Object.entries(memoryState).forEach(([variable, [value, address, type, size, tree]]) => {
+        let cells = null;
+        if (tree && (tree.kind === "array" || tree.kind === "struct")) {
+            cells = treeCells(tree);
+            if (tree.lazy) {
+                // Only a preview came with the step: add the fetched pages and a cell to fetch more
+                const loaded = loadedElements[variable] || [];
+                cells.push(...treeCells({ ...tree, elements: loaded }));
+                const shown = tree.elements.length + loaded.length;
+                if (shown < tree.length) {
+                    cells.push({ text: `+${tree.length - shown}`, address: "", more: shown });
+                }
+            }
+            value = cells.map(cell => cell.text);
+            address = cells.map(cell => cell.address);
+        } else if (typeof value === "string" && value.startsWith("{")) {
             value = value.replace(/[{}]/g, "").split(",").map(v => v.trim());
         }
 
@@ -58,13 +81,18 @@ async function updateMemoryVisualization(memoryState, functionName) {
 
             value.forEach((val, idx) => {
                 const x = arrayStartX + idx * (blockWidth + padding);
-                svg.append("rect")
+                const rect = svg.append("rect")
                     .attr("x", x)
                     .attr("y", arrayStartY)
                     .attr("width", blockWidth)
                     .attr("height", blockHeight)
                     .attr("fill", "#e8f5e9")
                     .attr("stroke", "#388e3c");
+                if (cells && cells[idx].more !== undefined) {
+                    rect.attr("fill", "#fff8e1")
+                        .style("cursor", "pointer")
+                        .on("click", () => loadMoreElements(variable, cells[idx].more, functionName));
+                }
                 svg.append("text")
                     .attr("x", x + blockWidth / 2)
                     .attr("y", arrayStartY + blockHeight / 2 + 5)
@@ -117,7 +145,111 @@ async function updateMemoryVisualization(memoryState, functionName) {
             currentY += blockHeight + padding;
         }
     });
+
+    if (currentHeap) {
+        drawHeap(svg, currentHeap, currentY, blockHeight, blockWidth, padding);
+    }
+}
+
+// One cell per live heap block (size above, address below), after the variables
+function drawHeap(svg, heap, y, blockHeight, blockWidth, padding) {
+    const lost = heap.lost ? `, ${heap.lost} events lost` : "";
+    svg.append("text")
+        .attr("x", 50)
+        .attr("y", y + 15)
+        .text(`Heap: ${heap.count} blocks, ${heap.bytes} bytes (${heap.allocations} allocs, ${heap.frees} frees${lost})`)
+        .attr("font-size", "14px")
+        .attr("font-family", "monospace")
+        .attr("font-weight", "bold")
+        .attr("text-anchor", "start");
+    const cellY = y + 30;
+    heap.blocks.forEach((block, idx) => {
+        const x = 100 + idx * (blockWidth + padding);
+        svg.append("rect")
+            .attr("x", x)
+            .attr("y", cellY)
+            .attr("width", blockWidth)
+            .attr("height", blockHeight)
+            .attr("fill", "#fce4ec")
+            .attr("stroke", "#c2185b");
+        svg.append("text")
+            .attr("x", x + blockWidth / 2)
+            .attr("y", cellY + blockHeight / 2 + 5)
+            .text(`${block.size} B`)
+            .attr("font-size", "14px")
+            .attr("font-family", "monospace")
+            .attr("text-anchor", "middle");
+        svg.append("text")
+            .attr("x", x + blockWidth / 2)
+            .attr("y", cellY + blockHeight + 15)
+            .text(block.address)
+            .attr("font-size", "12px")
+            .attr("font-family", "monospace")
+            .attr("text-anchor", "middle");
+    });
+    if (heap.count > heap.blocks.length) {
+        svg.append("text")
+            .attr("x", 100 + heap.blocks.length * (blockWidth + padding))
+            .attr("y", cellY + blockHeight / 2 + 5)
+            .text(`+${heap.count - heap.blocks.length}`)
+            .attr("font-size", "14px")
+            .attr("font-family", "monospace")
+            .attr("text-anchor", "start");
+    }
 }
+// Fetches the next page of a summarized array from the stopped program and redraws
+async function loadMoreElements(variable, start, functionName) {
+    try {
+        const response = await fetch('/array_elements/', {
+            method: 'POST',
+            headers: {
+                'X-CSRFToken': csrfToken,
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({ variable: variable, start: start, count: ELEMENT_PAGE_SIZE })
+        });
+        const data = await response.json();
+        if (data.error) {
+            console.error("Error loading elements:", data.error);
+            return;
+        }
+        loadedElements[variable] = (loadedElements[variable] || []).concat(data.elements);
+        updateMemoryVisualization(currentMemoryState, functionName);
+    } catch (error) {
+        console.error("Error loading elements:", error);
+    }
+}
+
+// One cell per element or member of a parsed gdb value, with its address.
+// Runs (<repeats N times>) are expanded using the array's stride; nested
+// aggregates are shown as one cell holding their text.
+function treeCells(tree) {
+    const cells = [];
+    const text = node => {
+        if (node.kind === "array") return `{${node.elements.map(text).join(", ")}${node.truncated ? "..." : ""}}`;
+        if (node.kind === "struct") return `{${Object.entries(node.fields).map(([name, field]) => `${name} = ${text(field)}`).join(", ")}}`;
+        if (node.kind === "char") return `'${node.char}'`;
+        if (node.kind === "pointer" && node.symbol) return `${node.value} <${node.symbol}>`;
+        return String(node.value);
+    };
+    if (tree.kind === "struct") {
+        Object.entries(tree.fields).forEach(([name, field]) => {
+            cells.push({ text: `${name}: ${text(field)}`, address: field.address || "" });
+        });
+        return cells;
+    }
+    tree.elements.forEach(element => {
+        const start = element.address ? parseInt(element.address, 16) : null;
+        for (let i = 0; i < (element.repeat || 1); i++) {
+            cells.push({
+                text: text(element),
+                address: start !== null && tree.stride ? "0x" + (start + i * tree.stride).toString(16) : (element.address || "")
+            });
+        }
+    });
+    return cells;
+}
+
 function showLoadingInSvg() {
     const svg = d3.select("#memory-svg");
 
@@ -182,6 +314,121 @@ function hideLoadingInSvg() {
     svg.selectAll("*").remove();
 }
 
+// Fetches a hexdump of the current frame and shows it below the diagram,
+// with the bytes of each local highlighted and named in a tooltip
+async function showMemoryDump() {
+    if (!debuggingSessionStarted) {
+        alert("Please start debugging before viewing memory.");
+        return;
+    }
+    try {
+        const response = await fetch('/memory_dump/', {
+            method: 'POST',
+            headers: {
+                'X-CSRFToken': csrfToken,
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({})
+        });
+        const data = await response.json();
+        const dump = document.getElementById("memory-dump");
+        dump.hidden = false;
+        if (data.error) {
+            dump.textContent = data.error;
+            return;
+        }
+        const owners = {};
+        data.variables.forEach(variable => {
+            const start = parseInt(variable.address, 16);
+            for (let offset = 0; offset < variable.size; offset++) {
+                owners[start + offset] = variable.name;
+            }
+        });
+        dump.textContent = "";
+        data.rows.forEach(row => {
+            const line = document.createElement("div");
+            line.appendChild(document.createTextNode(`${row.address}  `));
+            const rowStart = parseInt(row.address, 16);
+            row.hex.split(" ").forEach((byte, idx) => {
+                const cell = document.createElement("span");
+                cell.textContent = byte + " ";
+                const owner = owners[rowStart + idx];
+                if (owner) {
+                    cell.className = "dump-variable";
+                    cell.title = owner;
+                }
+                line.appendChild(cell);
+            });
+            line.appendChild(document.createTextNode(` ${row.ascii}`));
+            dump.appendChild(line);
+        });
+    } catch (error) {
+        console.error("Error loading memory dump:", error);
+    }
+}
+
+// Lists the call stack below the diagram; clicking an outer frame shows its locals
+function drawCallStack(backtrace) {
+    currentBacktrace = backtrace || [];
+    const stack = document.getElementById("call-stack");
+    stack.textContent = "";
+    stack.hidden = currentBacktrace.length === 0;
+    currentBacktrace.forEach(frame => {
+        const item = document.createElement("li");
+        item.textContent = `${frame.function} (line ${frame.line})`;
+        if (frame.level === 0) {
+            item.className = "current-frame";
+        } else {
+            item.addEventListener("click", () => showFrameLocals(frame.level));
+        }
+        stack.appendChild(item);
+    });
+    document.getElementById("frame-locals").hidden = true; // It showed the previous step's frame
+}
+
+// Fetches the locals of an outer frame, which steps leave out
+async function showFrameLocals(level) {
+    try {
+        const response = await fetch('/frame_locals/', {
+            method: 'POST',
+            headers: {
+                'X-CSRFToken': csrfToken,
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({ level: level })
+        });
+        const data = await response.json();
+        const locals = document.getElementById("frame-locals");
+        locals.hidden = false;
+        if (data.error) {
+            locals.textContent = data.error;
+            return;
+        }
+        const lines = Object.entries(data.memory_state).map(([name, entry]) => `${name} = ${entry[0]}`);
+        locals.textContent = `${data.function} (line ${data.line})\n` + lines.join("\n");
+    } catch (error) {
+        console.error("Error loading frame locals:", error);
+    }
+}
+
+// Applies a step_forward response, either a full memory_state or a memory_delta
+function applyStepResponse(data) {
+    if (data.memory_delta) {
+        const state = { ...currentMemoryState };
+        data.memory_delta.removed.forEach(name => delete state[name]);
+        Object.assign(state, data.memory_delta.added, data.memory_delta.changed);
+        currentMemoryState = state;
+    } else {
+        currentMemoryState = data.memory_state || {};
+    }
+    lastSeq = data.seq;
+    currentHeap = data.heap || null;
+    loadedElements = {}; // Pages were read at the previous step
+    drawCallStack(data.backtrace);
+    document.getElementById("memory-dump").hidden = true; // It showed the previous step's memory
+    return currentMemoryState;
+}
+
 document.addEventListener("DOMContentLoaded", () => {
     async function startDebugging() {
         showLoadingInSvg();
@@ -218,6 +465,11 @@ document.addEventListener("DOMContentLoaded", () => {
                 return;
             }
     
+            currentMemoryState = memoryState;
+            lastSeq = data.seq;
+            currentHeap = data.heap || null;
+            loadedElements = {};
+            drawCallStack(data.backtrace);
             debuggingSessionStarted = true; // Mark debugging session as started
             console.log("Debugging session started");
     
@@ -250,6 +502,10 @@ document.addEventListener("DOMContentLoaded", () => {
                 throw new Error(`HTTP error! status: ${response.status}`);
             }
 
+            if (stepStream) {
+                stepStream.close();
+                setStreaming(null);
+            }
             debuggingSessionStarted = false; // Reset debugging session flag
             console.log("Debugging session stopped");
             alert("Debugging session has been stopped.");
@@ -258,7 +514,9 @@ document.addEventListener("DOMContentLoaded", () => {
         }
     }
 
-    async function stepForward() {
+    // Steps forward (or, with '/step_back/', back through the recorded history);
+    // kind is "over", "into" or "out" of the current function
+    async function stepForward(url = '/step_forward/', kind = 'over') {
         try {
             // Start debugging session if not already started
             if (!debuggingSessionStarted) {
@@ -266,13 +524,14 @@ document.addEventListener("DOMContentLoaded", () => {
                 return; // Exit the function early
             }
 
-            const response = await fetch('/step_forward/', {
+            const response = await fetch(url, {
                 method: 'POST',
                 headers: {
                     'X-CSRFToken': csrfToken, // Add CSRF token to the header
                     'Content-Type': 'application/json',
                 },
-                body: JSON.stringify({}) // Request body (you can pass data if needed)
+                // Only changed variables are sent back while our seq is in sync
+                body: JSON.stringify({ delta: true, seq: lastSeq, kind: kind })
             });
 
             if (!response.ok) {
@@ -285,7 +544,7 @@ document.addEventListener("DOMContentLoaded", () => {
                 return;
             }
 
-            const memoryState = data.memory_state;
+            const memoryState = applyStepResponse(data);
             const functionName = data.function_name;
             updateMemoryVisualization(memoryState, functionName);
 
@@ -294,6 +553,51 @@ document.addEventListener("DOMContentLoaded", () => {
             console.error("Error in stepForward:", error);
         }
     }
+    function setStreaming(stream) {
+        stepStream = stream;
+        MANUAL_STEP_BUTTONS.forEach(id => { document.getElementById(id).disabled = stream !== null; });
+    }
+
+    // Lets the server step the session, at `rate` steps per second ("play") or to the end ("run")
+    function streamSteps(mode, rate = 2) {
+        if (!debuggingSessionStarted) {
+            alert("Please start debugging before playing.");
+            return;
+        }
+        if (stepStream) {
+            stepStream.close();
+        }
+
+        const stream = new EventSource(`/stream_steps/?mode=${mode}&rate=${rate}`);
+        setStreaming(stream);
+        stream.addEventListener("step", (event) => {
+            const data = JSON.parse(event.data);
+            if (data.error) {
+                console.error(data.error);
+                return;
+            }
+            updateMemoryVisualization(applyStepResponse(data), data.function_name);
+
+            // Acknowledge the rendered frame so the server sends the next one
+            fetch('/stream_ack/', {
+                method: 'POST',
+                headers: {
+                    'X-CSRFToken': csrfToken,
+                    'Content-Type': 'application/json',
+                },
+                body: JSON.stringify({ id: Number(event.lastEventId) })
+            }).catch(error => console.error("Error in stream ack:", error));
+        });
+        const finish = () => {
+            stream.close();
+            if (stepStream === stream) {
+                setStreaming(null);
+            }
+        };
+        stream.addEventListener("end", finish);
+        stream.addEventListener("error", finish); // Instead of reconnecting, which would start stepping again
+    }
+
     function updateVisualization() {
         // Validate editor instance
         if (!editor) {
@@ -328,9 +632,15 @@ document.addEventListener("DOMContentLoaded", () => {
     
 
     // Event listeners for the buttons
-    document.getElementById("next-button").addEventListener("click", stepForward);
+    document.getElementById("next-button").addEventListener("click", () => stepForward('/step_forward/'));
+    document.getElementById("back-button").addEventListener("click", () => stepForward('/step_back/'));
+    document.getElementById("step-into-btn").addEventListener("click", () => stepForward('/step_forward/', 'into'));
+    document.getElementById("step-out-btn").addEventListener("click", () => stepForward('/step_forward/', 'out'));
     document.getElementById("start-btn").addEventListener("click", startDebugging);
     document.getElementById("stop-btn").addEventListener("click", stopDebugging);
+    document.getElementById("play-btn").addEventListener("click", () => streamSteps('play'));
+    document.getElementById("run-btn").addEventListener("click", () => streamSteps('run'));
+    document.getElementById("memory-dump-btn").addEventListener("click", showMemoryDump);
 });
 // Function to visualize memory
 function visualizeMemoryLine(memoryData, functionName) {
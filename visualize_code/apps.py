@@ -1,6 +1,12 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class VisualizeCodeConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "visualize_code"
+
+    def ready(self):
+        if getattr(settings, 'GDB_POOL_PREWARM', False):
+            from .helpers.gdb_pool import get_gdb_pool
+            get_gdb_pool().fill_async()
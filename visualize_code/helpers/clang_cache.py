@@ -0,0 +1,141 @@
+from clang.cindex import Index, TranslationUnit
+from django.conf import settings
+from collections import OrderedDict
+from contextlib import contextmanager
+import functools
+import hashlib
+import os
+import subprocess
+import threading
+
+DEFAULT_ARGS = ('-std=c11',)
+# Keeps the parsed #include prefix around so a reparse only redoes the rest of the file
+PARSE_OPTIONS = TranslationUnit.PARSE_PRECOMPILED_PREAMBLE
+
+
+@functools.lru_cache(maxsize=None)
+def system_include_args(compiler='gcc'):
+    """
+    -isystem for the compiler's own header directory (stddef.h, stdarg.h, ...).
+    The libclang wheel ships without one, so whole programs that include
+    <stdio.h> would otherwise stop at a missing header.
+    """
+    try:
+        result = subprocess.run([compiler, '-print-file-name=include'], capture_output=True, text=True)
+    except OSError:
+        return ()
+    directory = result.stdout.strip()
+    return ('-isystem', directory) if os.path.isdir(directory) else ()
+
+
+class TranslationUnitCache:
+    """
+    libclang translation units kept in memory, keyed on a sha256 of the file
+    name, clang arguments and source text.
+
+    One Index is created per cache and lives as long as the process. Asking
+    for source that was parsed before returns the same TranslationUnit. A
+    caller that passes a session_key (e.g. a debugging session id) gets its
+    previous unit reparsed in place with the new text as an unsaved file,
+    which reuses the precompiled preamble instead of starting from scratch.
+
+    libclang units are not safe to use from several threads at once, so the
+    unit is only handed out inside translation_unit(), which holds the cache
+    lock until the caller is done with it.
+    """
+
+    def __init__(self, max_entries=32, index=None):
+        self.max_entries = max(1, max_entries)
+        self.index = index or Index.create()
+        self.hits = 0
+        self.parses = 0
+        self.reparses = 0
+        self.evictions = 0
+        self._units = OrderedDict()  # key -> TranslationUnit, least recently used first
+        self._sessions = OrderedDict()  # session_key -> (key, filename, args) of its latest unit
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def make_key(code, filename, args):
+        digest = hashlib.sha256()
+        for part in (filename, *args, code):
+            digest.update(part.encode('utf-8'))
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    @contextmanager
+    def translation_unit(self, code, filename='example.c', args=DEFAULT_ARGS, session_key=None):
+        """
+        Yields the TranslationUnit for code, parsing or reparsing it if needed.
+
+        Args:
+            code (str): The source text, passed to clang as an unsaved file.
+            filename (str): The name the source is parsed under.
+            args (tuple): clang command-line arguments.
+            session_key (str): Optional key of an editing session whose previous
+                unit may be reparsed instead of parsing from scratch.
+        """
+        with self._lock:
+            yield self._get(code, filename, tuple(args), session_key)
+
+    def _get(self, code, filename, args, session_key):
+        key = self.make_key(code, filename, args)
+        unit = self._units.get(key)
+        if unit is not None:
+            self._units.move_to_end(key)
+            self.hits += 1
+        else:
+            previous = self._reparsable(session_key, filename, args)
+            if previous is not None:
+                unit = self._units.pop(previous)
+                unit.reparse(unsaved_files=[(filename, code)], options=PARSE_OPTIONS)
+                self.reparses += 1
+            else:
+                unit = self.index.parse(filename, args=list(args), unsaved_files=[(filename, code)], options=PARSE_OPTIONS)
+                self.parses += 1
+            self._units[key] = unit
+            while len(self._units) > self.max_entries:
+                self._units.popitem(last=False)
+                self.evictions += 1
+
+        if session_key is not None:
+            self._sessions[session_key] = (key, filename, args)
+            self._sessions.move_to_end(session_key)
+            while len(self._sessions) > self.max_entries:
+                self._sessions.popitem(last=False)
+        return unit
+
+    def _reparsable(self, session_key, filename, args):
+        """Key of the session's previous unit if it can be rewritten in place, else None."""
+        if session_key not in self._sessions:
+            return None
+        previous, previous_filename, previous_args = self._sessions[session_key]
+        if previous not in self._units or (previous_filename, previous_args) != (filename, args):
+            return None
+        # Another session still looking at the same unit keeps it as it is
+        shared = sum(1 for other in self._sessions.values() if other[0] == previous)
+        return previous if shared == 1 else None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "parses": self.parses,
+                "reparses": self.reparses,
+                "evictions": self.evictions,
+                "entries": len(self._units),
+                "max_entries": self.max_entries,
+            }
+
+
+_translation_unit_cache = None
+_translation_unit_cache_lock = threading.Lock()
+
+
+def get_translation_unit_cache():
+    """Return the process-wide TranslationUnitCache configured from settings."""
+    global _translation_unit_cache
+    with _translation_unit_cache_lock:
+        if _translation_unit_cache is None:
+            _translation_unit_cache = TranslationUnitCache(getattr(settings, 'CLANG_TU_CACHE_SIZE', 32))
+        return _translation_unit_cache
@@ -0,0 +1,311 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from collections import namedtuple
+import asyncio
+import functools
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process locking only
+    fcntl = None
+
+DEFAULT_FLAGS = ('-g',)
+
+CompileResult = namedtuple('CompileResult', ['returncode', 'stderr', 'cached'])
+
+
+@functools.lru_cache(maxsize=None)
+def compiler_version(compiler='gcc'):
+    """Return the compiler's version banner, used as part of the cache key."""
+    try:
+        result = subprocess.run([compiler, '--version'], capture_output=True, text=True)
+        return result.stdout.strip()
+    except OSError:
+        return compiler
+
+
+class CompileCache:
+    """
+    On-disk, content-addressed cache of gcc results.
+
+    Each entry lives in its own directory named after the sha256 of the
+    compiler version, flags, source file name and source text, and holds
+    the compiled binary (when compilation succeeded) plus a meta.json with
+    the return code and compiler diagnostics.
+
+    Entries are built in a private scratch directory and published with an
+    atomic rename, so concurrent workers never observe a half-written entry.
+    The mtime of meta.json is bumped on every hit and eviction removes the
+    least recently used entries until the cache fits in max_bytes.
+    """
+
+    def __init__(self, cache_dir, max_bytes, compiler='gcc'):
+        self.cache_dir = str(cache_dir)
+        self.max_bytes = max_bytes
+        self.compiler = compiler
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._stats_lock = threading.Lock()
+        # Striped per-key locks: identical concurrent submissions compile once
+        self._key_locks = [threading.Lock() for _ in range(64)]
+        self._inflight = {}  # (event loop, key) -> Future of an acompile build
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def make_key(self, c_code, source_name, flags):
+        digest = hashlib.sha256()
+        for part in (compiler_version(self.compiler), source_name, *flags, c_code):
+            digest.update(part.encode('utf-8'))
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    def compile(self, c_code, output_path, source_name='tempfile.c', flags=DEFAULT_FLAGS):
+        """
+        Compile c_code into output_path, reusing a cached build when possible.
+
+        Args:
+            c_code (str): The C source to compile.
+            output_path (str): Where the executable should be written.
+            source_name (str): File name gcc sees; it shows up in diagnostics.
+            flags (tuple): Extra gcc flags, part of the cache key.
+
+        Returns:
+            CompileResult: returncode and stderr as gcc reported them, and
+            whether the result came from the cache.
+        """
+        key = self.make_key(c_code, source_name, flags)
+        with self._lock_for(key):
+            result = self._lookup(key, output_path)
+            if result is not None:
+                self._count('hits')
+                return result
+
+            self._count('misses')
+            result = self._build(key, c_code, output_path, source_name, flags)
+
+        self.evict()
+        return result
+
+    async def acompile(self, c_code, output_path, source_name='tempfile.c', flags=DEFAULT_FLAGS):
+        """
+        Same as compile(), but runs gcc as an asyncio subprocess, so a miss
+        only costs the event loop a pipe read. Identical submissions awaited
+        concurrently on the same event loop compile once. Everything that
+        blocks runs on a thread: the key (whose first computation runs
+        `gcc --version`), lookups and publishing (file copies), and eviction
+        (a flock and a scan of the cache directory).
+        """
+        key = await sync_to_async(self.make_key, thread_sensitive=False)(c_code, source_name, flags)
+        lookup = sync_to_async(self._lookup, thread_sensitive=False)
+        result = await lookup(key, output_path)
+        if result is not None:
+            self._count('hits')
+            return result
+
+        loop = asyncio.get_running_loop()
+        inflight = self._inflight.get((loop, key))
+        if inflight is not None:
+            await asyncio.shield(inflight)
+            result = await lookup(key, output_path)
+            if result is not None:
+                self._count('hits')
+                return result
+
+        self._count('misses')
+        future = self._inflight[(loop, key)] = loop.create_future()
+        try:
+            result = await self._abuild(key, c_code, output_path, source_name, flags)
+        finally:
+            del self._inflight[(loop, key)]
+            future.set_result(None)
+
+        await sync_to_async(self.evict, thread_sensitive=False)()
+        return result
+
+    def stats(self):
+        entries, total_bytes = 0, 0
+        for _, _, size in self._entries():
+            entries += 1
+            total_bytes += size
+        with self._stats_lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": entries,
+                "bytes": total_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+    def evict(self):
+        """Drop least recently used entries until the cache fits in max_bytes."""
+        with self._global_lock():
+            entries = sorted(self._entries(), key=lambda entry: entry[1])
+            total_bytes = sum(size for _, _, size in entries)
+            for path, _, size in entries:
+                if total_bytes <= self.max_bytes:
+                    break
+                # Rename first so readers see a clean miss instead of a partial entry
+                doomed = f"{path}.evicting-{uuid.uuid4().hex}"
+                try:
+                    os.rename(path, doomed)
+                except OSError:
+                    continue
+                shutil.rmtree(doomed, ignore_errors=True)
+                total_bytes -= size
+                self._count('evictions')
+
+    def _lookup(self, key, output_path):
+        entry_dir = os.path.join(self.cache_dir, key)
+        meta_path = os.path.join(entry_dir, 'meta.json')
+        try:
+            with open(meta_path) as file:
+                meta = json.load(file)
+            if meta['returncode'] == 0:
+                shutil.copy2(os.path.join(entry_dir, 'binary'), output_path)
+            os.utime(meta_path)
+        except (OSError, ValueError, KeyError):
+            # Missing, evicted under our feet or corrupt: treat as a miss
+            return None
+        return CompileResult(meta['returncode'], meta['stderr'], True)
+
+    def _build(self, key, c_code, output_path, source_name, flags):
+        build_dir = self._prepare_build(key, c_code, source_name)
+        try:
+            compile_result = subprocess.run(
+                self._gcc_command(build_dir, source_name, flags),
+                capture_output=True, text=True, cwd=build_dir
+            )
+            return self._publish(key, build_dir, output_path, source_name,
+                                 compile_result.returncode, compile_result.stderr)
+        finally:
+            shutil.rmtree(build_dir, ignore_errors=True)
+
+    async def _abuild(self, key, c_code, output_path, source_name, flags):
+        build_dir = await sync_to_async(self._prepare_build, thread_sensitive=False)(key, c_code, source_name)
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *self._gcc_command(build_dir, source_name, flags),
+                stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE, cwd=build_dir,
+            )
+            _, stderr = await process.communicate()
+            return await sync_to_async(self._publish, thread_sensitive=False)(
+                key, build_dir, output_path, source_name, process.returncode, stderr.decode('utf-8', errors='replace'))
+        finally:
+            await sync_to_async(shutil.rmtree, thread_sensitive=False)(build_dir, ignore_errors=True)
+
+    def _prepare_build(self, key, c_code, source_name):
+        build_dir = tempfile.mkdtemp(prefix=f"{key}.building-", dir=self.cache_dir)
+        with open(os.path.join(build_dir, source_name), 'w') as file:
+            file.write(c_code)
+        return build_dir
+
+    def _gcc_command(self, build_dir, source_name, flags):
+        # Map the scratch directory to "." so the debug info stays valid
+        # wherever the binary is copied to.
+        return [self.compiler, *flags, f'-fdebug-prefix-map={build_dir}=.', source_name, '-o', 'binary']
+
+    def _publish(self, key, build_dir, output_path, source_name, returncode, stderr):
+        os.remove(os.path.join(build_dir, source_name))
+        if returncode == 0:
+            shutil.copy2(os.path.join(build_dir, 'binary'), output_path)
+        with open(os.path.join(build_dir, 'meta.json'), 'w') as file:
+            json.dump({
+                "returncode": returncode,
+                "stderr": stderr,
+                "created": time.time(),
+            }, file)
+
+        try:
+            os.rename(build_dir, os.path.join(self.cache_dir, key))
+        except OSError:
+            pass  # Another worker published the same entry first
+
+        return CompileResult(returncode, stderr, False)
+
+    def _entries(self):
+        """Yield (path, last_used, size_in_bytes) for every published entry."""
+        try:
+            names = os.listdir(self.cache_dir)
+        except OSError:
+            return
+        for name in names:
+            if len(name) != 64:  # Skip the lock file and in-flight build/evict dirs
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                last_used = os.stat(os.path.join(path, 'meta.json')).st_mtime
+                size = sum(entry.stat().st_size for entry in os.scandir(path))
+            except OSError:
+                continue
+            yield path, last_used, size
+
+    def _lock_for(self, key):
+        return self._key_locks[int(key[:8], 16) % len(self._key_locks)]
+
+    def _global_lock(self):
+        return _FileLock(os.path.join(self.cache_dir, '.lock'))
+
+    def _count(self, counter):
+        with self._stats_lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+
+class _FileLock:
+    """Exclusive lock shared by every worker process using the same cache directory."""
+
+    _thread_lock = threading.Lock()
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        if fcntl is not None:
+            self.file = open(self.path, 'a')
+            fcntl.flock(self.file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.file is not None:
+            fcntl.flock(self.file, fcntl.LOCK_UN)
+            self.file.close()
+            self.file = None
+        self._thread_lock.release()
+
+
+_compile_cache = None
+_compile_cache_lock = threading.Lock()
+
+
+def get_compile_cache():
+    """Return the process-wide CompileCache configured from settings."""
+    global _compile_cache
+    cache_dir = str(getattr(settings, 'COMPILE_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'c_code_visualizer_cache')))
+    with _compile_cache_lock:
+        if _compile_cache is None or _compile_cache.cache_dir != cache_dir:
+            _compile_cache = CompileCache(
+                cache_dir,
+                getattr(settings, 'COMPILE_CACHE_MAX_BYTES', 256 * 1024 * 1024),
+            )
+        return _compile_cache
+
+
+def compile_c_code(c_code, output_path, source_name='tempfile.c', flags=DEFAULT_FLAGS):
+    """Compile c_code through the shared compile cache."""
+    return get_compile_cache().compile(c_code, output_path, source_name, flags)
+
+
+async def acompile_c_code(c_code, output_path, source_name='tempfile.c', flags=DEFAULT_FLAGS):
+    """Async counterpart of compile_c_code."""
+    return await get_compile_cache().acompile(c_code, output_path, source_name, flags)
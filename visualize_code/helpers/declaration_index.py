@@ -0,0 +1,210 @@
+from clang.cindex import CursorKind, TypeKind
+from django.conf import settings
+from collections import OrderedDict, namedtuple
+from .clang_cache import DEFAULT_ARGS, TranslationUnitCache, get_translation_unit_cache, system_include_args
+import threading
+
+PROGRAM_FILE = 'test_temp.c'
+
+# Cursors that open a new block scope for the declarations inside them
+SCOPE_KINDS = {CursorKind.FUNCTION_DECL, CursorKind.COMPOUND_STMT, CursorKind.FOR_STMT}
+
+Declaration = namedtuple('Declaration', [
+    'name',           # Identifier
+    'kind',           # "global", "parameter" or "local"
+    'function',       # Enclosing function, None for globals
+    'line',           # Line of the declaration
+    'scope',          # (first line, last line) of the enclosing block
+    'type',           # Type spelling, e.g. "int[3]"
+    'size',           # sizeof in bytes, None if incomplete
+    'element_type',   # Array element type spelling, None for non-arrays
+    'element_size',   # sizeof one element, None for non-arrays
+    'element_count',  # Array extent, None for non-arrays
+    'initializer',    # Source text of the initializer, a (nested) list for brace lists, or None
+    'layout',         # {"size", "count"?, "element"?, "fields"?} for gdb_values.attach_addresses
+])
+
+# Nesting followed by type_layout; deeper members are left without addresses
+LAYOUT_DEPTH = 8
+
+
+class DeclarationIndex:
+    """
+    Every variable declared in one program (globals, parameters and block
+    locals), found in a single walk of its clang translation unit.
+
+    Lookups by (function, name) are dictionary hits; only declarations that
+    shadow each other in nested blocks of the same function share a bucket,
+    and those are told apart by line.
+    """
+
+    def __init__(self, declarations):
+        self.declarations = declarations
+        self._by_name = {}
+        for declaration in declarations:
+            self._by_name.setdefault((declaration.function, declaration.name), []).append(declaration)
+
+    def __len__(self):
+        return len(self.declarations)
+
+    def knows(self, name, function):
+        """Whether name is declared in function or globally."""
+        return (function, name) in self._by_name or (None, name) in self._by_name
+
+    def lookup(self, name, function, line=None):
+        """
+        Finds the declaration name refers to inside function.
+
+        Args:
+            name (str): Variable name.
+            function (str): Function the program is stopped in.
+            line (int): Current line; with it, only declarations whose block
+                contains the line and that come at or before it are considered.
+
+        Returns:
+            Declaration: The innermost matching declaration, else the global one, else None.
+        """
+        best = None
+        for declaration in self._by_name.get((function, name), ()):
+            if line is not None and not (declaration.line <= line and declaration.scope[0] <= line <= declaration.scope[1]):
+                continue
+            if best is None or declaration.scope[0] >= best.scope[0]:
+                best = declaration
+        if best is None:
+            globals_ = self._by_name.get((None, name))
+            best = globals_[0] if globals_ else None
+        return best
+
+
+def index_declarations(unit, code, filename=PROGRAM_FILE):
+    """Walks a translation unit once and returns the DeclarationIndex of filename's declarations."""
+    declarations = []
+    lines = code.count('\n') + 1
+    source = code.encode('utf-8')  # clang extents are byte offsets
+    # (cursor, function, scope) — iterative so deeply nested code cannot hit the recursion limit
+    stack = [(child, None, (1, lines)) for child in reversed(list(unit.cursor.get_children()))]
+    while stack:
+        cursor, function, scope = stack.pop()
+        location = cursor.location
+        if location.file is None or location.file.name != filename:
+            continue  # Declarations from #included headers
+
+        if cursor.kind == CursorKind.FUNCTION_DECL:
+            function = cursor.spelling
+        if cursor.kind in (CursorKind.VAR_DECL, CursorKind.PARM_DECL):
+            declarations.append(_declaration(cursor, function, scope, source))
+        if cursor.kind in SCOPE_KINDS:
+            scope = (cursor.extent.start.line, cursor.extent.end.line)
+        for child in reversed(list(cursor.get_children())):
+            stack.append((child, function, scope))
+    return DeclarationIndex(declarations)
+
+
+def _declaration(cursor, function, scope, source):
+    if cursor.kind == CursorKind.PARM_DECL:
+        kind = "parameter"
+    elif function is None:
+        kind = "global"
+    else:
+        kind = "local"
+
+    element_type = element_size = element_count = None
+    if cursor.type.kind == TypeKind.CONSTANTARRAY:
+        element = cursor.type.element_type
+        element_type = element.spelling
+        element_size = _size(element)
+        element_count = cursor.type.element_count
+
+    initializer = None
+    # The initializer is the last child, but only if there is an "=" (an array extent is a child too)
+    if "=" in (token.spelling for token in cursor.get_tokens()):
+        children = list(cursor.get_children())
+        if children:
+            initializer = _initializer(children[-1], source)
+
+    return Declaration(
+        name=cursor.spelling,
+        kind=kind,
+        function=function,
+        line=cursor.location.line,
+        scope=scope,
+        type=cursor.type.spelling,
+        size=_size(cursor.type),
+        element_type=element_type,
+        element_size=element_size,
+        element_count=element_count,
+        initializer=initializer,
+        layout=type_layout(cursor.type),
+    )
+
+
+def _size(clang_type):
+    size = clang_type.get_size()
+    return size if size >= 0 else None  # Negative values are libclang error codes
+
+
+def type_layout(clang_type, depth=LAYOUT_DEPTH):
+    """
+    The memory layout of a type: its size, and for arrays the extent and
+    element layout, for structs and unions every member's byte offset and layout.
+
+    Args:
+        clang_type (clang.cindex.Type): The declared type (typedefs are resolved).
+        depth (int): How many levels of arrays and members to describe.
+
+    Returns:
+        dict: {"size", "count"?, "element"?: layout, "fields"?: [{"name", "offset", "layout"}]},
+        and "type" (e.g. 'unsigned int', 'char *') for everything that is not an array or struct.
+    """
+    clang_type = clang_type.get_canonical()
+    layout = {"size": _size(clang_type)}
+    if clang_type.kind not in (TypeKind.CONSTANTARRAY, TypeKind.RECORD):
+        layout["type"] = clang_type.spelling  # Lets memory_decode decode the bytes of scalars
+    if depth <= 0:
+        return layout
+    if clang_type.kind == TypeKind.CONSTANTARRAY:
+        layout["count"] = clang_type.element_count
+        layout["element"] = type_layout(clang_type.element_type, depth - 1)
+    elif clang_type.kind == TypeKind.RECORD:
+        fields = []
+        for field in clang_type.get_fields():
+            offset = clang_type.get_offset(field.spelling) if field.spelling else -1
+            if offset < 0:
+                continue  # Anonymous members and bit-field oddities have no byte offset to give
+            fields.append({"name": field.spelling, "offset": offset // 8, "layout": type_layout(field.type, depth - 1)})
+        layout["fields"] = fields
+    return layout
+
+
+def _initializer(cursor, source):
+    if cursor.kind == CursorKind.INIT_LIST_EXPR:
+        return [_initializer(child, source) for child in cursor.get_children()]
+    return source[cursor.extent.start.offset:cursor.extent.end.offset].decode('utf-8', errors='replace').strip()
+
+
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def get_declaration_index(c_code, filename=PROGRAM_FILE, session_key=None):
+    """
+    Returns the DeclarationIndex of a submission, building it once per
+    distinct source. The translation unit comes from the shared
+    TranslationUnitCache, so an edited program of the same session_key is
+    reparsed rather than parsed from scratch.
+    """
+    args = DEFAULT_ARGS + system_include_args()
+    key = TranslationUnitCache.make_key(c_code, filename, args)
+    with _indexes_lock:
+        if key in _indexes:
+            _indexes.move_to_end(key)
+            return _indexes[key]
+
+    with get_translation_unit_cache().translation_unit(c_code, filename, args, session_key) as unit:
+        index = index_declarations(unit, c_code, filename)
+
+    with _indexes_lock:
+        _indexes[key] = index
+        while len(_indexes) > getattr(settings, 'CLANG_TU_CACHE_SIZE', 32):
+            _indexes.popitem(last=False)
+    return index
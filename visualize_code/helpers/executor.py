@@ -0,0 +1,180 @@
+from django.conf import settings
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import math
+import os
+import threading
+import time
+
+
+class ExecutorBusy(Exception):
+    """Raised when the build queue is full; retry_after is a hint in seconds."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Server busy, please retry in {retry_after} seconds.")
+        self.retry_after = retry_after
+
+
+class BuildExecutor:
+    """
+    Bounded pool for gcc and user program runs.
+
+    At most max_workers jobs run at once and at most max_queue more may wait
+    for a worker. Anything beyond that is refused immediately with
+    ExecutorBusy instead of piling more processes onto the box.
+
+    Jobs come either as plain functions run on the thread pool (submit/run)
+    or as coroutine functions awaited on the caller's event loop (arun);
+    both share the same queue slots and the same max_workers running slots.
+    The running slots are a threading semaphore, not an asyncio one: under
+    WSGI every async_to_sync call brings its own event loop, and a limit
+    per loop would limit nothing.
+    """
+
+    def __init__(self, max_workers, max_queue):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='ccv-build')
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+        self._workers = threading.BoundedSemaphore(max_workers)
+        # Threads that wait for a running slot on behalf of queued async jobs, so no event loop blocks on it
+        self._waiters = ThreadPoolExecutor(max_workers=max(1, max_queue), thread_name_prefix='ccv-build-wait')
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.submitted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.total_run = 0.0
+
+    def submit(self, fn, *args, **kwargs):
+        """Queue fn(*args, **kwargs) and return its Future, or raise ExecutorBusy."""
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise ExecutorBusy(self.retry_after())
+
+        with self._lock:
+            self.submitted += 1
+            self.queued += 1
+        try:
+            return self._pool.submit(self._run, time.monotonic(), fn, args, kwargs)
+        except BaseException:
+            with self._lock:
+                self.queued -= 1
+            self._slots.release()
+            raise
+
+    def run(self, fn, *args, **kwargs):
+        """Run fn on the pool and wait for its result."""
+        return self.submit(fn, *args, **kwargs).result()
+
+    async def arun(self, fn, *args, **kwargs):
+        """
+        Await the coroutine function fn(*args, **kwargs) once one of the
+        max_workers running slots is free, or raise ExecutorBusy. The job
+        runs on the caller's event loop; only the wait for a slot, when there
+        is one, parks a waiter thread.
+        """
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise ExecutorBusy(self.retry_after())
+
+        queued_at = time.monotonic()
+        with self._lock:
+            self.submitted += 1
+            self.queued += 1
+        started_at = None
+        try:
+            await self._acquire_worker()
+            started_at = time.monotonic()
+            with self._lock:
+                self.queued -= 1
+                self.running += 1
+                self.total_wait += started_at - queued_at
+                self.max_wait = max(self.max_wait, started_at - queued_at)
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                self._workers.release()
+        finally:
+            with self._lock:
+                if started_at is None:  # Cancelled while queued
+                    self.queued -= 1
+                else:
+                    self.running -= 1
+                    self.completed += 1
+                    self.total_run += time.monotonic() - started_at
+            self._slots.release()
+
+    def retry_after(self):
+        """Estimate how long until a queue slot frees up, in whole seconds."""
+        with self._lock:
+            average_run = self.total_run / self.completed if self.completed else 1.0
+            backlog = self.queued + self.running
+        return max(1, math.ceil(average_run * backlog / self.max_workers))
+
+    def stats(self):
+        with self._lock:
+            started = self.completed + self.running
+            return {
+                "workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "queue_depth": self.queued,
+                "running": self.running,
+                "submitted": self.submitted,
+                "rejected": self.rejected,
+                "completed": self.completed,
+                "avg_wait_ms": round(self.total_wait / started * 1000, 2) if started else 0.0,
+                "max_wait_ms": round(self.max_wait * 1000, 2),
+                "avg_run_ms": round(self.total_run / self.completed * 1000, 2) if self.completed else 0.0,
+            }
+
+    async def _acquire_worker(self):
+        if self._workers.acquire(blocking=False):
+            return
+        waiting = asyncio.get_running_loop().run_in_executor(self._waiters, self._workers.acquire)
+        try:
+            await asyncio.shield(waiting)
+        except asyncio.CancelledError:
+            # The waiter thread still gets the slot; hand it straight back
+            waiting.add_done_callback(lambda _: self._workers.release())
+            raise
+
+    def _run(self, queued_at, fn, args, kwargs):
+        self._workers.acquire()
+        started_at = time.monotonic()
+        wait = started_at - queued_at
+        with self._lock:
+            self.queued -= 1
+            self.running += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self._lock:
+                self.running -= 1
+                self.completed += 1
+                self.total_run += time.monotonic() - started_at
+            self._workers.release()
+            self._slots.release()
+
+
+_build_executor = None
+_build_executor_lock = threading.Lock()
+
+
+def get_build_executor():
+    """Return the process-wide BuildExecutor configured from settings."""
+    global _build_executor
+    with _build_executor_lock:
+        if _build_executor is None:
+            _build_executor = BuildExecutor(
+                getattr(settings, 'BUILD_WORKERS', None) or os.cpu_count() or 1,
+                getattr(settings, 'BUILD_QUEUE_SIZE', 32),
+            )
+        return _build_executor
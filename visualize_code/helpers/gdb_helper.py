@@ -1,72 +1,223 @@
-from .memory_helper import extract_current_line, parse_with_clang, extract_function_name, extract_memory_state
+from .memory_helper import (parse_with_clang, extract_function_name, extract_line_number, extract_memory_state,
+                            format_memory_entry, get_address, get_type, parse_backtrace)
+from .compile_cache import acompile_c_code, compile_c_code
+from .declaration_index import get_declaration_index
+from .executor import ExecutorBusy, get_build_executor
+from .gdb_mi import MIError, MITimeout, mi_quote
+from .gdb_pool import FRAME_SNAPSHOT_SCRIPT, get_gdb_pool
+from .heap_tracker import HEAP_RING_FILE, RING_ENV, HeapMap, HeapRing, build_heap_shim
+from .gdb_values import GDBValueError, attach_addresses, element_type_name, layout_from_type, parse_value
+from .inferior_memory import InferiorMemory, MemorySnapshot, plan_reads
+from .memory_decode import decode_elements, decode_value, format_value, hexdump
+from .history import StepHistory, new_step_history
+from .metrics import get_histogram
+from .sandbox import PRELOAD_ENV, exec_wrapper_command, get_sandbox_limits, verdict_for_signal
+from .session_broker import get_broker_client
+from .session_manager import SessionBusy, ahold, get_session_manager, hold, session_owner, stop_when_idle
+from .state_delta import MemoryDeltaEncoder
+from .workspace import Workspace
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from collections import OrderedDict
 import subprocess
+import asyncio
+import functools
+import itertools
 import json
 import threading
-import queue
-import wexpect
 import time
 import os
-
-import subprocess
-import wexpect
 import queue
-import threading
-import time
+import re
+import signal
+
+try:
+    import wexpect
+except ImportError:  # wexpect is Windows-only; the GDB/MI backend does not need it
+    wexpect = None
+
+# Printed by `echo` after every console command; see GDBSession.run_command
+CONSOLE_SENTINEL_ECHO = "__CCV_\\104ONE_{}__"
+CONSOLE_SENTINEL_RE = re.compile(r'__CCV_DONE_(\d+)__')
+FRAME_INFO_RE = re.compile(r'frame at (0x[0-9a-fA-F]+)')
+FRAME_FUNCTION_RE = re.compile(r' in (\w+) \(')
+CHECKPOINT_RE = re.compile(r'checkpoint (\d+): fork returned pid (\d+)')
+# What each kind of step runs: over the next line, into the call on it, out of the current function
+STEP_COMMANDS = {"over": "-exec-next", "into": "-exec-step", "out": "-exec-finish"}
+CONSOLE_STEP_COMMANDS = {"over": "next", "into": "step", "out": "finish"}
+
+# How many distinct stack frames keep their variable addresses cached
+ADDRESS_CACHE_FRAMES = 32
+
+
+def compile_for_debugging(c_code):
+    """
+    Saves and compiles c_code in a fresh workspace on the build pool.
+
+    Returns:
+        tuple: (workspace, compile_result). The caller owns the workspace.
+    """
+    workspace = Workspace(prefix='ccv-gdb-')
+    try:
+        workspace.write('test_temp.c', c_code)
+        compile_result = get_build_executor().run(
+            compile_c_code, c_code, workspace.path('test_temp.out'), source_name='test_temp.c'
+        )
+    except BaseException:
+        workspace.cleanup()
+        raise
+    return workspace, compile_result
+
+async def acompile_for_debugging(c_code):
+    """Async counterpart of compile_for_debugging; gcc runs as an asyncio subprocess."""
+    workspace = Workspace(prefix='ccv-gdb-')
+    try:
+        workspace.write('test_temp.c', c_code)
+        compile_result = await get_build_executor().arun(
+            acompile_c_code, c_code, workspace.path('test_temp.out'), source_name='test_temp.c'
+        )
+    except BaseException:
+        workspace.cleanup()
+        raise
+    return workspace, compile_result
+
+class _ConsoleCommand:
+    def __init__(self):
+        self.done = threading.Event()
+        self.lines = []
+
 
 class GDBSession:
     def __init__(self, session_id):
         self.session_id = session_id
         self.gdb_process = None
+        self.workspace = None
         self.current_line = None
         self.memory_state = []
         self.function_name = None
-        self.history = []
-        self.output_queue = queue.Queue()
+        self.history = new_step_history()
+        self.delta_encoder = MemoryDeltaEncoder()
+        self.lock = threading.Lock()  # See session_manager.hold
         self.thread = None
         self.stop_event = threading.Event()
+        self.command_lock = threading.Lock()
+        self.pending = {}
+        self.pending_lock = threading.Lock()
+        self.tokens = itertools.count(1)
+        self.latency = get_histogram("gdb_console_command")
+        self.address_cache = OrderedDict()
+        self.frame_addresses = {}
+        self.frame_types = {}
+        self.backtrace_max = getattr(settings, 'DEBUG_BACKTRACE_MAX', 64)
+        self.backtrace = []
+        self.frame_locals_cache = {}  # level -> memory_state, for the current step only
+
+    @property
+    def gdb_pid(self):
+        return getattr(self.gdb_process, 'pid', None)
 
     def read_gdb_output_thread(self):
-        """Continuously read GDB output and store it in the queue."""
+        """
+        Continuously read GDB output, handing everything printed before a
+        command's sentinel line to the caller waiting on that command.
+        """
+        lines = []
         while not self.stop_event.is_set():
             try:
-                index = self.gdb_process.expect(["\r\n", wexpect.EOF, wexpect.TIMEOUT], timeout=2)
-                if index == 0:  # New line received
-                    line = self.gdb_process.before.strip()
-                    if line:
-                        self.output_queue.put(line)
-                elif index == 1:  # EOF received, GDB exited
-                    print("GDB process has exited.")
-                    self.stop_event.set()  # Stop the thread
-                    break
-            except wexpect.TIMEOUT:
-                continue
+                # Block until a full line arrives; no polling timeout needed
+                index = self.gdb_process.expect(["\r\n", wexpect.EOF], timeout=None)
             except Exception as e:
                 print(f"Unexpected error in GDB thread: {e}")
-                self.stop_event.set()  # Stop the thread on error
+                break
+            if index == 1:  # EOF received, GDB exited
+                print("GDB process has exited.")
                 break
 
-    def collect_output(self, expected_text="(gdb)", timeout=5):
-        """Collect GDB output until expected text is found or timeout occurs."""
-        output = []
-        start_time = time.time()
+            line = self.gdb_process.before.strip()
+            sentinel = CONSOLE_SENTINEL_RE.search(line)
+            if sentinel:
+                with self.pending_lock:
+                    command = self.pending.pop(int(sentinel.group(1)), None)
+                if command is not None:
+                    command.lines = lines
+                    command.done.set()
+                lines = []
+            elif line:
+                lines.append(line)
 
-        while True:
-            try:
-                if time.time() - start_time > timeout:
-                    print("Timeout while waiting for GDB output.")
-                    break
+        # Stop the thread and wake anybody still waiting for output
+        self.stop_event.set()
+        with self.pending_lock:
+            commands = list(self.pending.values())
+            self.pending.clear()
+        for command in commands:
+            command.done.set()
 
-                line = self.output_queue.get(timeout=0.5)
-                output.append(line)
+    def run_command(self, command, timeout=None):
+        """
+        Send a command to GDB and return its output.
 
-                # Stop if we see "(gdb)" on a new line
-                if line.strip() == expected_text:
-                    break  
+        The command is followed by an `echo` of a unique sentinel. GDB runs
+        commands in order, so the sentinel is printed exactly when the
+        command's output is complete and the reader thread wakes us up then.
+        The sentinel is typed with an octal escape so GDB's echo of our own
+        input can never be mistaken for it.
+        """
+        timeout = timeout or getattr(settings, 'GDB_TIMEOUT', 10)
+        with self.command_lock:
+            if self.stop_event.is_set():
+                raise RuntimeError("GDB process has exited.")
+            token = next(self.tokens)
+            command_output = _ConsoleCommand()
+            with self.pending_lock:
+                self.pending[token] = command_output
 
-            except queue.Empty:
-                break
+            start = time.perf_counter()
+            self.gdb_process.sendline(command)
+            self.gdb_process.sendline(f"echo {CONSOLE_SENTINEL_ECHO.format(token)}\\n")
+            if not command_output.done.wait(timeout):
+                with self.pending_lock:
+                    self.pending.pop(token, None)
+                print(f"Timeout while waiting for GDB output of {command!r}.")
+                return ""
+            self.latency.record(time.perf_counter() - start)
+            return "\n".join(command_output.lines)
+
+    def enter_current_frame(self):
+        """
+        Select the address cache for the frame GDB is stopped in.
+
+        A local's address, type and size cannot change while its frame is
+        live, so they are cached per (function, frame address). One
+        `info frame` per step replaces a `print &var` per variable, and a
+        `whatis` plus `print sizeof` per array, struct or string.
+        """
+        frame_info = self.run_command("info frame")
+        frame_address = FRAME_INFO_RE.search(frame_info)
+        function = FRAME_FUNCTION_RE.search(frame_info)
+        if not frame_address:
+            self.frame_addresses = {}
+            self.frame_types = {}
+            return
+        key = (function.group(1) if function else None, frame_address.group(1))
+        if key not in self.address_cache:
+            self.address_cache[key] = ({}, {})
+            if len(self.address_cache) > ADDRESS_CACHE_FRAMES:
+                self.address_cache.popitem(last=False)
+        self.address_cache.move_to_end(key)
+        self.frame_addresses, self.frame_types = self.address_cache[key]
+
+    def get_address(self, variable):
+        """Address of a variable in the current frame, looked up at most once per frame."""
+        if variable not in self.frame_addresses:
+            self.frame_addresses[variable] = get_address(self, variable)
+        return self.frame_addresses[variable]
 
-        return "\n".join(output)
+    def get_type(self, variable):
+        """(type name, sizeof) of a variable in the current frame, looked up at most once per frame."""
+        if variable not in self.frame_types:
+            self.frame_types[variable] = get_type(self, variable)
+        return self.frame_types[variable]
 
     def start_debugging(self, c_code):
         try:
@@ -74,77 +225,84 @@ class GDBSession:
             if not c_code.strip():
                 return {"error": "No C code provided."}
 
-            # Save and compile the C code
-            with open('test_temp.c', 'w') as file:
-                file.write(c_code)
-
-            compile_result = subprocess.run(
-                ['gcc', '-g', 'test_temp.c', '-o', 'test_temp.out'], 
-                capture_output=True, text=True
-            )
+            # Save and compile the C code in a workspace private to this session
+            self.workspace, compile_result = compile_for_debugging(c_code)
 
             if compile_result.returncode != 0:
+                self.workspace.cleanup()
                 return {"error": compile_result.stderr}
 
-            # Start GDB
-            self.gdb_process = wexpect.spawn('gdb ./test_temp.out')
-            self.gdb_process.sendline("set pagination off")
+            # Start GDB inside the workspace so it finds test_temp.c for source lines
+            if wexpect is None:
+                return {"error": "The console GDB backend needs wexpect; set GDB_BACKEND = 'mi'."}
+            self.gdb_process = wexpect.spawn('gdb ./test_temp.out', cwd=self.workspace.root)
+            self.gdb_process.delaybeforesend = 0  # No artificial pause before every sendline
 
             # Start output reading thread
             self.thread = threading.Thread(target=self.read_gdb_output_thread)
             self.thread.daemon = True
             self.thread.start()
 
+            self.run_command("set pagination off")
+            self.run_command(f"set exec-wrapper {exec_wrapper_command()}")
+
             # Set breakpoint at main
-            self.gdb_process.sendline("break main")
-            output = self.collect_output(expected_text="Breakpoint")
+            output = self.run_command("break main")
             print("Output after setting breakpoint:\n", output)
 
             # Run the program
-            self.gdb_process.sendline("run")
-            output = self.collect_output(expected_text="Breakpoint")
+            output = self.run_command("run")
             print("Output after run:\n", output)
+            run_output = output
 
             # Get current line information
-            self.gdb_process.sendline("info line")
-            line_output = self.collect_output()
+            line_output = self.run_command("info line")
             print("Line info:\n", line_output)
 
             # Get local variables
-            self.gdb_process.sendline("info locals")
-            locals_output = self.collect_output()
+            locals_output = self.run_command("info locals")
             print("Local variables:\n", locals_output)
 
-            # Extract current line and function name
-            self.current_line = extract_current_line(line_output)
-            self.function_name = extract_function_name(line_output)
-            self.memory_state = extract_memory_state(self.gdb_process, locals_output)
+            # Extract current line and function name ("Breakpoint 1, main () at test_temp.c:3")
+            self.current_line = extract_line_number(run_output)
+            self.function_name = extract_function_name(run_output) or "main"
+            self.enter_current_frame()
+            self.memory_state = extract_memory_state(self, locals_output)
+            self.update_backtrace()
 
-            return {
-                "current_line": 1,
-                "function_name": "main",
+            response = {
+                "current_line": self.current_line,
+                "function_name": self.function_name,
                 "memory_state": self.memory_state,
+                "backtrace": self.backtrace,
                 "status": "running"
             }
+            response["step"] = self.history.record(response)
+            return response
+        except ExecutorBusy:
+            # Let the view turn this into a 503 with Retry-After
+            raise
         except Exception as e:
             return {"error": str(e)}
 
 
-    def step_forward(self):
+    def step_forward(self, kind="over"):
+        """
+        Runs one step: "over" the current line (`next`), "into" the function
+        it calls (`step`), or "out" of the current function (`finish`).
+        """
         try:
             if not self.gdb_process:
                 return {"error": "Debugging session not started."}
+            if kind not in CONSOLE_STEP_COMMANDS:
+                return {"error": f"Unknown kind of step {kind!r}."}
 
-            print("1")
-            self.gdb_process.sendline("next")
-
-            # Collect output after "next"
-            next_output = self.collect_output(expected_text="(gdb)", timeout=5)
+            # Collect output after the step
+            next_output = self.run_command(CONSOLE_STEP_COMMANDS[kind])
             print("2", next_output)
 
             # Send "info locals" to get variable states
-            self.gdb_process.sendline("info locals")
-            locals_output = self.collect_output(expected_text="(gdb)", timeout=5)
+            locals_output = self.run_command("info locals")
             print("3", locals_output)  # Debug output
 
             # Ensure we received output
@@ -157,35 +315,75 @@ class GDBSession:
                 }
 
             # Extract details
-            current_line = extract_current_line(next_output)
+            current_line = extract_line_number(next_output)
             print(f"Current Line: {current_line}")
 
-            if not self.function_name:
-                self.function_name = extract_function_name(next_output)
+            # gdb prints the frame ("sq (n=3) at test_temp.c:4") only when the step changed function
+            self.function_name = extract_function_name(next_output) or self.function_name
 
-            memory_state = extract_memory_state(self.gdb_process, locals_output)
+            self.enter_current_frame()
+            memory_state = extract_memory_state(self, locals_output)
             print(f"Memory State SF: {memory_state}")
 
             # Update session state
             self.current_line = current_line
             self.memory_state = memory_state
-            self.history.append({
-                "line": current_line,
-                "memory_state": memory_state
-            })
+            self.update_backtrace()
 
-            return {
-                "current_line": 1,
-                "function_name": "main",
+            response = {
+                "current_line": self.current_line,
+                "function_name": self.function_name,
                 "memory_state": self.memory_state,
+                "backtrace": self.backtrace,
                 "status": "running"
             }
+            response["step"] = self.history.record(response)
+            return response
 
         except Exception as e:
             return {"error": str(e)}
 
 
 
+    def update_backtrace(self):
+        """Lists the call stack (up to DEBUG_BACKTRACE_MAX frames) after a step; outer frames' locals wait for frame_locals."""
+        self.backtrace = parse_backtrace(self.run_command(f"bt {self.backtrace_max}"))
+        self.frame_locals_cache = {}
+
+    def frame_locals(self, level):
+        """
+        The locals of one frame of the current backtrace, read with `frame N`
+        and `info locals` only when asked for. The console cannot cheaply tell
+        whether a callee wrote to an outer frame, so they are cached for the
+        current step only.
+
+        Returns:
+            dict: {"level", "function", "line", "memory_state", "cached"}.
+        """
+        if not self.gdb_process:
+            return {"error": "Debugging session not started."}
+        if not self.history.at_head():
+            return {"error": "Frames can only be read at the step the program is stopped at."}
+        if not 0 <= level < len(self.backtrace):
+            return {"error": f"No frame {level} in the current backtrace."}
+        frame = self.backtrace[level]
+        response = {"level": level, "function": frame["function"], "line": frame["line"]}
+        if level == 0:
+            return dict(response, memory_state=self.memory_state, cached=True)
+        if level in self.frame_locals_cache:
+            return dict(response, memory_state=self.frame_locals_cache[level], cached=True)
+
+        current_addresses, current_types = self.frame_addresses, self.frame_types
+        try:
+            self.run_command(f"frame {level}")
+            self.enter_current_frame()
+            memory_state = extract_memory_state(self, self.run_command("info locals"))
+        finally:
+            self.run_command("frame 0")
+            self.frame_addresses, self.frame_types = current_addresses, current_types
+        self.frame_locals_cache[level] = memory_state
+        return dict(response, memory_state=memory_state, cached=False)
+
     def stop_debugging(self):
         try:
             if self.gdb_process:
@@ -198,9 +396,9 @@ class GDBSession:
                 if self.thread:
                     self.thread.join(timeout=2)  # Ensure thread stops
 
-                # Cleanup temporary file
-                if os.path.exists("test_temp.c"):
-                    os.remove("test_temp.c")
+                # Cleanup temporary files
+                if self.workspace:
+                    self.workspace.cleanup()
 
                 return {"message": "Debugging session ended successfully."}
             
@@ -209,29 +407,1096 @@ class GDBSession:
         except Exception as e:
             return {"error": str(e)}
 
-# Global Dictionary to Manage Sessions
-gdb_sessions = {}
+def parse_frame_snapshot(output):
+    """Decodes the JSON line printed by the frame-snapshot gdb command."""
+    for line in output.splitlines():
+        if line.startswith("{"):
+            return json.loads(line)
+    raise MIError(f"Unexpected frame-snapshot output: {output!r}")
+
+class MIGDBSession:
+    """
+    Debugging session driven through gdb's machine interface (GDB/MI).
+
+    Offers the same start_debugging/step_forward/stop_debugging API as
+    GDBSession, but every step is a token-matched request/response exchange
+    with structured results, so nothing waits on prompts or timers.
+
+    Every checkpoint_interval steps the inferior is forked with gdb's
+    `checkpoint`, so rewind_to can restart the nearest checkpoint at or before
+    the target step and only re-execute the steps after it.
+
+    The program runs under the sandbox rlimits (through gdb's exec-wrapper),
+    and a step that does not finish within SANDBOX_WALL_TIME ends the
+    program with a "timeout" verdict.
+    """
+
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.controller = None
+        self.workspace = None
+        self.current_line = None
+        self.memory_state = {}
+        self.function_name = None
+        self.history = new_step_history()
+        self.delta_encoder = MemoryDeltaEncoder()
+        self.lock = threading.Lock()  # See session_manager.hold
+        self.checkpoint_interval = getattr(settings, 'DEBUG_CHECKPOINT_INTERVAL', 25)
+        self.max_checkpoints = getattr(settings, 'DEBUG_CHECKPOINT_MAX', 20)
+        self.checkpoints = {}  # step -> gdb checkpoint id
+        self.live_fork = 0  # gdb's id for the process being stepped
+        self.step = -1  # Step the live process is stopped at
+        self.step_timeout = get_sandbox_limits().wall_time
+        self.declarations = None  # DeclarationIndex of the program, if clang could parse it
+        # Arrays above summary_bytes are sent as a summary; read_elements pages through them
+        self.summary_bytes = getattr(settings, 'DEBUG_ARRAY_SUMMARY_BYTES', 4096)
+        self.preview = getattr(settings, 'DEBUG_ARRAY_PREVIEW', 16)
+        self.page_max = getattr(settings, 'DEBUG_ARRAY_PAGE_MAX', 4096)
+        # Live heap blocks, from the preloaded allocator shim's event ring
+        self.heap_ring = None
+        self.heap = HeapMap()
+        self.heap_checkpoints = {}  # step -> HeapMap as of that checkpoint
+        self.heap_max_blocks = getattr(settings, 'DEBUG_HEAP_MAX_BLOCKS', 256)
+        # Plain-data locals are decoded from bulk reads of the frame instead of formatted by gdb
+        self.bulk_reads = getattr(settings, 'DEBUG_BULK_FRAME_READS', True)
+        self.direct_reads = getattr(settings, 'DEBUG_DIRECT_MEMORY_READS', True)  # /proc/<pid>/mem before gdb
+        self.read_gap = getattr(settings, 'DEBUG_MEMORY_READ_GAP', 4096)
+        self.dump_max = getattr(settings, 'DEBUG_MEMORY_DUMP_MAX', 4096)
+        self.memory = None  # InferiorMemory of the stopped program
+        self.memory_pid = None  # Its pid as of the last snapshot
+        self.frame_range = None  # {"low", "high"} addresses of the current frame
+        # Call stack of the current step; outer frames' locals are only read when asked for
+        self.backtrace_max = getattr(settings, 'DEBUG_BACKTRACE_MAX', 64)
+        self.backtrace = []
+        self.frame_cache = {}  # frame id -> {"memory_state", "ranges", "bytes"}
+        self.step_kinds = []  # Kind of every step so far, so rewinds replay the same commands
+
+    @property
+    def gdb_pid(self):
+        return self.controller.process.pid if self.controller else None
+
+    def start_debugging(self, c_code):
+        try:
+            if not c_code.strip():
+                return {"error": "No C code provided."}
+
+            self.workspace, compile_result = compile_for_debugging(c_code)
+            self.declarations = self.index_program(c_code)
+            return self.launch(compile_result)
+        except ExecutorBusy:
+            raise
+        except Exception as e:
+            return {"error": str(e)}
+
+    async def astart_debugging(self, c_code):
+        """Async counterpart of start_debugging."""
+        try:
+            if not c_code.strip():
+                return {"error": "No C code provided."}
+
+            self.workspace, compile_result = await acompile_for_debugging(c_code)
+            self.declarations = await sync_to_async(self.index_program, thread_sensitive=False)(c_code)
+            # Taking a gdb from the pool may have to start one; keep that off the event loop
+            return await sync_to_async(self.launch, thread_sensitive=False)(compile_result)
+        except ExecutorBusy:
+            raise
+        except Exception as e:
+            return {"error": str(e)}
+
+    def index_program(self, c_code):
+        """Builds (or reuses) the program's declaration index; None if clang cannot parse it."""
+        try:
+            return get_declaration_index(c_code, session_key=self.session_id)
+        except Exception as e:
+            print(f"Could not index declarations: {e}")
+            return None
+
+    def launch(self, compile_result):
+        """Loads the workspace's compiled program into a pooled gdb and runs it to main."""
+        if compile_result.returncode != 0:
+            self.workspace.cleanup()
+            return {"error": compile_result.stderr}
+
+        # A pre-warmed gdb already has its settings and helper script loaded
+        self.controller = get_gdb_pool().acquire(self.workspace.root)
+        self.controller.command(f"-file-exec-and-symbols {mi_quote(self.workspace.path('test_temp.out'))}")
+        # Keep the program's own I/O off gdb's MI pipes
+        self.controller.command(f"-exec-arguments < {os.devnull} > program_output.txt 2>&1")
+        # Same limits as run_code: the wrapper sets them, then execs the program
+        self.controller.console(f"set exec-wrapper {exec_wrapper_command()}")
+        self.start_heap_tracking()
+        self.controller.command("-break-insert main")
+        stopped = self.controller.execute("-exec-run")
+        self.step = 0
+        self.take_checkpoint()
+        return self.snapshot(stopped)
+
+    def start_heap_tracking(self):
+        """
+        Preloads the allocator shim into the program (through the exec-wrapper)
+        and maps the ring it logs to. Without gcc or with DEBUG_HEAP_TRACKING
+        off, steps simply carry no heap.
+        """
+        if not getattr(settings, 'DEBUG_HEAP_TRACKING', True):
+            return
+        library = build_heap_shim(self.workspace)
+        if library is None:
+            return
+        self.heap_ring = HeapRing(self.workspace.path(HEAP_RING_FILE), getattr(settings, 'DEBUG_HEAP_RING_EVENTS', 65536))
+        self.controller.console(f"set environment {RING_ENV} {self.heap_ring.path}")
+        self.controller.console(f"set environment {PRELOAD_ENV} {library}")
+
+    def drain_heap(self):
+        """Applies the allocations the program logged since the last stop."""
+        if self.heap_ring is not None:
+            self.heap.apply(self.heap_ring.drain())
+
+    def step_forward(self, kind="over"):
+        """
+        Runs one step: "over" the current line, "into" the function it calls,
+        or "out" of the current function.
+        """
+        try:
+            if not self.controller:
+                return {"error": "Debugging session not started."}
+            if kind not in STEP_COMMANDS:
+                return {"error": f"Unknown kind of step {kind!r}."}
+
+            try:
+                stopped = self.controller.execute(STEP_COMMANDS[kind], self.step_timeout)
+            except MITimeout:
+                return self.end_timed_out_step()
+            self.step += 1
+            self.step_kinds.append(kind)
+            if self.checkpoint_due(stopped):
+                self.take_checkpoint()
+            return self.snapshot(stopped)
+        except Exception as e:
+            return {"error": str(e)}
+
+    async def astep_forward(self, kind="over"):
+        """Async counterpart of step_forward: waits on gdb without holding a thread."""
+        try:
+            if not self.controller:
+                return {"error": "Debugging session not started."}
+            if kind not in STEP_COMMANDS:
+                return {"error": f"Unknown kind of step {kind!r}."}
+
+            try:
+                stopped = await self.controller.aexecute(STEP_COMMANDS[kind], self.step_timeout)
+            except MITimeout:
+                return await sync_to_async(self.end_timed_out_step, thread_sensitive=False)()
+            self.step += 1
+            self.step_kinds.append(kind)
+            if self.checkpoint_due(stopped):
+                await sync_to_async(self.take_checkpoint, thread_sensitive=False)()
+            frame_state = None
+            if stopped.get("frame") is not None:
+                frame_state = parse_frame_snapshot(await self.controller.aconsole(self.snapshot_command))
+            # Decoding may still need blocking gdb round trips (memory reads, -data-evaluate-expression)
+            return await sync_to_async(self.snapshot, thread_sensitive=False)(stopped, frame_state)
+        except Exception as e:
+            return {"error": str(e)}
+
+    def end_timed_out_step(self):
+        """
+        Interrupts a program that ran past the step timeout (as Ctrl-C would)
+        and kills it, ending the session's program with a "timeout" verdict.
+        """
+        try:
+            os.kill(self.controller.process.pid, signal.SIGINT)
+            self.controller.stops.get(timeout=self.controller.timeout)
+            self.controller.console("kill")
+        except (OSError, queue.Empty, MIError) as e:
+            print(f"Could not stop the timed-out program cleanly: {e}")
+        self.checkpoints = {}
+        return {
+            "current_line": None,
+            "function_name": None,
+            "memory_state": {},
+            "status": "completed",
+            "verdict": "timeout"
+        }
+
+    def checkpoint_due(self, stopped):
+        return stopped.get("frame") is not None and self.step % max(self.checkpoint_interval, 1) == 0
+
+    def take_checkpoint(self):
+        """Forks the stopped inferior so this step can be restarted later."""
+        if self.checkpoint_interval <= 0 or self.max_checkpoints <= 0:
+            return
+        match = CHECKPOINT_RE.search(self.controller.console("checkpoint"))
+        if not match:
+            return  # Not supported on this target; rewinds fall back to replaying from the start
+        self.checkpoints[self.step] = int(match.group(1))
+        if len(self.checkpoints) > self.max_checkpoints:
+            # Step 0 is kept so a rewind never has to re-run the program
+            oldest = min(step for step in self.checkpoints if step != 0)
+            self.delete_checkpoint(self.checkpoints.pop(oldest))
+        if self.heap_ring is not None:
+            # The fork's heap is this step's; a restart must bring the map back to it too
+            self.drain_heap()
+            self.heap_checkpoints = {step: heap for step, heap in self.heap_checkpoints.items() if step in self.checkpoints}
+            self.heap_checkpoints[self.step] = self.heap.copy()
+
+    def delete_checkpoint(self, checkpoint_id):
+        try:
+            self.controller.console(f"delete checkpoint {checkpoint_id}")
+        except MIError as e:
+            print(f"Failed to delete checkpoint {checkpoint_id}: {e}")
+
+    def rewind_to(self, step):
+        """
+        Puts the program back at an earlier step: restarts the nearest
+        checkpoint at or before it, or re-runs from main if there is none,
+        then steps forward the remaining distance.
+
+        Args:
+            step (int): Step number to go back to, lower than the current one.
+
+        Returns:
+            dict: The step response for the rewound-to step.
+        """
+        try:
+            if not self.controller:
+                return {"error": "Debugging session not started."}
+            if not 0 <= step < self.step:
+                return {"error": f"Cannot rewind from step {self.step} to step {step}."}
+
+            # Checkpoints past the target describe a future that is about to be re-executed
+            for later in [s for s in self.checkpoints if s > step]:
+                self.delete_checkpoint(self.checkpoints.pop(later))
+
+            base = max((s for s in self.checkpoints if s <= step), default=None)
+            if base is None:
+                stopped = self.restart_and_replay(step)
+            else:
+                self.restore_checkpoint(base)
+                # `restart` reports no *stopped record; the fork is stopped in a frame at base
+                stopped = {"reason": "checkpoint-restart", "frame": {}}
+                for kind in self.step_kinds[base:step]:
+                    stopped = self.controller.execute(STEP_COMMANDS[kind])
+                self.step = step
+            del self.step_kinds[step:]
+
+            self.history.truncate(step)
+            return self.snapshot(stopped)
+        except Exception as e:
+            return {"error": str(e)}
+
+    def restore_checkpoint(self, step):
+        """Switches to the checkpoint taken at step, keeping a fresh fork of it for later rewinds."""
+        checkpoint_id = self.checkpoints.pop(step)
+        if self.heap_ring is not None:
+            self.drain_heap()  # Allocations of the abandoned future are skipped
+            self.heap = self.heap_checkpoints.pop(step, self.heap).copy()
+        self.frame_cache = {}  # The same frame ids, but another process's memory
+        previous = self.live_fork
+        self.controller.console(f"restart {checkpoint_id}")
+        self.live_fork = checkpoint_id
+        self.delete_checkpoint(previous)
+        self.step = step
+        # Restarting consumes the checkpoint; take another one to be able to come back here again
+        self.take_checkpoint()
+
+    def restart_and_replay(self, step):
+        """Re-runs the program from main and steps forward to step, without snapshots on the way."""
+        self.drain_heap()
+        self.heap = HeapMap()
+        self.heap_checkpoints = {}
+        self.frame_cache = {}
+        stopped = self.controller.execute("-exec-run")
+        # Re-running kills every fork, so there is nothing left to track
+        self.checkpoints = {}
+        self.live_fork = 0
+        self.step = 0
+        self.take_checkpoint()
+        for kind in self.step_kinds[:step]:
+            stopped = self.controller.execute(STEP_COMMANDS[kind])
+        self.step = step
+        return stopped
+
+    def snapshot(self, stopped, frame_state=None):
+        """
+        Builds the step response from a *stopped record and the frame's
+        locals, fetching them unless frame_state already holds them.
+        """
+        self.drain_heap()
+        frame = stopped.get("frame")
+        if frame is None:  # exited, exited-normally, signal-received outside a frame, ...
+            signal_name = stopped.get("signal-name")
+            response = {
+                "current_line": None,
+                "function_name": None,
+                "memory_state": {},
+                "status": "completed",
+                "verdict": verdict_for_signal(signal_name) if signal_name else "ok"
+            }
+            if self.heap_ring is not None:
+                response["heap"] = self.heap_summary()  # Whatever is left was leaked
+            return response
+
+        snapshot = frame_state or self.frame_snapshot()
+        self.frame_range = snapshot.get("frame")
+        self.current_line = snapshot["line"]
+        self.function_name = snapshot["function"]
+        self.memory_state = self.memory_state_of(snapshot)
+        self.backtrace = snapshot.get("backtrace", [])
+        # The innermost frame is the one running; cached frames that returned are gone for good
+        outer = {frame["id"] for frame in self.backtrace[1:]}
+        self.frame_cache = {frame_id: cached for frame_id, cached in self.frame_cache.items() if frame_id in outer}
+
+        response = {
+            "current_line": self.current_line,
+            "function_name": self.function_name,
+            "memory_state": self.memory_state,
+            "status": "running"
+        }
+        if "backtrace" in snapshot:
+            response["backtrace"] = self.backtrace
+            if snapshot.get("backtrace_truncated"):
+                response["backtrace_truncated"] = True
+        if self.heap_ring is not None:
+            response["heap"] = self.heap_summary()
+        response["step"] = self.history.record(response)
+        return response
+
+    def memory_state_of(self, snapshot):
+        """memory_state entries (value, address, type, size, tree) for a frame-snapshot of any frame."""
+        decoded = self.decode_raw_variables(snapshot)
+        memory_state = {}
+        for variable in snapshot["variables"]:
+            if self.declared_later(variable["name"], snapshot["function"], snapshot["line"]):
+                continue  # Its slot only holds leftover stack contents until its declaration runs
+            tree = decoded.get(variable["name"])
+            if tree is not None:
+                value, address = format_value(tree), variable["address"]
+            else:
+                value, address, tree = format_memory_entry(
+                    variable["value"] or "", variable["address"], variable["type"], variable["size"],
+                    self.declared_layout(variable, snapshot["function"], snapshot["line"]))
+            summary = variable.get("summary")
+            if summary and tree is not None and tree["kind"] == "array":
+                # Only a preview was formatted; read_elements serves the rest on demand
+                tree.update(length=summary["length"], element_type=summary["element_type"], lazy=True)
+            memory_state[variable["name"]] = (value, address, variable["type"], variable["size"], tree)
+        return memory_state
+
+    def frame_locals(self, level):
+        """
+        The locals of one frame of the current backtrace. Outer frames are
+        only read from gdb when asked for, and then cached by frame id for
+        as long as the frame is on the stack, not running, and the bytes of
+        its variables are unchanged (a callee may write to them through a
+        pointer). Re-checking those bytes is a memory read, not a gdb query.
+
+        Args:
+            level (int): 0 for the innermost frame, 1 for its caller, ...
+
+        Returns:
+            dict: {"level", "id", "function", "line", "memory_state", "cached"}.
+        """
+        try:
+            if not self.controller:
+                return {"error": "Debugging session not started."}
+            if not self.history.at_head():
+                return {"error": "Frames can only be read at the step the program is stopped at."}
+            if not 0 <= level < len(self.backtrace):
+                return {"error": f"No frame {level} in the current backtrace."}
+            frame = self.backtrace[level]
+            response = {"level": level, "id": frame["id"], "function": frame["function"], "line": frame["line"]}
+            if level == 0:
+                return dict(response, memory_state=self.memory_state, cached=True)
+
+            cached = self.frame_cache.get(frame["id"])
+            if cached is not None and self.frame_bytes(cached["ranges"]) == cached["bytes"]:
+                return dict(response, memory_state=cached["memory_state"], cached=True)
+
+            snapshot = parse_frame_snapshot(self.controller.console(self.frame_command(level)))
+            memory_state = self.memory_state_of(snapshot)
+            ranges = self.displayed_ranges(memory_state)
+            contents = self.frame_bytes(ranges)
+            if None not in contents:
+                self.frame_cache[frame["id"]] = {"memory_state": memory_state, "ranges": ranges, "bytes": contents}
+            return dict(response, memory_state=memory_state, cached=False)
+        except (MIError, GDBValueError) as e:
+            return {"error": str(e)}
+
+    def displayed_ranges(self, memory_state):
+        """(address, length) of the memory a memory_state shows: whole variables, or an array's preview."""
+        ranges = []
+        for value, address, var_type, size, *rest in memory_state.values():
+            if not address or not size:
+                continue
+            tree = rest[0] if rest else None
+            if tree is not None and tree.get("lazy"):
+                size = min(size, self.preview * tree["stride"])
+            ranges.append((int(address, 16), size))
+        return ranges
+
+    def frame_bytes(self, ranges):
+        memory = self.read_ranges(ranges)
+        return [memory.slice(address, length) for address, length in ranges]
+
+    def read_elements(self, name, start, count):
+        """
+        Reads elements start..start+count of an array local at the current
+        step, with one bulk memory read, for arrays sent as a summary.
+
+        Args:
+            name (str): The variable.
+            start (int): First element index.
+            count (int): Number of elements, capped at DEBUG_ARRAY_PAGE_MAX.
+
+        Returns:
+            dict: {"variable", "start", "count", "length", "stride", "elements"},
+            elements being gdb_values nodes with "index" and "address".
+        """
+        try:
+            if not self.controller:
+                return {"error": "Debugging session not started."}
+            if not self.history.at_head():
+                return {"error": "Elements can only be read at the step the program is stopped at."}
+            entry = self.memory_state.get(name)
+            tree = entry[4] if entry and len(entry) > 4 else None
+            if tree is None or tree["kind"] != "array" or not tree.get("stride") or not entry[1]:
+                return {"error": f"{name} is not an array in the current frame."}
+
+            length = tree["length"]
+            start = min(max(start, 0), length)
+            count = min(max(count, 0), self.page_max, length - start)
+            stride = tree["stride"]
+            element_type = tree.get("element_type") or element_type_name(entry[2])
+            address = int(entry[1], 16) + start * stride
+            elements = []
+            if count:
+                data = self.read_memory(address, count * stride)
+                elements = decode_elements(data, element_type, stride, start, address) if data is not None else None
+                if elements is None:
+                    elements = self.evaluate_elements(name, start, count, element_type, stride, address)
+            return {"variable": name, "start": start, "count": count, "length": length, "stride": stride,
+                    "elements": elements}
+        except (MIError, GDBValueError) as e:
+            return {"error": str(e)}
+
+    def evaluate_elements(self, name, start, count, element_type, stride, address):
+        """Elements of a type decode_elements does not know (structs, rows of 2-d arrays), formatted by gdb."""
+        results, _ = self.controller.command(f"-data-evaluate-expression {mi_quote(f'{name}[{start}]@{count}')}")
+        tree = parse_value(results.get("value", ""))
+        layout = {"size": count * stride, "count": count, "element": layout_from_type(element_type, stride)}
+        attach_addresses(tree, address, layout)
+        for element in tree["elements"]:
+            element["index"] += start
+        return tree["elements"]
+
+    def decode_raw_variables(self, snapshot):
+        """
+        Decodes the variables frame-snapshot left raw, from one bulk read of
+        the frame's memory, using their declarations' layouts. Those it cannot
+        decode get their value from gdb instead.
+
+        Returns:
+            dict: name -> gdb_values tree, for the variables decoded here.
+        """
+        raw = [variable for variable in snapshot["variables"] if variable.get("raw")]
+        if not raw:
+            return {}
+        self.memory_pid = snapshot.get("pid")
+
+        wanted = []
+        for variable in raw:
+            layout = self.declared_layout(variable, snapshot["function"], snapshot["line"])
+            summary = variable.get("summary")
+            # Of a summarized array only the preview is read, as gdb would only have formatted that
+            count = min(self.preview, summary["length"]) if summary else None
+            length = count * summary["element_size"] if summary else variable["size"]
+            wanted.append((variable, layout, count, length))
+        memory = self.read_ranges([(int(variable["address"], 16), length)
+                                   for variable, layout, _, length in wanted if layout is not None])
+
+        decoded = {}
+        for variable, layout, count, length in wanted:
+            address = int(variable["address"], 16)
+            data = memory.slice(address, length) if layout is not None else None
+            tree = decode_value(data, layout, address, count) if data is not None else None
+            if tree is None:
+                variable["value"] = self.evaluate_variable(variable, count)
+            else:
+                decoded[variable["name"]] = tree
+        return decoded
+
+    def evaluate_variable(self, variable, count=None):
+        """gdb's formatting of a raw variable that could not be decoded here (or of its first count elements)."""
+        expression = variable["name"] if count is None else f"{variable['name']}[0]@{count}"
+        try:
+            results, _ = self.controller.command(f"-data-evaluate-expression {mi_quote(expression)}")
+        except MIError as e:
+            return f"<error: {e}>"
+        value = results.get("value", "")
+        if count is not None and count < variable["summary"]["length"] and value.endswith("}"):
+            value = value[:-1] + "...}"  # The same preview frame-snapshot would have printed
+        return value
+
+    def read_ranges(self, ranges):
+        """
+        Reads (address, length) ranges of the stopped program, merged as
+        plan_reads allows: straight from /proc/<pid>/mem where possible,
+        otherwise with one -data-read-memory-bytes per read.
+
+        Returns:
+            MemorySnapshot: The bytes; unreadable ranges are simply missing.
+        """
+        memory = self.inferior_memory()
+        if memory is not None:
+            try:
+                return memory.read_ranges(ranges, self.read_gap)
+            except OSError as e:
+                print(f"Could not read /proc/{memory.pid}/mem: {e}")
+        blocks = []
+        for address, length in plan_reads(ranges, self.read_gap):
+            try:
+                results, _ = self.controller.command(f"-data-read-memory-bytes {hex(address)} {length}")
+            except MIError as e:
+                print(f"Could not read {length} bytes at {hex(address)}: {e}")
+                continue
+            for block in results.get("memory", []):
+                start = int(block["begin"], 16) + int(block.get("offset", "0x0"), 16)
+                blocks.append((start, bytes.fromhex(block["contents"])))
+        return MemorySnapshot(blocks)
+
+    def read_memory(self, address, length):
+        """length bytes at address in the stopped program, or None if they are not all readable."""
+        return self.read_ranges([(address, length)]).slice(address, length)
+
+    def inferior_memory(self):
+        """The program's /proc/<pid>/mem as of the last snapshot, or None if it cannot be read directly."""
+        if not self.direct_reads or self.memory_pid is None:
+            return None
+        if self.memory is None or self.memory.pid != self.memory_pid:
+            self.close_memory()  # A checkpoint fork or a re-run has another pid
+            try:
+                self.memory = InferiorMemory(self.memory_pid)
+            except OSError as e:
+                print(f"Reading memory through gdb instead of /proc: {e}")
+                self.direct_reads = False
+                return None
+        return self.memory
+
+    def close_memory(self):
+        if self.memory is not None:
+            self.memory.close()
+            self.memory = None
+
+    def dump_memory(self, address=None, length=None):
+        """
+        Hexdump of the stopped program's memory, by default of the current frame.
+
+        Args:
+            address (int): First byte to show; the frame (its top DEBUG_MEMORY_DUMP_MAX bytes) if None.
+            length (int): Bytes to show, capped at DEBUG_MEMORY_DUMP_MAX.
+
+        Returns:
+            dict: {"address", "length", "rows": [{"address", "hex", "ascii"}],
+            "variables": [{"name", "address", "size"}]} with the locals inside the range.
+        """
+        try:
+            if not self.controller:
+                return {"error": "Debugging session not started."}
+            if not self.history.at_head():
+                return {"error": "Memory can only be read at the step the program is stopped at."}
+            if address is None:
+                low, high = self.current_frame_range()
+                if low is None:
+                    return {"error": "The current frame's address range is not known."}
+                address = max(low, high - self.dump_max)  # Locals sit at the top of the frame
+                length = high - address if length is None else length
+            length = min(max(length or 0, 0), self.dump_max)
+            data = self.read_memory(address, length) if length else b""
+            if data is None:
+                return {"error": f"Cannot read {length} bytes at {hex(address)}."}
+
+            variables = []
+            for name, entry in self.memory_state.items():
+                if entry[1] and entry[3] and address <= int(entry[1], 16) < address + length:
+                    variables.append({"name": name, "address": entry[1], "size": entry[3]})
+            return {"address": hex(address), "length": length, "rows": hexdump(data, address), "variables": variables}
+        except MIError as e:
+            return {"error": str(e)}
+
+    def current_frame_range(self):
+        """(low, high) of the current frame, from frame-snapshot or else from the locals' own addresses."""
+        if self.frame_range:
+            return int(self.frame_range["low"], 16), int(self.frame_range["high"], 16)
+        spans = [(int(entry[1], 16), entry[3]) for entry in self.memory_state.values() if entry[1] and entry[3]]
+        if not spans:
+            return None, None
+        return min(start for start, _ in spans), max(start + size for start, size in spans)
+
+    def heap_summary(self):
+        return self.heap.summary(self.heap_max_blocks, self.heap_ring.lost)
+
+    def declared_later(self, name, function, line):
+        """True if the index knows name in function, but only from a declaration after line."""
+        if self.declarations is None or not self.declarations.knows(name, function):
+            return False
+        return self.declarations.lookup(name, function, line) is None
+
+    def declared_layout(self, variable, function, line):
+        """The clang layout of a variable's declaration, if it agrees with gdb's sizeof."""
+        if self.declarations is None:
+            return None
+        declaration = self.declarations.lookup(variable["name"], function, line)
+        if declaration is None or declaration.size != variable["size"]:
+            return None  # A different variable of the same name, or a type clang saw differently
+        return declaration.layout
+
+    def frame_snapshot(self):
+        """
+        Fetches function, line and all locals of the current frame in one
+        round trip through the frame-snapshot gdb command.
+
+        Returns:
+            dict: {"function", "line", "variables": [{"name", "type", "value", "address", "size"}]}
+        """
+        return parse_frame_snapshot(self.controller.console(self.snapshot_command))
+
+    @property
+    def snapshot_command(self):
+        return f"frame-snapshot {self.summary_bytes} {self.preview} {int(self.bulk_reads)} {self.backtrace_max}"
+
+    def frame_command(self, level):
+        """frame-snapshot of an outer frame: no backtrace, the current step already has it."""
+        return f"frame-snapshot {self.summary_bytes} {self.preview} {int(self.bulk_reads)} 0 {level}"
+
+    def stop_debugging(self):
+        try:
+            if self.controller:
+                get_gdb_pool().release(self.controller)
+                self.controller = None
+                self.checkpoints = {}
+                if self.heap_ring is not None:
+                    self.heap_ring.close()
+                    self.heap_ring = None
+                self.close_memory()
+
+                if self.workspace:
+                    self.workspace.cleanup()
+
+                return {"message": "Debugging session ended successfully."}
+
+            return {"error": "No active debugging session found."}
+
+        except Exception as e:
+            return {"error": str(e)}
+
+
+class TraceSession:
+    """
+    Record-once debugging session.
+
+    start_debugging runs the whole program under a GDB/MI session in one go,
+    recording the response of every step (up to TRACE_STEP_LIMIT) into its
+    history, and then gives gdb back. Steps are then only replayed from the
+    history, so a viewer holds no gdb process or inferior however long they
+    keep the tab open.
+    """
+
+    def __init__(self, session_id, step_limit=None):
+        self.session_id = session_id
+        self.step_limit = step_limit or getattr(settings, 'TRACE_STEP_LIMIT', 1000)
+        # Sized to hold the whole trace; nothing could re-create dropped steps
+        self.history = StepHistory(
+            keyframe_interval=getattr(settings, 'DEBUG_HISTORY_KEYFRAME_INTERVAL', 16),
+            max_steps=self.step_limit,
+        )
+        self.truncated = False
+        self.delta_encoder = MemoryDeltaEncoder()
+        self.lock = threading.Lock()  # See session_manager.hold
+
+    @property
+    def gdb_pid(self):
+        return None  # No process is held after recording
+
+    def start_debugging(self, c_code):
+        recorder = MIGDBSession(self.session_id)
+        recorder.history = StepHistory(max_steps=1)  # The trace is kept here, not twice
+        response = recorder.start_debugging(c_code)
+        try:
+            if "error" in response:
+                return response
+            self.history.record(response)
+            while response.get("status") == "running" and len(self.history) < self.step_limit:
+                response = recorder.step_forward()
+                if "error" in response:
+                    break
+                self.history.record(response)
+        finally:
+            recorder.stop_debugging()
+
+        last = self.history.get(self.history.last_step)
+        self.truncated = last.get("status") == "running"
+        first = self.history.move_to(self.history.first_step)
+        return dict(first, trace_length=len(self.history), truncated=self.truncated)
+
+    def step_forward(self, kind="over"):
+        if not len(self.history):
+            return {"error": "Debugging session not started."}
+        if kind != "over":
+            return {"error": "A recorded trace can only be stepped line by line."}
+        if self.history.at_head():
+            return {
+                "current_line": None,
+                "function_name": None,
+                "memory_state": {},
+                "status": "completed"
+            }
+        return self.history.forward()
+
+    def rewind_to(self, step):
+        """Nothing is running; rewinding is just moving through the recording."""
+        return self.history.move_to(step)
+
+    def stop_debugging(self):
+        if not len(self.history):
+            return {"error": "No active debugging session found."}
+        self.history = StepHistory(max_steps=1)
+        return {"message": "Debugging session ended successfully."}
+
+
+GDB_BACKENDS = {
+    "console": GDBSession,
+    "mi": MIGDBSession,
+    "trace": TraceSession,
+}
+
+
+def create_gdb_session(session_id, mode=None):
+    """
+    Creates a session for the requested mode ("console", "mi" or "trace"),
+    defaulting to the backend selected by settings.GDB_BACKEND.
+    """
+    backend = mode if mode in GDB_BACKENDS else getattr(settings, 'GDB_BACKEND', 'mi')
+    return GDB_BACKENDS[backend](session_id)
+
+def _busy_as_error(function):
+    """Makes a session call answer {"error": ...}, like other session errors, when the session stays locked."""
+    if asyncio.iscoroutinefunction(function):
+        @functools.wraps(function)
+        async def wrapper(*args, **kwargs):
+            try:
+                return await function(*args, **kwargs)
+            except SessionBusy as busy:
+                return {"error": str(busy)}
+    else:
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            try:
+                return function(*args, **kwargs)
+            except SessionBusy as busy:
+                return {"error": str(busy)}
+    return wrapper
+
+def start_session(session_id, c_code, owner=None, mode=None):
+    session = create_gdb_session(session_id, mode)
+    with hold(session):
+        # Replaces (and stops) any session this browser already had
+        get_session_manager().add(session_id, session, owner=owner)
+        return session.delta_encoder.encode(session.start_debugging(c_code))
+
+@_busy_as_error
+def step_session(session_id, delta=False, seq=None, kind="over"):
+    """
+    Steps a session ("over", "into" or "out", see MIGDBSession.step_forward).
+    With delta=True, and seq matching the last step the client has,
+    memory_state is replaced by a memory_delta against it. Back in the
+    history, the next recorded step is shown whatever the kind.
+    """
+    session = get_session_manager().get(session_id)
+    if session:
+        with hold(session):
+            if session.history.at_head():
+                response = session.step_forward(kind)
+            else:
+                # Back in the history: replay recorded steps until caught up with gdb
+                response = session.history.forward()
+            return session.delta_encoder.encode(response, delta=delta, client_seq=seq)
+    return {"error": "Session not available."}
+
+async def astart_session(session_id, c_code, owner=None, mode=None):
+    """Async counterpart of start_session."""
+    session = create_gdb_session(session_id, mode)
+    async with ahold(session):
+        # Adding may stop replaced sessions, which talks to their gdb
+        await sync_to_async(get_session_manager().add, thread_sensitive=False)(session_id, session, owner=owner)
+        if hasattr(session, 'astart_debugging'):
+            response = await session.astart_debugging(c_code)
+        else:
+            response = await sync_to_async(session.start_debugging, thread_sensitive=False)(c_code)
+        return session.delta_encoder.encode(response)
+
+@_busy_as_error
+async def astep_session(session_id, delta=False, seq=None, kind="over"):
+    """Async counterpart of step_session."""
+    session = get_session_manager().get(session_id)
+    if session:
+        async with ahold(session):
+            if not session.history.at_head():
+                response = session.history.forward()
+            elif hasattr(session, 'astep_forward'):
+                response = await session.astep_forward(kind)
+            else:
+                response = await sync_to_async(session.step_forward, thread_sensitive=False)(kind)
+            return session.delta_encoder.encode(response, delta=delta, client_seq=seq)
+    return {"error": "Session not available."}
+
+@_busy_as_error
+def back_session(session_id, delta=False, seq=None):
+    """Shows the previous step from the session's history, without touching gdb."""
+    session = get_session_manager().get(session_id)
+    if session:
+        with hold(session):
+            return session.delta_encoder.encode(session.history.back(), delta=delta, client_seq=seq)
+    return {"error": "Session not available."}
+
+@_busy_as_error
+def goto_session(session_id, step, delta=False, seq=None):
+    """Shows any step still held in the session's history, without touching gdb."""
+    session = get_session_manager().get(session_id)
+    if session:
+        with hold(session):
+            return session.delta_encoder.encode(session.history.move_to(step), delta=delta, client_seq=seq)
+    return {"error": "Session not available."}
+
+@_busy_as_error
+def rewind_session(session_id, line=None, delta=False, seq=None):
+    """
+    Rewinds the program itself, unlike back_session: to the step before the
+    one shown, or with line, to the last step before it that stopped on line.
+    Later steps are re-executed (and re-recorded) when stepping forward again.
+    """
+    session = get_session_manager().get(session_id)
+    if not session:
+        return {"error": "Session not available."}
+    if not hasattr(session, 'rewind_to'):
+        return {"error": "Reverse stepping needs the 'mi' or 'trace' debugging mode."}
+
+    with hold(session):
+        if line is None:
+            target = session.history.cursor - 1
+        else:
+            target = session.history.find_line(line, before=session.history.cursor)
+            if target is None:
+                return {"error": f"Line {line} was not reached before this step."}
+        return session.delta_encoder.encode(session.rewind_to(target), delta=delta, client_seq=seq)
+
+@_busy_as_error
+def resync_session(session_id):
+    """Returns the current step in full, without stepping."""
+    session = get_session_manager().get(session_id)
+    if session:
+        with hold(session):
+            return session.delta_encoder.snapshot()
+    return {"error": "Session not available."}
+
+@_busy_as_error
+def elements_session(session_id, variable, start=0, count=None):
+    """Reads a range of an array local of the session's current step (see MIGDBSession.read_elements)."""
+    session = get_session_manager().get(session_id)
+    if not session:
+        return {"error": "Session not available."}
+    if not hasattr(session, 'read_elements'):
+        return {"error": "Reading array elements needs the 'mi' debugging mode."}
+    with hold(session):
+        return session.read_elements(variable, start, count if count is not None else session.page_max)
+
+@_busy_as_error
+def frame_session(session_id, level):
+    """Locals of one frame of the session's current backtrace (see MIGDBSession.frame_locals)."""
+    session = get_session_manager().get(session_id)
+    if not session:
+        return {"error": "Session not available."}
+    if not hasattr(session, 'frame_locals'):
+        return {"error": "A recorded trace has no frames to read."}
+    with hold(session):
+        return session.frame_locals(level)
+
+@_busy_as_error
+def memory_session(session_id, address=None, length=None):
+    """Hexdump of the session's stopped program (see MIGDBSession.dump_memory)."""
+    session = get_session_manager().get(session_id)
+    if not session:
+        return {"error": "Session not available."}
+    if not hasattr(session, 'dump_memory'):
+        return {"error": "Reading memory needs the 'mi' debugging mode."}
+    with hold(session):
+        return session.dump_memory(address, length)
+
+def stop_session(session_id):
+    session = get_session_manager().pop(session_id)
+    if session:
+        return stop_when_idle(session)
+    return {"error": "Session not available."}
+
+# The *_debugging_session functions serve a request either in this process or,
+# when DEBUG_SESSION_BROKER_SOCKETS is set, through the session broker.
 
 def start_debugging_session(request):
-    session_id = request.session.session_key or request.session.save()
+    if not request.session.session_key:
+        request.session.save()
+    session_id = request.session.session_key
+    data = json.loads(request.body)
+    c_code = data.get('c_code', '')
+    mode = data.get('mode')
+
+    broker = get_broker_client()
+    if broker:
+        return broker.call("start", session_id, c_code=c_code, owner=session_owner(request), mode=mode)
+    return start_session(session_id, c_code, owner=session_owner(request), mode=mode)
+
+def _delta_options(data):
+    return {"delta": bool(data.get('delta', False)), "seq": data.get('seq')}
+
+async def astart_debugging_session(request):
+    """Async counterpart of start_debugging_session."""
+    if not request.session.session_key:
+        await sync_to_async(request.session.save)()
+    session_id = request.session.session_key
     data = json.loads(request.body)
     c_code = data.get('c_code', '')
+    mode = data.get('mode')
 
-    session = GDBSession(session_id)
-    gdb_sessions[session_id] = session
-    print(gdb_sessions)
-    return session.start_debugging(c_code)
+    broker = get_broker_client()
+    if broker:
+        return await sync_to_async(broker.call, thread_sensitive=False)(
+            "start", session_id, c_code=c_code, owner=session_owner(request), mode=mode
+        )
+    return await astart_session(session_id, c_code, owner=session_owner(request), mode=mode)
 
 def step_forward_session(request):
     session_id = request.session.session_key
-    session = gdb_sessions.get(session_id)
-    if session:
-        return session.step_forward()
-    return {"error": "Session not available."}
+    data = json.loads(request.body or b'{}')
+    options = dict(_delta_options(data), kind=data.get('kind', 'over'))
+
+    broker = get_broker_client()
+    if broker:
+        return broker.call("step", session_id, **options)
+    return step_session(session_id, **options)
+
+async def astep_forward_session(request):
+    """Async counterpart of step_forward_session."""
+    session_id = request.session.session_key
+    data = json.loads(request.body or b'{}')
+    options = dict(_delta_options(data), kind=data.get('kind', 'over'))
+
+    broker = get_broker_client()
+    if broker:
+        return await sync_to_async(broker.call, thread_sensitive=False)("step", session_id, **options)
+    return await astep_session(session_id, **options)
+
+def step_back_session(request):
+    session_id = request.session.session_key
+    options = _delta_options(json.loads(request.body or b'{}'))
+
+    broker = get_broker_client()
+    if broker:
+        return broker.call("back", session_id, **options)
+    return back_session(session_id, **options)
+
+def goto_step_session(request):
+    session_id = request.session.session_key
+    data = json.loads(request.body or b'{}')
+    try:
+        step = int(data.get('step'))
+    except (TypeError, ValueError):
+        return {"error": "A step number is required."}
+    options = _delta_options(data)
+
+    broker = get_broker_client()
+    if broker:
+        return broker.call("goto", session_id, step=step, **options)
+    return goto_session(session_id, step, **options)
+
+def step_backward_session(request):
+    session_id = request.session.session_key
+    options = _delta_options(json.loads(request.body or b'{}'))
+
+    broker = get_broker_client()
+    if broker:
+        return broker.call("rewind", session_id, **options)
+    return rewind_session(session_id, **options)
+
+def run_back_to_line_session(request):
+    session_id = request.session.session_key
+    data = json.loads(request.body or b'{}')
+    try:
+        line = int(data.get('line'))
+    except (TypeError, ValueError):
+        return {"error": "A line number is required."}
+    options = _delta_options(data)
+
+    broker = get_broker_client()
+    if broker:
+        return broker.call("rewind", session_id, line=line, **options)
+    return rewind_session(session_id, line=line, **options)
+
+def resync_debugging_session(request):
+    session_id = request.session.session_key
+    broker = get_broker_client()
+    if broker:
+        return broker.call("resync", session_id)
+    return resync_session(session_id)
+
+def array_elements_session(request):
+    session_id = request.session.session_key
+    data = json.loads(request.body or b'{}')
+    variable = data.get('variable')
+    if not variable:
+        return {"error": "A variable name is required."}
+    try:
+        start = int(data.get('start', 0))
+        count = int(data['count']) if data.get('count') is not None else None
+    except (TypeError, ValueError):
+        return {"error": "start and count must be numbers."}
+
+    broker = get_broker_client()
+    if broker:
+        return broker.call("elements", session_id, variable=variable, start=start, count=count)
+    return elements_session(session_id, variable, start, count)
+
+def frame_locals_session(request):
+    session_id = request.session.session_key
+    data = json.loads(request.body or b'{}')
+    try:
+        level = int(data.get('level'))
+    except (TypeError, ValueError):
+        return {"error": "A frame level is required."}
+
+    broker = get_broker_client()
+    if broker:
+        return broker.call("frame", session_id, level=level)
+    return frame_session(session_id, level)
+
+def memory_dump_session(request):
+    session_id = request.session.session_key
+    data = json.loads(request.body or b'{}')
+    try:
+        address = int(str(data['address']), 0) if data.get('address') is not None else None
+        length = int(data['length']) if data.get('length') is not None else None
+    except (TypeError, ValueError):
+        return {"error": "address and length must be numbers."}
+
+    broker = get_broker_client()
+    if broker:
+        return broker.call("memory", session_id, address=address, length=length)
+    return memory_session(session_id, address, length)
 
 def stop_debugging_session(request):
     session_id = request.session.session_key
-    session = gdb_sessions.pop(session_id, None)
-    if session:
-        return session.stop_debugging()
-    return {"error": "Session not available."}
+    broker = get_broker_client()
+    if broker:
+        return broker.call("stop", session_id)
+    return stop_session(session_id)
+
+async def astop_debugging_session(request):
+    """Async counterpart of stop_debugging_session; stopping resets a pooled gdb, so it runs in a thread."""
+    return await sync_to_async(stop_debugging_session, thread_sensitive=False)(request)
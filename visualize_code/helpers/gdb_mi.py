@@ -0,0 +1,398 @@
+"""
+GDB/MI (machine interface) support.
+
+parse_mi_record() turns one line of `gdb --interpreter=mi3` output into a
+dict, and MIController drives a gdb process over pipes, matching every
+command to its result record by token instead of waiting for prompts.
+"""
+import asyncio
+import itertools
+import queue
+import re
+import subprocess
+import threading
+import time
+
+from .metrics import get_histogram
+
+_TOKEN_RE = re.compile(r'\d*')
+_CLASS_RE = re.compile(r'[\w-]+')
+_VARIABLE_RE = re.compile(r'[\w-]+')
+_CSTRING_RE = re.compile(r'"((?:[^"\\]|\\.)*)"')
+_CSTRING_ESCAPE_RE = re.compile(r'\\([0-7]{1,3}|.)')
+
+_SIMPLE_ESCAPES = {
+    'n': '\n', 't': '\t', 'r': '\r', 'a': '\a', 'b': '\b',
+    'f': '\f', 'v': '\v', 'e': '\x1b', '"': '"', '\\': '\\', "'": "'",
+}
+
+_ASYNC_TYPES = {'*': 'exec', '+': 'status', '=': 'notify'}
+_STREAM_TYPES = {'~': 'console', '@': 'target', '&': 'log'}
+
+
+class MIError(Exception):
+    """Raised for ^error results and for a gdb process that has gone away."""
+
+
+class MITimeout(MIError):
+    """Raised when gdb does not answer within the allotted time."""
+
+
+class _Parser:
+    """Recursive-descent parser for the MI output grammar, one line at a time."""
+
+    def __init__(self, text):
+        self.text = text
+        self.pos = 0
+
+    def peek(self):
+        return self.text[self.pos] if self.pos < len(self.text) else ''
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"expected {char!r} at {self.pos} in {self.text!r}")
+        self.pos += 1
+
+    def match(self, pattern):
+        found = pattern.match(self.text, self.pos)
+        self.pos = found.end()
+        return found.group(0)
+
+    def results(self):
+        results = {}
+        while self.peek() == ',':
+            self.pos += 1
+            name, value = self.result()
+            results[name] = value
+        return results
+
+    def result(self):
+        name = self.match(_VARIABLE_RE)
+        self.expect('=')
+        return name, self.value()
+
+    def value(self):
+        char = self.peek()
+        if char == '"':
+            return self.cstring()
+        if char == '{':
+            return self.tuple()
+        if char == '[':
+            return self.list()
+        raise ValueError(f"unexpected {char!r} at {self.pos} in {self.text!r}")
+
+    def tuple(self):
+        self.expect('{')
+        values = {}
+        if self.peek() == '}':
+            self.pos += 1
+            return values
+        while True:
+            name, value = self.result()
+            values[name] = value
+            if self.peek() == ',':
+                self.pos += 1
+                continue
+            self.expect('}')
+            return values
+
+    def list(self):
+        self.expect('[')
+        values = []
+        if self.peek() == ']':
+            self.pos += 1
+            return values
+        while True:
+            # Lists hold either bare values or name=value results
+            if self.peek() in '"{[':
+                values.append(self.value())
+            else:
+                values.append(dict([self.result()]))
+            if self.peek() == ',':
+                self.pos += 1
+                continue
+            self.expect(']')
+            return values
+
+    def cstring(self):
+        found = _CSTRING_RE.match(self.text, self.pos)
+        if not found:
+            raise ValueError(f"bad string at {self.pos} in {self.text!r}")
+        self.pos = found.end()
+        return unescape_cstring(found.group(1))
+
+
+def unescape_cstring(raw):
+    """Decode the C escapes gdb uses in MI strings, including octal bytes."""
+    if '\\' not in raw:
+        return raw
+
+    def replace(match):
+        escape = match.group(1)
+        if escape[0] in '01234567':
+            return chr(int(escape, 8))
+        return _SIMPLE_ESCAPES.get(escape, escape)
+
+    decoded = _CSTRING_ESCAPE_RE.sub(replace, raw)
+    # Octal escapes are raw bytes; re-interpret them as UTF-8 where possible
+    try:
+        return decoded.encode('latin-1').decode('utf-8')
+    except (UnicodeEncodeError, UnicodeDecodeError):
+        return decoded
+
+
+def parse_mi_record(line):
+    """
+    Parses a single line of GDB/MI output.
+
+    Args:
+        line (str): One line as printed by gdb, without the trailing newline.
+
+    Returns:
+        dict: One of
+            - {"type": "prompt"} for the "(gdb)" terminator,
+            - {"type": "result", "token", "class", "results"} for ^ records,
+            - {"type": "exec"/"status"/"notify", "token", "class", "results"} for async records,
+            - {"type": "console"/"target"/"log", "payload"} for stream records,
+            - {"type": "unknown", "payload"} for anything else (e.g. stray inferior output).
+    """
+    line = line.rstrip('\r\n')
+    if line.strip() == '(gdb)':
+        return {"type": "prompt"}
+
+    try:
+        parser = _Parser(line)
+        token = parser.match(_TOKEN_RE)
+        marker = parser.peek()
+        if marker in _STREAM_TYPES and not token:
+            parser.pos += 1
+            return {"type": _STREAM_TYPES[marker], "payload": parser.cstring()}
+        if marker == '^' or marker in _ASYNC_TYPES:
+            parser.pos += 1
+            record_class = parser.match(_CLASS_RE)
+            results = parser.results()
+            return {
+                "type": 'result' if marker == '^' else _ASYNC_TYPES[marker],
+                "token": int(token) if token else None,
+                "class": record_class,
+                "results": results,
+            }
+    except ValueError:
+        pass
+    return {"type": "unknown", "payload": line}
+
+
+def mi_quote(text):
+    """Quotes text as an MI c-string argument."""
+    return '"' + text.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def _resolve(future, result=None):
+    if not future.done():
+        future.set_result(result)
+
+
+def _resolve_threadsafe(loop, future, result=None):
+    try:
+        loop.call_soon_threadsafe(_resolve, future, result)
+    except RuntimeError:
+        pass  # The waiting event loop is already closed
+
+
+class _PendingCommand:
+    def __init__(self, loop=None):
+        self.done = threading.Event()
+        self.record = None
+        self.console = []
+        self.loop = loop
+        self.future = loop.create_future() if loop is not None else None
+
+    def finish(self):
+        """Wakes the waiter, a thread on done or a coroutine on future."""
+        self.done.set()
+        if self.future is not None:
+            _resolve_threadsafe(self.loop, self.future)
+
+
+class MIController:
+    """
+    Drives one `gdb --interpreter=mi3` process over pipes.
+
+    A reader thread parses every record as it arrives. Each command is sent
+    with a unique numeric token and the caller blocks on an Event that is set
+    the moment the matching ^result record is read, so a round trip costs
+    exactly as long as gdb takes to answer. *stopped records are delivered
+    through a queue for execution commands such as -exec-next.
+
+    acommand/aconsole/aexecute are the awaitable counterparts: the reader
+    thread resolves an asyncio future instead, so no thread waits on gdb.
+    """
+
+    def __init__(self, gdb_path='gdb', cwd=None, timeout=10):
+        self.timeout = timeout
+        self.uses = 0  # Sessions served, for GDBPool recycling
+        self.process = subprocess.Popen(
+            [gdb_path, '--interpreter=mi3', '--quiet', '--nx'],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            cwd=cwd,
+        )
+        self._tokens = itertools.count(1)
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._current = None
+        self.latency = get_histogram("gdb_mi_command")
+        self.stops = queue.Queue()
+        self._stop_waiter = None  # (event loop, future) of a pending aexecute
+        self.exited = threading.Event()
+        self.reader = threading.Thread(target=self._read_loop, daemon=True)
+        self.reader.start()
+
+    def command(self, command, timeout=None):
+        """
+        Sends an MI command and waits for its result record.
+
+        Returns:
+            tuple: (results dict, console output printed while the command ran).
+
+        Raises:
+            MIError: gdb answered ^error or has exited.
+            MITimeout: no answer within the timeout.
+        """
+        pending = _PendingCommand()
+        with self._send_lock:
+            token = self._send(command, pending)
+            start = time.perf_counter()
+            if not pending.done.wait(timeout or self.timeout):
+                with self._pending_lock:
+                    self._pending.pop(token, None)
+                raise MITimeout(f"Timed out waiting for GDB to answer {command!r}.")
+            self.latency.record(time.perf_counter() - start)
+        return self._result(pending)
+
+    async def acommand(self, command, timeout=None):
+        """Awaitable counterpart of command()."""
+        pending = _PendingCommand(asyncio.get_running_loop())
+        if not self._send_lock.acquire(blocking=False):
+            # Only hops to a thread when another caller is mid-command
+            await asyncio.to_thread(self._send_lock.acquire)
+        try:
+            token = self._send(command, pending)
+            start = time.perf_counter()
+            try:
+                await asyncio.wait_for(asyncio.shield(pending.future), timeout or self.timeout)
+            except asyncio.TimeoutError:
+                with self._pending_lock:
+                    self._pending.pop(token, None)
+                raise MITimeout(f"Timed out waiting for GDB to answer {command!r}.")
+            self.latency.record(time.perf_counter() - start)
+        finally:
+            self._send_lock.release()
+        return self._result(pending)
+
+    def _send(self, command, pending):
+        """Registers pending under a fresh token and writes the command. Call with _send_lock held."""
+        if self.exited.is_set():
+            raise MIError("GDB process has exited.")
+        token = next(self._tokens)
+        with self._pending_lock:
+            self._pending[token] = pending
+            self._current = pending
+        try:
+            self.process.stdin.write(f"{token}{command}\n".encode('utf-8'))
+            self.process.stdin.flush()
+        except OSError as e:
+            raise MIError(f"Failed to send command to GDB: {e}")
+        return token
+
+    def _result(self, pending):
+        record = pending.record
+        if record is None:
+            raise MIError("GDB process has exited.")
+        if record["class"] == 'error':
+            raise MIError(record["results"].get("msg", "GDB reported an error."))
+        return record["results"], "".join(pending.console)
+
+    def console(self, command, timeout=None):
+        """Runs a CLI command through MI and returns its console output."""
+        return self.command(f'-interpreter-exec console {mi_quote(command)}', timeout)[1]
+
+    async def aconsole(self, command, timeout=None):
+        return (await self.acommand(f'-interpreter-exec console {mi_quote(command)}', timeout))[1]
+
+    def execute(self, command, timeout=None):
+        """
+        Runs an execution command (-exec-run, -exec-next, ...) and waits for
+        the inferior to stop again.
+
+        Returns:
+            dict: The results of the *stopped record (reason, frame, ...).
+        """
+        while not self.stops.empty():
+            self.stops.get_nowait()
+        self.command(command, timeout)
+        try:
+            return self.stops.get(timeout=timeout or self.timeout)
+        except queue.Empty:
+            raise MITimeout(f"Timed out waiting for the program to stop after {command!r}.")
+
+    async def aexecute(self, command, timeout=None):
+        """Awaitable counterpart of execute()."""
+        loop = asyncio.get_running_loop()
+        while not self.stops.empty():
+            self.stops.get_nowait()
+        waiter = loop.create_future()
+        self._stop_waiter = (loop, waiter)
+        try:
+            await self.acommand(command, timeout)
+            try:
+                return await asyncio.wait_for(waiter, timeout or self.timeout)
+            except asyncio.TimeoutError:
+                raise MITimeout(f"Timed out waiting for the program to stop after {command!r}.")
+        finally:
+            self._stop_waiter = None
+
+    def close(self):
+        """Asks gdb to exit and kills it if it does not."""
+        if self.process.poll() is None:
+            try:
+                self.process.stdin.write(b"-gdb-exit\n")
+                self.process.stdin.flush()
+                self.process.wait(timeout=2)
+            except (OSError, subprocess.TimeoutExpired):
+                self.process.kill()
+                self.process.wait()
+        self.reader.join(timeout=2)
+
+    def _read_loop(self):
+        for raw_line in self.process.stdout:
+            record = parse_mi_record(raw_line.decode('utf-8', errors='replace'))
+            record_type = record["type"]
+            if record_type == 'result':
+                with self._pending_lock:
+                    pending = self._pending.pop(record["token"], None)
+                if pending is not None:
+                    pending.record = record
+                    pending.finish()
+            elif record_type == 'console':
+                current = self._current
+                if current is not None:
+                    current.console.append(record["payload"])
+            elif record_type == 'exec' and record["class"] == 'stopped':
+                self._deliver_stop(record["results"])
+
+        # gdb is gone: wake everybody still waiting
+        self.exited.set()
+        with self._pending_lock:
+            pending_commands = list(self._pending.values())
+            self._pending.clear()
+        for pending in pending_commands:
+            pending.finish()
+        self._deliver_stop({"reason": "gdb-exited"})
+
+    def _deliver_stop(self, results):
+        waiter, self._stop_waiter = self._stop_waiter, None
+        if waiter is not None:
+            _resolve_threadsafe(*waiter, results)
+        else:
+            self.stops.put(results)
@@ -0,0 +1,93 @@
+"""
+Single-pass tokenizer for gdb console output.
+
+Every pattern is compiled once at import and runs over the whole output in
+MULTILINE mode, so the scanning happens inside the regex engine instead of
+in a Python loop over splitlines(). The hot paths (info locals dumps and
+source listings) have their own patterns that only match the lines they
+want; tokenize() classifies every line with one alternation, reading the
+line's kind off the match's lastgroup:
+
+    SOURCE   "5\tint x = 10;"                  source listing (line_no, source)
+    HISTORY  "$1 = (int *) 0x7ffc10"           value history (history_value)
+    LOCAL    "x = 10"                          info locals / info args (name, value)
+    FRAME    "main () at test_temp.c:5"        frame line (function, file, line)
+    OTHER    anything else
+
+Captured values may keep trailing whitespace; callers strip what they use.
+"""
+from collections import namedtuple
+import re
+
+# Prompts gdb echoes in front of a line
+PROMPTS = r'(?:\(gdb\)\ *)*'
+
+CONSOLE_RE = re.compile(r'''
+    ^''' + PROMPTS + r'''
+    (?:
+        (?P<SOURCE>(?P<line_no>\d+)[\t\ ]+(?P<source>[^\n]*))
+      | (?P<HISTORY>\$\d+\ =\ (?P<history_value>[^\n]*))
+      | (?P<LOCAL>(?P<name>[A-Za-z_]\w*)\ =\ (?P<value>[^\n]*))
+      | (?P<FRAME>(?:Breakpoint\ \d+,\ |\#\d+[\t\ ]+(?:0x[0-9a-fA-F]+\ in\ )?)?
+            (?P<function>[A-Za-z_]\w*)\ \([^\n]*\)\ at\ (?P<file>[^\s:]+):(?P<line>\d+))
+      | (?P<OTHER>[^\n]*)
+    )$
+''', re.MULTILINE | re.VERBOSE)
+
+LOCALS_RE = re.compile(r'^' + PROMPTS + r'([A-Za-z_]\w*) = ([^\n]*)', re.MULTILINE)
+
+# Source lines declaring a pointer, an array or a scalar, the declarations parse_gdb_output handles
+SOURCE_DECLARATION_RE = re.compile(r'''
+    ^''' + PROMPTS + r'''[\t\ ]*(?P<line_no>\d+)[\t\ ]+
+    (?:
+        (?P<pointer_type>int|float|char|double|long|short)[\t\ ]*\*[\t\ ]*(?P<pointer>\w+)[\t\ ]*=[\t\ ]*(?P<target>[^;\n]+)
+      | (?P<array_type>int|float|char)[\t\ ]+(?P<array>\w+)[\t\ ]*\[(?P<extent>\d*)\][\t\ ]*=[\t\ ]*
+            \{[\t\ ]*(?P<elements>[^}\n]*?)[\t\ ]*\}
+      | (?P<scalar_type>int|float|char)[\t\ ]+(?P<scalar>\w+)[\t\ ]*=[\t\ ]*(?P<value>[^\n]+)
+    );[\t\ ]*$
+''', re.MULTILINE | re.VERBOSE)
+
+# Source lines read_gdb_output treats as statements worth reporting
+STATEMENT_RE = re.compile(
+    r'^\s*\d+\s+(int|float|char|double|long|short)\s+\w+\[.*\]\s*=\s*{.*};|'
+    r'^\s*\d+\s+(int|float|char|double|long|short)\s+\w+\[.*\];|'
+    r'^\s*\d+\s+(int|float|char|double|long|short)\s+\w+\s*=\s*[^;]+;|'
+    r'^\s*\d+\s+\w+\s*=\s*.+;|'
+    r'^\s*\d+\s+(int|float|char|double|long|short)\s*\*\s*\w+\s*=\s*[^;]+;|'
+    r'^\s*\d+\s+(int|float|char|double|long|short)\s*\*\s*\w+\s*;|'
+    r'^\s*\d+\s+.*;$'
+)
+FUNCTION_NAME_RE = re.compile(r'(?<=in\s)(\w+)\s*(?=\()')
+
+Token = namedtuple('Token', ['kind', 'match'])
+
+
+def tokenize(output):
+    """
+    Classifies every line of gdb console output in one pass.
+
+    Args:
+        output (str): Text gdb printed, any number of lines.
+
+    Yields:
+        Token: (kind, match); the match's named groups hold the line's fields.
+    """
+    for match in CONSOLE_RE.finditer(output):
+        if match.start() == len(output):
+            break  # The empty match after a trailing newline
+        yield Token(match.lastgroup, match)
+
+
+def parse_locals(output):
+    """
+    Every `name = value` line, as printed by info locals or info args.
+
+    Returns:
+        list: (name, value) tuples in output order.
+    """
+    return LOCALS_RE.findall(output)
+
+
+def iter_declarations(output):
+    """Yields a match per declaring source line; the pointer_*, array_* or scalar_* groups are set."""
+    return SOURCE_DECLARATION_RE.finditer(output)
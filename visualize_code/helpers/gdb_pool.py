@@ -0,0 +1,197 @@
+from django.conf import settings
+from .gdb_mi import MIController, MIError, mi_quote
+from .heap_tracker import RING_ENV
+from .sandbox import PRELOAD_ENV
+import collections
+import os
+import threading
+
+FRAME_SNAPSHOT_SCRIPT = os.path.join(os.path.dirname(__file__), 'gdb_scripts', 'frame_snapshot.py')
+
+# Applied once when a gdb process is created, before it is handed to any session
+WARMUP_COMMANDS = (
+    "-gdb-set confirm off",
+    "-gdb-set pagination off",
+    "-gdb-set width 0",
+)
+
+
+class GDBPool:
+    """
+    Pool of idle, already initialised `gdb --interpreter=mi3` processes.
+
+    Starting gdb, applying settings and loading the frame-snapshot script
+    happen ahead of time on a background thread, so a new session only has
+    to load its binary. Processes are health-checked before reuse and
+    retired after max_uses sessions.
+    """
+
+    def __init__(self, size, max_uses, gdb_path='gdb', timeout=10):
+        self.size = size
+        self.max_uses = max_uses
+        self.gdb_path = gdb_path
+        self.timeout = timeout
+        self._idle = collections.deque()
+        self._lock = threading.Lock()
+        self._filling = False
+        self.created = 0
+        self.reused = 0
+        self.cold_starts = 0
+        self.recycled = 0
+        self.unhealthy = 0
+
+    def acquire(self, cwd):
+        """
+        Hands out a ready gdb with its working directory set to cwd.
+        Falls back to starting one on the spot when the pool is empty.
+        """
+        controller = None
+        while controller is None:
+            with self._lock:
+                candidate = self._idle.popleft() if self._idle else None
+            if candidate is None:
+                with self._lock:
+                    self.cold_starts += 1
+                controller = self._create()
+            elif self._healthy(candidate):
+                with self._lock:
+                    self.reused += 1
+                controller = candidate
+            else:
+                with self._lock:
+                    self.unhealthy += 1
+                candidate.close()
+
+        self.fill_async()
+        controller.uses += 1
+        try:
+            controller.command(f'-environment-cd {mi_quote(cwd)}')
+        except MIError:
+            controller.close()
+            raise
+        return controller
+
+    def release(self, controller):
+        """Takes a gdb back after a session, resetting it or retiring it."""
+        if controller.uses >= self.max_uses or not self._reset(controller):
+            with self._lock:
+                self.recycled += 1
+            controller.close()
+            self.fill_async()
+            return
+
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append(controller)
+                controller = None
+        if controller is not None:
+            controller.close()
+
+    def fill_async(self):
+        """Starts a background thread topping the pool up to size, if not already running."""
+        with self._lock:
+            if self._filling or len(self._idle) >= self.size:
+                return
+            self._filling = True
+        threading.Thread(target=self._fill, daemon=True).start()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": self.size,
+                "idle": len(self._idle),
+                "created": self.created,
+                "reused": self.reused,
+                "cold_starts": self.cold_starts,
+                "recycled": self.recycled,
+                "unhealthy": self.unhealthy,
+                "max_uses": self.max_uses,
+            }
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = list(self._idle), collections.deque()
+        for controller in idle:
+            controller.close()
+
+    def _fill(self):
+        try:
+            while True:
+                with self._lock:
+                    if len(self._idle) >= self.size:
+                        return
+                try:
+                    controller = self._create()
+                except (OSError, MIError) as e:
+                    print(f"Failed to pre-start GDB: {e}")
+                    return
+                with self._lock:
+                    if len(self._idle) < self.size:
+                        self._idle.append(controller)
+                        controller = None
+                if controller is not None:
+                    # A released process filled the slot while we were starting this one
+                    controller.close()
+                    return
+        finally:
+            with self._lock:
+                self._filling = False
+
+    def _create(self):
+        controller = MIController(gdb_path=self.gdb_path, timeout=self.timeout)
+        try:
+            for command in WARMUP_COMMANDS:
+                controller.command(command)
+            controller.console(f"source {FRAME_SNAPSHOT_SCRIPT}")
+        except MIError:
+            controller.close()
+            raise
+        with self._lock:
+            self.created += 1
+        return controller
+
+    def _healthy(self, controller):
+        if controller.exited.is_set() or controller.process.poll() is not None:
+            return False
+        try:
+            controller.command("-gdb-show confirm", timeout=2)
+        except MIError:
+            return False
+        return True
+
+    def _reset(self, controller):
+        """Kills the previous program and forgets its breakpoints and binary."""
+        if not self._healthy(controller):
+            return False
+        try:
+            try:
+                controller.console("kill")
+            except MIError:
+                pass  # No program was running
+            controller.command("-break-delete")
+            controller.command("-exec-arguments")
+            controller.command("-file-exec-and-symbols")
+            # The next session may not track its heap
+            controller.console(f"unset environment {PRELOAD_ENV}")
+            controller.console(f"unset environment {RING_ENV}")
+        except MIError:
+            return False
+        return True
+
+
+_gdb_pool = None
+_gdb_pool_lock = threading.Lock()
+
+
+def get_gdb_pool():
+    """Return the process-wide GDBPool configured from settings."""
+    global _gdb_pool
+    with _gdb_pool_lock:
+        if _gdb_pool is None:
+            _gdb_pool = GDBPool(
+                getattr(settings, 'GDB_POOL_SIZE', 2),
+                getattr(settings, 'GDB_POOL_MAX_USES', 20),
+                gdb_path=getattr(settings, 'GDB_PATH', 'gdb'),
+                timeout=getattr(settings, 'GDB_TIMEOUT', 10),
+            )
+        return _gdb_pool
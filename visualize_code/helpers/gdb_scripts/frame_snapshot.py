@@ -0,0 +1,195 @@
+"""
+gdb Python helper, loaded into gdb with `source`. Not importable from Django.
+
+Defines the `frame-snapshot` command, which prints the selected frame's
+function, line and every visible local/argument (name, type, value, address,
+size) as a single JSON line, so one round trip replaces `info locals` plus a
+`print &var` per variable.
+
+    frame-snapshot [SUMMARY_BYTES PREVIEW [RAW [BACKTRACE [LEVEL]]]]
+
+Arrays bigger than SUMMARY_BYTES are not formatted in full: their value is
+their first PREVIEW elements and the entry gets a "summary" with the
+array's length and element type, so the cost of a snapshot does not grow
+with array size.
+
+With RAW set to 1, variables in memory whose type is plain data (integers,
+chars, bools, floats, pointers, and arrays and structs of them) are not
+formatted at all: they come back with "raw": true and no value, and the
+server decodes them from one bulk read of the program's memory. The line
+then also carries the inferior's "pid" and the frame's address range.
+
+With BACKTRACE above 0, the line carries up to that many frames of the call
+stack, innermost first, as {"level", "function", "line", "id"}. A frame's id
+is its function and the caller's stack pointer, which stay the same for the
+whole call, so the server can cache what it read of a frame by id. Only the
+listed frames are unwound, however deep the recursion.
+
+LEVEL snapshots that frame of the stack (0 is the innermost) instead of
+the selected one, without selecting it.
+"""
+import json
+
+import gdb
+
+
+RAW_CODES = (gdb.TYPE_CODE_INT, gdb.TYPE_CODE_CHAR, gdb.TYPE_CODE_BOOL, gdb.TYPE_CODE_PTR)
+
+_raw_types = {}  # str(type) -> whether the server can decode it from memory
+
+
+def _is_raw(value_type, depth=8):
+    # Enums stay with gdb, which prints their enumerator names; unions, bit-fields
+    # and long double have no byte layout the server decodes.
+    value_type = value_type.strip_typedefs()
+    if depth <= 0:
+        return False
+    if value_type.code in RAW_CODES:
+        return True
+    if value_type.code == gdb.TYPE_CODE_FLT:
+        return value_type.sizeof in (4, 8)
+    if value_type.code == gdb.TYPE_CODE_ARRAY:
+        return value_type.sizeof > 0 and _is_raw(value_type.target(), depth - 1)
+    if value_type.code == gdb.TYPE_CODE_STRUCT:
+        return all(field.name and not field.bitsize and hasattr(field, "bitpos") and _is_raw(field.type, depth - 1)
+                   for field in value_type.fields())
+    return False
+
+
+def _raw(value_type):
+    key = str(value_type)
+    if key not in _raw_types:
+        _raw_types[key] = _is_raw(value_type)
+    return _raw_types[key]
+
+
+def _format(value):
+    return value.format_string() if hasattr(value, "format_string") else str(value)
+
+
+def _describe(symbol, frame, summary_bytes=0, preview=0, raw=False):
+    entry = {"name": symbol.name, "value": None, "address": None, "type": None, "size": None}
+    try:
+        value = symbol.value(frame)
+        entry["type"] = str(value.type)
+        entry["size"] = value.type.sizeof
+        if value.address is not None:
+            entry["address"] = hex(int(value.address))
+        # Values gdb would have to fetch from registers or that are optimized out are still formatted here
+        raw = raw and value.address is not None and not value.is_optimized_out and _raw(value.type)
+        array_type = value.type.strip_typedefs()
+        if summary_bytes and array_type.code == gdb.TYPE_CODE_ARRAY and entry["size"] > summary_bytes:
+            element = array_type.target()
+            length = entry["size"] // element.sizeof if element.sizeof else 0
+            shown = min(preview, length)
+            if not raw:
+                # Only the preview elements are read and formatted
+                elements = ", ".join(_format(value[index]) for index in range(shown))
+                entry["value"] = "{" + elements + ("...}" if shown < length else "}")
+            entry["summary"] = {"length": length, "element_type": str(element), "element_size": element.sizeof}
+        elif not raw:
+            entry["value"] = _format(value)
+        if raw:
+            entry["raw"] = True
+    except gdb.error as e:
+        entry["value"] = f"<error: {e}>"
+    return entry
+
+
+def _stack_pointer(frame):
+    try:
+        return int(frame.read_register("sp")) if frame is not None else None
+    except (gdb.error, ValueError):
+        return None
+
+
+def _frame_range(frame):
+    # From the stack pointer up to the caller's, which is where this frame's locals live
+    low = _stack_pointer(frame)
+    try:
+        high = _stack_pointer(frame.older())
+    except gdb.error:
+        return None
+    if low is None or high is None or high <= low:
+        return None
+    return {"low": hex(low), "high": hex(high)}
+
+
+def _backtrace(frame, limit):
+    frames = []
+    while frame is not None and len(frames) <= limit:  # One more than listed, for its stack pointer
+        frames.append(frame)
+        try:
+            frame = frame.older()
+        except gdb.error:  # A corrupt stack: list what could be unwound
+            break
+    backtrace = []
+    for level, current in enumerate(frames[:limit]):
+        older = frames[level + 1] if level + 1 < len(frames) else None
+        # The outermost frame (main, unless backtrace past-main is on) has no caller: its own sp will do
+        stack = _stack_pointer(older if older is not None else current)
+        sal = current.find_sal()
+        backtrace.append({
+            "level": level,
+            "function": current.name(),
+            "line": sal.line if sal.symtab is not None else None,
+            "id": f"{current.name()}:{hex(stack) if stack is not None else level}",
+        })
+    return backtrace, len(frames) > limit
+
+
+def frame_snapshot(frame, summary_bytes=0, preview=0, raw=False, backtrace=0):
+    variables = []
+    seen = set()
+    try:
+        block = frame.block()
+    except RuntimeError:  # No debug info for this frame
+        block = None
+
+    # Walk from the innermost lexical block out to the function body, like
+    # `info locals` does; inner declarations shadow outer ones.
+    while block is not None:
+        for symbol in block:
+            if not (symbol.is_variable or symbol.is_argument) or symbol.name in seen:
+                continue
+            seen.add(symbol.name)
+            variables.append(_describe(symbol, frame, summary_bytes, preview, raw))
+        if block.function is not None:
+            break
+        block = block.superblock
+
+    sal = frame.find_sal()
+    snapshot = {
+        "function": frame.name(),
+        "line": sal.line if sal.symtab is not None else None,
+        "variables": variables,
+    }
+    if raw:
+        snapshot["pid"] = gdb.selected_inferior().pid
+        snapshot["frame"] = _frame_range(frame)
+    if backtrace:
+        snapshot["backtrace"], truncated = _backtrace(frame, backtrace)
+        if truncated:
+            snapshot["backtrace_truncated"] = True
+    return snapshot
+
+
+class FrameSnapshotCommand(gdb.Command):
+    """Print the selected frame's locals as one JSON line."""
+
+    def __init__(self):
+        super().__init__("frame-snapshot", gdb.COMMAND_DATA)
+
+    def invoke(self, argument, from_tty):
+        summary_bytes, preview, raw, backtrace, level = ([int(word) for word in argument.split()] + [0] * 5)[:5]
+        frame = gdb.selected_frame()
+        if level:
+            frame = gdb.newest_frame()
+            for _ in range(level):
+                frame = frame.older()
+                if frame is None:
+                    raise gdb.GdbError(f"No frame at level {level}.")
+        gdb.write(json.dumps(frame_snapshot(frame, summary_bytes, preview, bool(raw), backtrace)) + "\n")
+
+
+FrameSnapshotCommand()
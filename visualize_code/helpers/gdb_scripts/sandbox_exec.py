@@ -0,0 +1,92 @@
+"""
+Sandbox exec-wrapper, run as a plain script. Not importable from Django.
+
+    python sandbox_exec.py [--report FD] CPU_SECONDS MEMORY_BYTES MAX_PROCESSES MAX_OUTPUT_BYTES -- program [args...]
+
+Applies the same rlimits as helpers/sandbox.py (zero means unlimited), then
+execs the program in place, so gdb debugs it with the limits already set.
+
+With --report, the program runs as a child instead: this script waits for it,
+writes "PEAK_RSS_KIB ALLOCATION_FAILED" to file descriptor FD, and exits the
+way the child did. A process's ru_maxrss starts from the RSS of whatever
+forked it, so only a small parent like this one can tell the program's own
+peak apart from the server's. ALLOCATION_FAILED is 1 if the preloaded heap
+shim saw malloc and friends fail, which under RLIMIT_AS happens before the
+RSS grows.
+
+SANDBOX_PRELOAD, if set, becomes the program's LD_PRELOAD. Setting
+LD_PRELOAD for gdb's inferior directly would also load it into the shell and
+into this script.
+"""
+import os
+import resource
+import signal
+import sys
+
+
+def apply_limits(cpu_time, memory_bytes, max_processes, max_output_bytes):
+    # Python starts with these ignored, and the program would inherit that:
+    # it has to die of SIGXFSZ at the output limit, not loop on EFBIG
+    signal.signal(signal.SIGPIPE, signal.SIG_DFL)
+    signal.signal(signal.SIGXFSZ, signal.SIG_DFL)
+    resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+    if cpu_time:
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu_time, cpu_time + 1))
+    if memory_bytes:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_bytes, memory_bytes))
+    if max_processes:
+        resource.setrlimit(resource.RLIMIT_NPROC, (max_processes, max_processes))
+    if max_output_bytes:
+        resource.setrlimit(resource.RLIMIT_FSIZE, (max_output_bytes, max_output_bytes))
+
+
+def supervise(program, limits, report):
+    resource.setrlimit(resource.RLIMIT_CORE, (0, 0))  # Also for this script when it re-raises the child's signal
+    failures, failure_writer = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os.close(report)
+            os.close(failures)
+            os.set_inheritable(failure_writer, True)
+            os.environ["CCV_ALLOC_FAILURE_FD"] = str(failure_writer)
+            apply_limits(*limits)
+            os.execv(program[0], program)
+        finally:
+            os._exit(127)
+    os.close(failure_writer)
+    os.set_blocking(failures, False)
+    _, status, usage = os.wait4(pid, 0)
+    try:
+        allocation_failed = bool(os.read(failures, 1))
+    except BlockingIOError:  # Something the program forked still holds the pipe open
+        allocation_failed = False
+    os.write(report, f"{usage.ru_maxrss} {int(allocation_failed)}".encode())
+    os.close(report)
+    if os.WIFSIGNALED(status):
+        signal.signal(os.WTERMSIG(status), signal.SIG_DFL)
+        os.kill(os.getpid(), os.WTERMSIG(status))
+        os._exit(128 + os.WTERMSIG(status))
+    os._exit(os.WEXITSTATUS(status))
+
+
+def main(argv):
+    separator = argv.index("--")
+    options = argv[1:separator]
+    report = None
+    if options[0] == "--report":
+        report, options = int(options[1]), options[2:]
+    limits = [int(value) for value in options]
+    program = argv[separator + 1:]
+
+    preload = os.environ.pop("SANDBOX_PRELOAD", None)
+    if preload:
+        os.environ["LD_PRELOAD"] = preload
+    if report is not None:
+        supervise(program, limits, report)
+    apply_limits(*limits)
+    os.execv(program[0], program)
+
+
+if __name__ == "__main__":
+    main(sys.argv)
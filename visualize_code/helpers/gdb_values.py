@@ -0,0 +1,262 @@
+"""
+Streaming parser for values as gdb prints them, into typed JSON trees.
+
+    {1, 2, 3}                               array of int
+    {x = 1, y = 2.5, name = "ab"}           struct
+    {0 <repeats 1000 times>}                one run-length element
+    "hello", '\\000' <repeats 14 times>      char array: string, then a run of chars
+    65 'A'                                  char
+    (int *) 0x7ffc10, 0x401136 <main>       pointers, with cast and symbol
+    {int (int)} 0x401136 <square>           function pointer
+    <optimized out>, true, RED              special, bool and enum values
+
+parse_value() scans the text once, left to right, with one precompiled
+regex per token and an explicit stack for braces. Nesting depth does not
+touch Python's recursion limit and the work is linear in the text length.
+Runs such as <repeats N times> stay a single node with "repeat": N instead
+of being expanded.
+
+Nodes look like:
+
+    {"kind": "int" | "float" | "bool", "value": ...}
+    {"kind": "char", "value": 65, "char": "A"}
+    {"kind": "pointer", "value": "0x7ffc10", "type"?: "int *", "symbol"?: "main", "target"?: "\\"hi\\""}
+    {"kind": "string", "value": "\\"hello\\"", "length": 5}
+    {"kind": "text", "value": "<optimized out>"}
+    {"kind": "array", "elements": [...], "length": N, "truncated"?: true}
+    {"kind": "struct", "fields": {"name": node, ...}}
+
+Array elements carry their "index" (and "repeat" for runs). attach_addresses()
+then gives every node its real address from a type layout.
+"""
+import re
+
+ATOM_RE = re.compile(r'''
+    (?:\((?P<cast>[^()]*(?:\([^()]*\)[^()]*)*)\)\ )?        # "(int *) " cast in front of a pointer
+    (?:
+        (?P<CHAR>(?:(?P<code>-?\d+)\ )?'(?P<char>\\[0-7]{1,3}|\\.|[^'\\])')
+      | (?P<STRING>"(?:[^"\\]|\\.)*"(?:\.\.\.)?)
+      | (?P<POINTER>(?P<address>0x[0-9a-fA-F]+)(?:\ <(?P<symbol>[^<>]*)>)?(?:\ (?P<target>"(?:[^"\\]|\\.)*"(?:\.\.\.)?))?)
+      | (?P<FLOAT>-?(?:\d+\.\d*(?:e[+-]?\d+)?(?!\.)|\d+e[+-]?\d+|inf|nan\(0x[0-9a-fA-F]+\)))
+      | (?P<INT>-?\d+)
+      | (?P<BOOL>true|false)
+      | (?P<SPECIAL><[^<>]*>)
+      | (?P<TEXT>[^,{}<]+?)(?=,\ |\}|\.\.\.|\ <repeats|$)
+    )
+''', re.VERBOSE)
+FUNCTION_POINTER_RE = re.compile(r'\{(?P<type>[^{}=]*)\}\ (?=0x)')
+DESIGNATOR_RE = re.compile(r'(?:(?P<field>[A-Za-z_]\w*)|\[(?P<index>\d+)(?:\ \.\.\.\ \d+)?\])\ =\ ')
+REPEATS_RE = re.compile(r'<repeats (\d+) times>')
+ARRAY_TYPE_RE = re.compile(r'^(?P<base>[^\[]*?)\s*(?P<dims>(?:\[\d+\])+)$')
+
+ESCAPES = {'n': '\n', 't': '\t', 'r': '\r', 'a': '\a', 'b': '\b', 'f': '\f', 'v': '\v', 'e': '\x1b'}
+
+
+class GDBValueError(ValueError):
+    pass
+
+
+class _Container:
+    __slots__ = ('name', 'items', 'truncated')
+
+    def __init__(self, name):
+        self.name = name
+        self.items = []  # (field name or None, node)
+        self.truncated = False
+
+
+def parse_value(text):
+    """
+    Parses one value as printed by gdb.
+
+    Args:
+        text (str): The value, e.g. '{1, 2, 3}' or '"hi", \\'\\\\000\\' <repeats 8 times>'.
+
+    Returns:
+        dict: The value's node; see the module docstring for the node kinds.
+
+    Raises:
+        GDBValueError: The text is not something gdb prints.
+    """
+    root = _Container(None)
+    stack = [root]
+    name = None
+    pos = 0
+    end = len(text)
+    while pos < end:
+        char = text[pos]
+        if char == ' ' or char == ',':
+            pos += 1
+        elif char == '{':
+            match = FUNCTION_POINTER_RE.match(text, pos)
+            if match:  # "{int (int)} 0x401136 <square>"
+                pos = match.end()
+                node, pos = _atom(text, pos)
+                node["type"] = match.group('type')
+                stack[-1].items.append((name, node))
+                name = None
+            else:
+                stack.append(_Container(name))
+                name = None
+                pos += 1
+        elif char == '}':
+            if len(stack) == 1:
+                raise GDBValueError(f"Unbalanced '}}' at {pos} in {text[:80]!r}")
+            container = stack.pop()
+            stack[-1].items.append((container.name, _finish(container)))
+            pos += 1
+        elif text.startswith('...', pos):
+            stack[-1].truncated = True  # gdb stopped at its print elements limit
+            pos += 3
+        elif text.startswith('<repeats ', pos):
+            match = REPEATS_RE.match(text, pos)
+            if not match or not stack[-1].items:
+                raise GDBValueError(f"Stray repeat count at {pos} in {text[:80]!r}")
+            stack[-1].items[-1][1]["repeat"] = int(match.group(1))
+            pos = match.end()
+        else:
+            match = DESIGNATOR_RE.match(text, pos)
+            if match:
+                name = match.group('field') or f"[{match.group('index')}]"
+                pos = match.end()
+                continue
+            node, pos = _atom(text, pos)
+            stack[-1].items.append((name, node))
+            name = None
+
+    if len(stack) != 1:
+        raise GDBValueError(f"Unclosed '{{' in {text[:80]!r}")
+    if len(root.items) == 1 and not root.truncated and "repeat" not in root.items[0][1]:
+        return root.items[0][1]
+    return _finish(root)  # A char array: "abc", '\000' <repeats 5 times>
+
+
+def _atom(text, pos):
+    match = ATOM_RE.match(text, pos)
+    if not match or match.end() == pos:
+        raise GDBValueError(f"Unexpected {text[pos:pos + 20]!r} at {pos}")
+    kind = match.lastgroup
+    if kind == 'CHAR':
+        char = _unescape(match.group('char'))
+        code = match.group('code')  # Runs inside char arrays are printed without it: '\\000' <repeats 9 times>
+        node = {"kind": "char", "value": int(code) if code is not None else ord(char), "char": char}
+    elif kind == 'STRING':
+        literal = match.group('STRING')
+        node = {"kind": "string", "value": literal, "length": _string_length(literal)}
+    elif kind == 'POINTER':
+        node = {"kind": "pointer", "value": match.group('address')}
+        if match.group('cast'):
+            node["type"] = match.group('cast')
+        if match.group('symbol'):
+            node["symbol"] = match.group('symbol')
+        if match.group('target'):
+            node["target"] = match.group('target')
+    elif kind == 'FLOAT':
+        literal = match.group('FLOAT')
+        node = {"kind": "float", "value": float(literal) if 'nan' not in literal else literal}
+    elif kind == 'INT':
+        node = {"kind": "int", "value": int(match.group('INT'))}
+    elif kind == 'BOOL':
+        node = {"kind": "bool", "value": match.group('BOOL') == 'true'}
+    else:
+        node = {"kind": "text", "value": match.group(kind).strip()}
+    return node, match.end()
+
+
+def _finish(container):
+    items = container.items
+    if any(name is not None and not name.startswith('[') for name, _ in items):
+        fields = {}
+        for position, (name, node) in enumerate(items):
+            fields[name if name is not None else f"<{position}>"] = node  # Anonymous struct/union members
+        return {"kind": "struct", "fields": fields}
+
+    elements = []
+    index = 0
+    for name, node in items:
+        if name is not None:  # "[12] = 5": gdb printed with array-indexes on
+            index = int(name[1:-1])
+        node["index"] = index
+        elements.append(node)
+        index += node.get("repeat", 1) * (node["length"] if node["kind"] == "string" else 1)
+    node = {"kind": "array", "elements": elements, "length": index}
+    if container.truncated:
+        node["truncated"] = True
+    return node
+
+
+def _unescape(char):
+    if char.startswith('\\'):
+        if char[1:].isdigit():
+            return chr(int(char[1:], 8))
+        return ESCAPES.get(char[1], char[1])
+    return char
+
+
+def _string_length(literal):
+    """Characters in a printed string literal, counting each escape as one."""
+    body = literal[1:literal.rindex('"')]
+    return len(re.sub(r'\\(?:[0-7]{1,3}|.)', '.', body))
+
+
+def layout_from_type(type_name, size):
+    """
+    A layout for attach_addresses worked out from gdb's type name and sizeof,
+    for when no declaration is known: only array dimensions can be read off
+    the name ("int [2][3]"), struct members get no addresses.
+    """
+    layout = {"size": size}
+    match = ARRAY_TYPE_RE.match(type_name or "")
+    if not match or '(' in match.group('base') or not size:
+        return layout
+    current = layout
+    for count in (int(dim) for dim in re.findall(r'\d+', match.group('dims'))):
+        if count == 0:
+            break
+        element = {"size": current["size"] // count}
+        current["count"] = count
+        current["element"] = element
+        current = element
+    return layout
+
+
+def element_type_name(type_name):
+    """The element type of an array type name: 'int [2][3]' -> 'int [3]', 'char [8]' -> 'char'."""
+    match = ARRAY_TYPE_RE.match(type_name or "")
+    if not match:
+        return None
+    rows = match.group('dims')[match.group('dims').index(']') + 1:]
+    return f"{match.group('base')} {rows}" if rows else match.group('base')
+
+
+def attach_addresses(node, address, layout):
+    """
+    Gives node and everything inside it an "address", using layout for
+    element strides and member offsets.
+
+    Args:
+        node (dict): A tree from parse_value.
+        address (int): Address of the whole value.
+        layout (dict): {"size", "count"?, "element"?: layout, "fields"?: [{"name", "offset", "layout"}]}.
+
+    Returns:
+        dict: node, annotated in place. Arrays also get their element "stride".
+    """
+    stack = [(node, address, layout)]
+    while stack:
+        current, start, shape = stack.pop()
+        current["address"] = hex(start)
+        if shape is None:
+            continue
+        if current["kind"] == "array" and "element" in shape:
+            element = shape["element"]
+            current["stride"] = element["size"]
+            for child in current["elements"]:
+                stack.append((child, start + child["index"] * element["size"], element))
+        elif current["kind"] == "struct" and "fields" in shape:
+            members = {member["name"]: member for member in shape["fields"]}
+            for name, child in current["fields"].items():
+                member = members.get(name)
+                if member is not None:
+                    stack.append((child, start + member["offset"], member["layout"]))
+    return node
@@ -0,0 +1,160 @@
+"""
+Heap allocation tracking for debugged programs.
+
+The program is started with gdb_scripts/heap_shim.c preloaded, which logs
+every malloc/calloc/realloc/free into a ring buffer in a file shared with
+the server (see the shim for the layout). At each stop the session drains
+the new events with HeapRing.drain and applies them to a HeapMap of the
+live blocks, so allocations cost the program no gdb round trip at all and
+the server only reads memory it already has mapped.
+"""
+from .compile_cache import compile_c_code
+import heapq
+import mmap
+import os
+import struct
+
+HEAP_SHIM_SOURCE = os.path.join(os.path.dirname(__file__), 'gdb_scripts', 'heap_shim.c')
+HEAP_SHIM_FLAGS = ('-shared', '-fPIC', '-O2')
+HEAP_SHIM_LIBRARY = 'heap_shim.so'
+HEAP_RING_FILE = '.heap-ring'
+RING_ENV = 'CCV_HEAP_RING'
+
+RING_MAGIC = 0x48434356
+HEADER = struct.Struct('=IIQ')  # magic, capacity, head
+RECORD = struct.Struct('=QIIQQQ')  # seq, kind, unused, address, size, old_address
+RECORDS_OFFSET = 64
+
+EVENT_ALLOC = 1
+EVENT_FREE = 2
+EVENT_REALLOC = 3
+
+
+def build_heap_shim(workspace):
+    """
+    Compiles the allocator shim into the workspace, through the compile
+    cache, so gcc runs once per shim version rather than once per session.
+
+    Returns:
+        str: Path of the shared library, or None if it could not be built.
+    """
+    try:
+        with open(HEAP_SHIM_SOURCE) as file:
+            source = file.read()
+        library = workspace.path(HEAP_SHIM_LIBRARY)
+        result = compile_c_code(source, library, 'heap_shim.c', HEAP_SHIM_FLAGS)
+    except OSError as e:
+        print(f"Could not build the heap shim: {e}")
+        return None
+    if result.returncode != 0:
+        print(f"Could not build the heap shim: {result.stderr}")
+        return None
+    return library
+
+
+class HeapRing:
+    """
+    The server's end of the shared event ring: creates and maps the file,
+    then reads whatever the program appended since the last drain.
+    """
+
+    def __init__(self, path, capacity):
+        self.path = path
+        self.capacity = 1 << max(capacity - 1, 1).bit_length()  # The shim masks indexes, so a power of two
+        self.read = 0  # Events consumed so far
+        self.lost = 0  # Events overwritten before they were drained, or torn
+        size = RECORDS_OFFSET + self.capacity * RECORD.size
+        with open(path, 'w+b') as file:
+            file.truncate(size)
+            file.write(HEADER.pack(RING_MAGIC, self.capacity, 0))
+            file.flush()
+            self._map = mmap.mmap(file.fileno(), size)
+
+    def drain(self):
+        """
+        Returns the events logged since the last drain, oldest first.
+
+        Returns:
+            list: (kind, address, size, old_address) tuples.
+        """
+        head = HEADER.unpack_from(self._map, 0)[2]
+        index = self.read
+        if head - index > self.capacity:
+            self.lost += head - index - self.capacity
+            index = head - self.capacity
+        events = []
+        while index < head:
+            # Contiguous run of slots up to the end of the ring, decoded in one call
+            slot = index % self.capacity
+            run = min(head - index, self.capacity - slot)
+            offset = RECORDS_OFFSET + slot * RECORD.size
+            for seq, kind, _, address, size, old_address in RECORD.iter_unpack(self._map[offset:offset + run * RECORD.size]):
+                index += 1
+                if seq != index:
+                    self.lost += 1
+                    continue
+                events.append((kind, address, size, old_address))
+        self.read = head
+        return events
+
+    def close(self):
+        self._map.close()
+
+
+class HeapMap:
+    """The program's live heap blocks, kept up to date from ring events."""
+
+    def __init__(self):
+        self.blocks = {}  # address -> size
+        self.bytes = 0
+        self.allocations = 0
+        self.reallocations = 0
+        self.frees = 0
+        self._summary = None
+
+    def copy(self):
+        heap = HeapMap()
+        heap.blocks = dict(self.blocks)
+        heap.bytes = self.bytes
+        heap.allocations, heap.reallocations, heap.frees = self.allocations, self.reallocations, self.frees
+        return heap
+
+    def apply(self, events):
+        blocks = self.blocks
+        for kind, address, size, old_address in events:
+            if kind == EVENT_ALLOC:
+                self.bytes += size - blocks.get(address, 0)
+                blocks[address] = size
+                self.allocations += 1
+            elif kind == EVENT_REALLOC:
+                self.bytes -= blocks.pop(old_address, 0)
+                self.bytes += size - blocks.get(address, 0)
+                blocks[address] = size
+                self.reallocations += 1
+            elif kind == EVENT_FREE:
+                # Blocks from before the shim attached are unknown here; only count the call
+                self.bytes -= blocks.pop(address, 0)
+                self.frees += 1
+        if events:
+            self._summary = None
+
+    def summary(self, max_blocks, lost=0):
+        """
+        The heap as sent with a step: the lowest max_blocks live blocks and totals.
+        Unchanged heaps return the same dict, so steps in the history share it.
+
+        Returns:
+            dict: {"blocks": [{"address", "size"}], "count", "bytes", "allocations", "reallocations", "frees", "lost"}.
+        """
+        if self._summary is None or self._summary["lost"] != lost:
+            self._summary = {
+                "blocks": [{"address": hex(address), "size": self.blocks[address]}
+                           for address in heapq.nsmallest(max_blocks, self.blocks)],
+                "count": len(self.blocks),
+                "bytes": self.bytes,
+                "allocations": self.allocations,
+                "reallocations": self.reallocations,
+                "frees": self.frees,
+                "lost": lost,
+            }
+        return self._summary
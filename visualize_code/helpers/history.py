@@ -0,0 +1,186 @@
+from django.conf import settings
+from .state_delta import apply_memory_delta, diff_memory_state
+import bisect
+import threading
+
+# Response fields kept as they are, when a step has them; unchanged heaps are shared with the neighbouring steps
+OPTIONAL_FIELDS = ("heap", "backtrace", "backtrace_truncated")
+
+
+class StepHistory:
+    """
+    Step history of a debugging session, stored as keyframes plus deltas.
+
+    Every keyframe_interval-th step keeps its full memory_state; the steps in
+    between only keep a delta against the step before. Rebuilding any step is
+    a bisect for the nearest keyframe plus at most keyframe_interval - 1
+    deltas, so moving around the history never re-runs the program. Once
+    more than max_steps steps are held, the oldest keyframe interval is
+    dropped, which keeps memory per session bounded.
+
+    A cursor marks the step being shown: stepping back moves it without
+    touching gdb, and forward steps replay the history until the cursor is
+    back at the newest step.
+    """
+
+    def __init__(self, keyframe_interval=16, max_steps=10000):
+        self.keyframe_interval = max(1, keyframe_interval)
+        self.max_steps = max(self.keyframe_interval, max_steps)
+        self.first_step = 0  # Step number of _records[0]
+        self.cursor = -1
+        self._records = []
+        self._keyframes = []  # Step numbers of keyframe records, ascending
+        self._last_state = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._records)
+
+    @property
+    def last_step(self):
+        return self.first_step + len(self._records) - 1
+
+    def record(self, response):
+        """
+        Appends a step response and moves the cursor to it.
+
+        Args:
+            response (dict): Step response with current_line, function_name, memory_state and status.
+
+        Returns:
+            int: The new step's number.
+        """
+        memory_state = response.get("memory_state", {})
+        with self._lock:
+            step = self.last_step + 1
+            record = {
+                "current_line": response.get("current_line"),
+                "function_name": response.get("function_name"),
+                "status": response.get("status"),
+            }
+            for field in OPTIONAL_FIELDS:
+                if field in response:
+                    record[field] = response[field]
+            if not self._records or step - self._keyframes[-1] >= self.keyframe_interval:
+                record["memory_state"] = memory_state
+                self._keyframes.append(step)
+            else:
+                record["memory_delta"] = diff_memory_state(self._last_state, memory_state)
+            self._records.append(record)
+            self._last_state = memory_state
+            self.cursor = step
+            self._trim()
+            return step
+
+    def get(self, step):
+        """
+        Rebuilds a step's response from the nearest keyframe at or before it.
+
+        Returns:
+            dict: The step response plus its "step" number, or {"error": ...} if it is not held.
+        """
+        with self._lock:
+            return self._get(step)
+
+    def move_to(self, step):
+        """Moves the cursor to step and returns that step's response."""
+        with self._lock:
+            response = self._get(step)
+            if "error" not in response:
+                self.cursor = step
+            return response
+
+    def back(self):
+        with self._lock:
+            if self.cursor <= self.first_step:
+                return {"error": "Already at the oldest recorded step."}
+            self.cursor -= 1
+            return self._get(self.cursor)
+
+    def forward(self):
+        """Replays the step after the cursor; only valid while the cursor is behind the newest step."""
+        with self._lock:
+            if self.cursor >= self.last_step:
+                return {"error": "Already at the newest recorded step."}
+            self.cursor += 1
+            return self._get(self.cursor)
+
+    def truncate(self, step):
+        """
+        Forgets step and every later step, so the next record() is numbered
+        step. Used when the program itself is rewound to an earlier step.
+        """
+        with self._lock:
+            if step <= self.first_step:
+                self._records = []
+                self._keyframes = []
+                self._last_state = {}
+                self.first_step = step
+                self.cursor = step - 1
+                return
+            if step > self.last_step:
+                return
+            self._last_state = self._get(step - 1)["memory_state"]
+            del self._records[step - self.first_step:]
+            del self._keyframes[bisect.bisect_left(self._keyframes, step):]
+            self.cursor = min(self.cursor, step - 1)
+
+    def find_line(self, line, before):
+        """Returns the newest step before `before` that stopped on line, or None."""
+        with self._lock:
+            for step in range(min(before, self.last_step + 1) - 1, self.first_step - 1, -1):
+                if self._records[step - self.first_step]["current_line"] == line:
+                    return step
+            return None
+
+    def at_head(self):
+        with self._lock:
+            return self.cursor >= self.last_step
+
+    def stats(self):
+        with self._lock:
+            return {
+                "steps": len(self._records),
+                "first_step": self.first_step,
+                "last_step": self.last_step,
+                "keyframes": len(self._keyframes),
+                "cursor": self.cursor,
+            }
+
+    def _get(self, step):
+        if not self.first_step <= step <= self.last_step:
+            return {"error": f"Step {step} is not in the history (steps {self.first_step} to {self.last_step} are)."}
+        keyframe = self._keyframes[bisect.bisect_right(self._keyframes, step) - 1]
+        state = self._records[keyframe - self.first_step]["memory_state"]
+        for index in range(keyframe + 1 - self.first_step, step + 1 - self.first_step):
+            state = apply_memory_delta(state, self._records[index]["memory_delta"])
+
+        record = self._records[step - self.first_step]
+        response = {
+            "current_line": record["current_line"],
+            "function_name": record["function_name"],
+            "memory_state": state,
+            "status": record["status"],
+            "step": step,
+        }
+        for field in OPTIONAL_FIELDS:
+            if field in record:
+                response[field] = record[field]
+        return response
+
+    def _trim(self):
+        # Drop whole keyframe intervals so the oldest record is always a keyframe
+        while len(self._records) > self.max_steps and len(self._keyframes) > 1:
+            dropped = self._keyframes[1] - self.first_step
+            del self._records[:dropped]
+            del self._keyframes[0]
+            self.first_step += dropped
+        self.cursor = max(self.cursor, self.first_step)
+
+
+def new_step_history():
+    """A StepHistory sized from settings."""
+    return StepHistory(
+        keyframe_interval=getattr(settings, 'DEBUG_HISTORY_KEYFRAME_INTERVAL', 16),
+        max_steps=getattr(settings, 'DEBUG_HISTORY_MAX_STEPS', 10000),
+    )
@@ -0,0 +1,87 @@
+"""
+Direct reads of a stopped program's memory through /proc/<pid>/mem.
+
+-data-read-memory-bytes costs a gdb round trip and sends the bytes back
+hex-encoded inside an MI record. While gdb holds the program stopped, the
+server can pread the same bytes itself: it started gdb, which started the
+program, so the kernel's ptrace access check (including Yama's
+ptrace_scope=1, which only admits ancestors) lets it open the file. Where it
+cannot (no /proc, a stricter Yama setting), callers fall back to gdb.
+
+plan_reads merges the ranges a step needs (every local of the frame) into
+as few reads as possible, and MemorySnapshot serves slices of them by address.
+"""
+from bisect import bisect_right
+import os
+
+
+class InferiorMemory:
+    """An open /proc/<pid>/mem of one process."""
+
+    def __init__(self, pid):
+        self.pid = pid
+        self._fd = os.open(f'/proc/{pid}/mem', os.O_RDONLY | getattr(os, 'O_CLOEXEC', 0))
+
+    def read(self, address, length):
+        """
+        Reads length bytes at address.
+
+        Raises:
+            OSError: The range is not mapped, or the process is gone.
+        """
+        data = os.pread(self._fd, length, address)
+        if len(data) != length:
+            raise OSError(f"Short read of {length} bytes at {hex(address)} in process {self.pid}")
+        return data
+
+    def read_ranges(self, ranges, max_gap):
+        """Reads (address, length) ranges with as few preads as plan_reads allows."""
+        return MemorySnapshot([(address, self.read(address, length)) for address, length in plan_reads(ranges, max_gap)])
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+def plan_reads(ranges, max_gap):
+    """
+    Merges ranges into reads: overlapping ranges, and ranges less than
+    max_gap bytes apart, are read together with the gap between them.
+
+    Args:
+        ranges (iterable): (address, length) pairs, in any order.
+        max_gap (int): Largest hole worth reading over to save a read.
+
+    Returns:
+        list: (address, length) reads, sorted by address.
+    """
+    reads = []
+    for address, length in sorted(ranges):
+        if length <= 0:
+            continue
+        if reads and address <= reads[-1][0] + reads[-1][1] + max_gap:
+            start = reads[-1][0]
+            reads[-1] = (start, max(reads[-1][1], address + length - start))
+        else:
+            reads.append((address, length))
+    return reads
+
+
+class MemorySnapshot:
+    """Blocks of memory read at one stop, sliced by address."""
+
+    def __init__(self, blocks):
+        self.blocks = sorted(blocks)
+        self._starts = [address for address, _ in self.blocks]
+
+    def slice(self, address, length):
+        """The bytes at address..address+length, or None if no single block holds them all."""
+        position = bisect_right(self._starts, address) - 1
+        if position < 0:
+            return None
+        start, data = self.blocks[position]
+        offset = address - start
+        if offset + length > len(data):
+            return None
+        return data[offset:offset + length]
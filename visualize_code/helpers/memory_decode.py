@@ -0,0 +1,252 @@
+"""
+Decodes raw bytes read from the inferior into the same typed nodes as
+gdb_values.parse_value, so a bulk memory read needs no gdb formatting.
+
+decode_elements handles runs of one scalar type (integers, chars, bools,
+floats, pointers and enums); decode_value walks a whole declaration layout
+(arrays and structs of those). Anything else returns None and the caller
+falls back to asking gdb. The inferior runs on this machine, so native byte
+order applies. format_value prints a decoded tree the way gdb would, and
+hexdump lays raw bytes out for the memory view.
+"""
+import struct
+
+SIGNED = {1: 'b', 2: 'h', 4: 'i', 8: 'q'}
+UNSIGNED = {1: 'B', 2: 'H', 4: 'I', 8: 'Q'}
+FLOATS = {4: 'f', 8: 'd'}
+CHAR_TYPES = {'char', 'signed char', 'unsigned char'}
+BOOL_TYPES = {'_Bool', 'bool'}
+FLOAT_TYPES = {'float', 'double'}
+QUALIFIERS = ('const ', 'volatile ')
+REPEAT_THRESHOLD = 10  # gdb's default `set print repeats`
+CHAR_ESCAPES = {'\n': '\\n', '\t': '\\t', '\r': '\\r', '\a': '\\a', '\b': '\\b', '\f': '\\f', '\v': '\\v',
+                '\x1b': '\\033', '\\': '\\\\'}
+
+
+def scalar_format(type_name, size):
+    """
+    The struct format character and node kind for a scalar C type.
+
+    Args:
+        type_name (str): The type as gdb or clang spells it, e.g. 'unsigned int', 'char *'.
+        size (int): sizeof the type.
+
+    Returns:
+        tuple: (format character, kind), or None if the type is not a scalar this module decodes.
+    """
+    name = type_name.strip()
+    for qualifier in QUALIFIERS:
+        name = name.replace(qualifier, '')
+    if name.endswith('*'):
+        return (UNSIGNED[size], "pointer") if size in UNSIGNED else None
+    if '[' in name or name.startswith(('struct ', 'union ')) or '(' in name:
+        return None
+    if name in BOOL_TYPES:
+        return ('?', "bool") if size == 1 else None
+    if name in FLOAT_TYPES:
+        return (FLOATS[size], "float") if size in FLOATS else None
+    if 'double' in name.split():
+        return None  # long double has no struct format
+    if name in CHAR_TYPES:
+        return (UNSIGNED[1] if name.startswith('unsigned') else SIGNED[1], "char")
+    if name.startswith('enum '):
+        return (SIGNED[size], "int") if size in SIGNED else None
+    if size not in SIGNED or not any(word in name.split() for word in ('int', 'short', 'long', 'signed', 'unsigned')):
+        return None  # A typedef'd struct or something else this module cannot see into
+    return (UNSIGNED[size] if 'unsigned' in name.split() else SIGNED[size], "int")
+
+
+def decode_elements(data, element_type, element_size, first_index=0, base_address=None):
+    """
+    Decodes consecutive array elements.
+
+    Args:
+        data (bytes): The elements' memory, a whole number of elements long.
+        element_type (str): Element type name.
+        element_size (int): sizeof one element.
+        first_index (int): Array index of the first element in data.
+        base_address (int): Address of the first element in data; elements
+            then get their own "address".
+
+    Returns:
+        list: Nodes with "index" (and "address"), or None if element_type is not decodable.
+    """
+    layout = scalar_format(element_type, element_size)
+    if layout is None or not element_size:
+        return None
+    code, kind = layout
+    count = len(data) // element_size
+    values = struct.unpack(f'={count}{code}', data[:count * element_size])
+
+    nodes = []
+    for offset, value in enumerate(values):
+        if kind == "pointer":
+            node = {"kind": "pointer", "value": hex(value)}
+        elif kind == "char":
+            node = {"kind": "char", "value": value, "char": chr(value & 0xff)}
+        else:
+            node = {"kind": kind, "value": value}
+        node["index"] = first_index + offset
+        if base_address is not None:
+            node["address"] = hex(base_address + offset * element_size)
+        nodes.append(node)
+    return nodes
+
+
+def decode_value(data, layout, address=None, count=None):
+    """
+    Decodes a whole variable from its bytes using its declaration layout.
+
+    Args:
+        data (bytes): The variable's memory, starting at its first byte.
+        layout (dict): declaration_index.type_layout of its type.
+        address (int): Address of the variable; every node then gets its "address".
+        count (int): For arrays, decode only the first count elements
+            (the node still reports the full "length" and is marked "truncated").
+
+    Returns:
+        dict: The gdb_values node, or None if some part of the type is not decodable.
+    """
+    node = _decode(data, 0, layout, address, count)
+    if node is not None and address is not None:
+        node["address"] = hex(address)
+    return node
+
+
+def _decode(data, offset, layout, address, count=None):
+    if "type" in layout:
+        nodes = decode_elements(data[offset:offset + layout["size"]], layout["type"], layout["size"], 0,
+                                address + offset if address is not None else None)
+        if not nodes or len(nodes) != 1:
+            return None
+        del nodes[0]["index"]
+        return nodes[0]
+
+    if "element" in layout:
+        element = layout["element"]
+        length = layout["count"]
+        shown = length if count is None else min(count, length)
+        if "type" in element:
+            # One struct.unpack for the whole run of scalars
+            nodes = decode_elements(data[offset:offset + shown * element["size"]], element["type"], element["size"],
+                                    0, address + offset if address is not None else None)
+        else:
+            nodes = []
+            for index in range(shown):
+                node = _decode(data, offset + index * element["size"], element, address)
+                if node is None:
+                    return None
+                node["index"] = index
+                if address is not None:
+                    node["address"] = hex(address + offset + index * element["size"])
+                nodes.append(node)
+        if nodes is None or len(nodes) != shown:
+            return None
+        node = {"kind": "array", "elements": _collapse_runs(nodes), "length": length, "stride": element["size"]}
+        if shown < length:
+            node["truncated"] = True
+        return node
+
+    if "fields" in layout:
+        fields = {}
+        for member in layout["fields"]:
+            node = _decode(data, offset + member["offset"], member["layout"], address)
+            if node is None:
+                return None
+            if address is not None:
+                node["address"] = hex(address + offset + member["offset"])
+            fields[member["name"]] = node
+        return {"kind": "struct", "fields": fields}
+    return None  # A layout cut off at LAYOUT_DEPTH, or a type clang could not size
+
+
+def _collapse_runs(nodes):
+    """Turns REPEAT_THRESHOLD or more equal scalars in a row into one node with "repeat", like gdb."""
+    collapsed = []
+    position = 0
+    while position < len(nodes):
+        node = nodes[position]
+        end = position + 1
+        if "value" in node:
+            while end < len(nodes) and nodes[end].get("value") == node["value"] and nodes[end]["kind"] == node["kind"]:
+                end += 1
+        if end - position >= REPEAT_THRESHOLD:
+            node["repeat"] = end - position
+        else:
+            end = position + 1
+        collapsed.append(node)
+        position = end
+    return collapsed
+
+
+def format_value(node):
+    """
+    Prints a decoded node the way gdb prints values, so it can stand in for
+    gdb's output in a memory_state entry. A float variable gets 3 decimals,
+    as memory_helper.format_memory_entry rounds it, and char arrays print as
+    a string up to their first NUL.
+    """
+    if node["kind"] == "float":
+        return format(node["value"], ".3f")
+    return _format(node)
+
+
+def _format(node):
+    kind = node["kind"]
+    if kind == "array":
+        elements = node["elements"]
+        if elements and elements[0]["kind"] == "char" and not node.get("truncated"):
+            text = []
+            for element in elements:
+                if element["value"] == 0:
+                    break
+                text.append(_escape_char(element["char"], '"') * element.get("repeat", 1))
+            return '"' + "".join(text) + '"'
+        parts = []
+        for element in elements:
+            text = _format(element)
+            parts.append(f"{text} <repeats {element['repeat']} times>" if "repeat" in element else text)
+        return "{" + ", ".join(parts) + ("...}" if node.get("truncated") else "}")
+    if kind == "struct":
+        return "{" + ", ".join(f"{name} = {_format(field)}" for name, field in node["fields"].items()) + "}"
+    if kind == "char":
+        char = _escape_char(node["char"], "'")
+        return f"{node['value']} '{char}'"
+    if kind == "bool":
+        return "true" if node["value"] else "false"
+    if kind == "float":
+        return repr(node["value"])
+    return str(node["value"])
+
+
+def _escape_char(char, quote):
+    if char == quote:
+        return '\\' + char
+    if char in CHAR_ESCAPES:
+        return CHAR_ESCAPES[char]
+    if ' ' <= char <= '~':
+        return char
+    return f"\\{ord(char):03o}"
+
+
+def hexdump(data, address, width=16):
+    """
+    Lays raw memory out as hexdump rows.
+
+    Args:
+        data (bytes): The memory.
+        address (int): Address of data's first byte.
+        width (int): Bytes per row.
+
+    Returns:
+        list: {"address", "hex", "ascii"} per row; unprintable bytes show as '.' in ascii.
+    """
+    rows = []
+    for offset in range(0, len(data), width):
+        chunk = data[offset:offset + width]
+        rows.append({
+            "address": hex(address + offset),
+            "hex": chunk.hex(' '),
+            "ascii": "".join(chr(byte) if 32 <= byte < 127 else '.' for byte in chunk),
+        })
+    return rows
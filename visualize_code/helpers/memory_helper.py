@@ -1,13 +1,28 @@
-from clang.cindex import Index, CursorKind, TypeKind
+from clang.cindex import CursorKind, TypeKind
+from .clang_cache import get_translation_unit_cache
+from .declaration_index import get_declaration_index
+from .gdb_output import FUNCTION_NAME_RE, STATEMENT_RE, iter_declarations, parse_locals, tokenize
+from .gdb_values import GDBValueError, attach_addresses, layout_from_type, parse_value
 import re
 import platform
 import time
-import wexpect
 import queue
 
+try:
+    import wexpect
+except ImportError:  # wexpect is Windows-only; the GDB/MI backend does not need it
+    wexpect = None
+
 address_base = 0x1000  # Starting address for memory allocation (mocked for demonstration)
 variable_address_map = {}
 def parse_gdb_output(output):
+    """
+    Lists the variables declared on the source lines in gdb console output,
+    giving them mocked addresses that keep counting up across calls.
+
+    One precompiled pattern finds the declaring source lines in a single
+    pass over the output.
+    """
     memory_data = []
     global address_base
     global variable_address_map
@@ -17,52 +32,38 @@ def parse_gdb_output(output):
         "char": 1
     }
 
-    for line in output.splitlines():
-        # Match scalar variable declarations, e.g., "5       int x = 10;"
-        scalar_match = re.match(
-            r'^\s*\d+\s+(int|float|char)\s+([\w]+)\s*=\s*(.+);$', 
-            line
-        )
-        if scalar_match:
-            var_type = scalar_match.group(1).strip()
-            variable = scalar_match.group(2).strip()
-            value = scalar_match.group(3).strip()
+    for declaration in iter_declarations(output):
+        if declaration.group('scalar'):
+            # e.g. "5       int x = 10;"
+            var_type = declaration.group('scalar_type')
+            variable = declaration.group('scalar')
             variable_address_map[variable] = f"0x{address_base:06x}"
             memory_data.append({
                 "variable": variable,
-                "value": value,
+                "value": declaration.group('value').strip(),
                 "type": var_type,
                 "address": f"0x{address_base:06x}"
             })
             # Increment base address by the size of the type
             address_base += type_size.get(var_type, 4)
 
-        # Match array declarations, e.g., "6       int arr[] = {1, 2, 3, 4};"
-        array_match = re.match(
-            r'^\s*\d+\s+(int|float|char)\s+([\w]+)\s*\[\d*\]\s*=\s*\{\s*([^}]*)\s*\};$', 
-            line
-        )
-        if array_match:
-            print("Hello")
-            array_type = array_match.group(1).strip()
-            array_name = array_match.group(2).strip()
-            # Extract values if provided; otherwise, initialize with default values
-            values_str = array_match.group(3).strip()
+        elif declaration.group('array'):
+            # e.g. "6       int arr[] = {1, 2, 3, 4};"
+            array_type = declaration.group('array_type')
+            array_name = declaration.group('array')
+            values_str = declaration.group('elements')
             variable_address_map[array_name] = f"0x{address_base:06x}"
             if values_str:  # Non-empty initializer list
                 values = [v.strip() for v in values_str.split(",")]
-            else:  # Empty initializer list, default values based on type
-                array_size_match = re.search(r'\[(\d+)\]', line)
-                if array_size_match:
-                    array_size = int(array_size_match.group(1))
-                    default_value = {
-                        "int": "0",
-                        "float": "0.0",
-                        "char": "'\\0'"
-                    }.get(array_type, "0")  # Default to "0" if type is unknown
-                    values = [default_value] * array_size
-                else:
-                    values = []  # Handle edge case if no size is specified
+            elif declaration.group('extent'):  # Empty initializer list, default values based on type
+                default_value = {
+                    "int": "0",
+                    "float": "0.0",
+                    "char": "'\\0'"
+                }.get(array_type, "0")
+                values = [default_value] * int(declaration.group('extent'))
+            else:
+                values = []  # Handle edge case if no size is specified
 
             # Generate continuous memory addresses for array elements
             addresses = []
@@ -76,31 +77,26 @@ def parse_gdb_output(output):
                 "type": f"{array_type}[]",
                 "address": addresses
             })
-        pointer_match = re.match(
-            r'^\s*\d+\s+(int|float|char|double|long|short)\s*\*\s*([\w]+)\s*=\s*([^;]+);$', 
-            line
-        )
-        if pointer_match:
-            var_type = pointer_match.group(1).strip()  # Data type (e.g., int, float, char)
-            pointer_name = pointer_match.group(2).strip()  # Pointer variable name (e.g., ptr)
-            value = pointer_match.group(3).strip()  # Assigned value (e.g., NULL, &var)
+
+        else:
+            # e.g. "7       int *ptr = &x;"
+            var_type = declaration.group('pointer_type')
+            pointer_name = declaration.group('pointer')
+            value = declaration.group('target').strip()  # Assigned value (e.g., NULL, &var)
             # Resolve address if the pointer is assigned a variable address (e.g., &a)
             if value.startswith("&"):
-                referenced_variable = value[1:]  # Remove the '&' to get the variable name
-                resolved_address = variable_address_map.get(referenced_variable, "NULL")
+                resolved_address = variable_address_map.get(value[1:], "NULL")
             else:
                 resolved_address = value  # For cases like NULL
 
             memory_data.append({
-            "variable": pointer_name,
-            "value": resolved_address,  # Store the assigned value (e.g., NULL or address)
-            "type": f"{var_type}*",  # Indicate it's a pointer type
-            "address": f"0x{address_base:06x}"  # Assign a unique address
+                "variable": pointer_name,
+                "value": resolved_address,
+                "type": f"{var_type}*",
+                "address": f"0x{address_base:06x}"
             })
-
-            # Increment base address by the size of the pointer (typically 8 bytes for 64-bit systems)
+            # Increment base address by the size of the pointer (8 bytes on 64-bit systems)
             address_base += 8
-    print(memory_data)
     return memory_data
 
 
@@ -130,35 +126,19 @@ def read_gdb_output(gdb_process, count):
             - "matched_line": The matched line (variable declaration, assignment, or valid C statement).
             - "function_name": The current function name (if extracted).
     """
-    # Patterns for matching
-    statement_pattern = r'^\s*\d+\s+(int|float|char|double|long|short)\s+\w+\[.*\]\s*=\s*{.*};|' \
-                    r'^\s*\d+\s+(int|float|char|double|long|short)\s+\w+\[.*\];|' \
-                    r'^\s*\d+\s+(int|float|char|double|long|short)\s+\w+\s*=\s*[^;]+;|' \
-                    r'^\s*\d+\s+\w+\s*=\s*.+;|' \
-                    r'^\s*\d+\s+(int|float|char|double|long|short)\s*\*\s*\w+\s*=\s*[^;]+;|' \
-                    r'^\s*\d+\s+(int|float|char|double|long|short)\s*\*\s*\w+\s*;|' \
-                    r'^\s*\d+\s+.*;$'
-
-
-    function_name_pattern = r'(?<=in\s)(\w+)\s*(?=\()'
-
     timeout = 10  # Timeout in seconds
     start_time = time.time()
     output = ""
     matched_line = None
     function_name = None
     i = 0
-    print(count)
     try:
-        is_windows = platform.system() == "Windows"
-
         while True:
-            # Read a line from GDB's output
-            if is_windows:
-                line = gdb_process.stdout.readline()
-            else:
-                line = gdb_process.stdout.read(1).decode("utf-8")
-            
+            # Read a whole line from GDB's output, not one character at a time
+            line = gdb_process.stdout.readline()
+            if isinstance(line, bytes):
+                line = line.decode("utf-8", errors="replace")
+
             if not line:
                 # Exit the loop if no output is received within the timeout
                 if time.time() - start_time > timeout:
@@ -174,7 +154,7 @@ def read_gdb_output(gdb_process, count):
             #print(f"Raw line: {line}")
             # Check if the line matches a variable/statement
             if not matched_line:
-                statement_match = re.search(statement_pattern, line)
+                statement_match = STATEMENT_RE.search(line)
                 if statement_match:
                     matched_line = statement_match.group(0)
                     if count == 0:
@@ -184,7 +164,7 @@ def read_gdb_output(gdb_process, count):
             #print(f"Matched Line: {matched_line}")
             # Check if the line contains the function name (from `info frame`)
             if not function_name:
-                function_match = re.search(function_name_pattern, line)
+                function_match = FUNCTION_NAME_RE.search(line)
                 if function_match:
                     function_name = function_match.group(0)
 
@@ -207,52 +187,43 @@ def read_gdb_output(gdb_process, count):
 
 def extract_memory_data(c_code):
     """
-    Simulates memory management by extracting variables, arrays, and their values from C code.
-    
+    Simulates memory management by listing the initialized variables and
+    arrays declared in C code, from its declaration index.
+
     Args:
         c_code (str): The C code to extract memory data from.
-    
+
     Returns:
         list: A list of dictionaries containing variable information with fields:
             - "variable": Name of the variable.
-            - "value": The assigned value(s).
-            - "type": The type of the variable (int, float, char, etc.).
-            - "address": Simulated memory address.
+            - "value": The initializer (a list of element initializers for arrays).
+            - "type": The type of the variable ("int[]" style for arrays).
+            - "address": Simulated memory address (one per element for arrays),
+              laid out in declaration order from the real type sizes.
     """
     memory_data = []
+    address = CLANG_ADDRESS_BASE
+    for declaration in get_declaration_index(c_code).declarations:
+        if declaration.initializer is None:
+            continue
+        unit = declaration.element_size or declaration.size or 4
+        address += -address % min(unit, 8)  # Natural alignment, as a compiler would place it
 
-    # Regular expressions for simple variables and arrays
-    simple_var_pattern = r'\b(int|float|char)\s+(\w+)\s*=\s*([^;]+);'
-    array_pattern = r'\b(int|float|char)\s+(\w+)\s*\[.*\]\s*=\s*\{([^}]+)\};'
-
-    # Extract simple variables
-    for match in re.finditer(simple_var_pattern, c_code):
-        var_type, var_name, var_value = match.groups()
-        memory_address = f"0x{hash(var_name) & 0xFFFFFF:06x}"
-
-        memory_data.append({
-            "variable": var_name,
-            "value": var_value.strip(),
-            "type": var_type,
-            "address": memory_address,
-        })
-
-    # Extract arrays
-    for match in re.finditer(array_pattern, c_code):
-        var_type, var_name, array_values = match.groups()
-        values = [value.strip() for value in array_values.split(",")]
-
-        # Simulate continuous memory allocation for array elements
-        base_address = hash(var_name) & 0xFFFFFF
-        addresses = [f"0x{(base_address + i * 4) & 0xFFFFFF:06x}" for i in range(len(values))]
-
-        memory_data.append({
-            "variable": var_name,
-            "value": values,
-            "type": f"{var_type}[]",
-            "address": addresses,
-        })
-    print(f"memory_data:{memory_data}")
+        if declaration.element_count is not None:
+            memory_data.append({
+                "variable": declaration.name,
+                "value": declaration.initializer,
+                "type": f"{declaration.element_type}[]",
+                "address": [f"0x{address + i * unit:06x}" for i in range(declaration.element_count)],
+            })
+        else:
+            memory_data.append({
+                "variable": declaration.name,
+                "value": declaration.initializer,
+                "type": declaration.type,
+                "address": f"0x{address:06x}",
+            })
+        address += declaration.size or unit
     return memory_data
 
 
@@ -304,10 +275,33 @@ def extract_local_variables(gdb_process):
     return local_variables
 
 
-def parse_with_clang(statement):
+# First mocked address handed out by each parse_with_clang call
+CLANG_ADDRESS_BASE = 0x1000
+
+
+def parse_with_clang(statement, session_key=None):
+    """
+    Parses C statements with libclang and lists the variables they declare.
+
+    The translation unit comes from the process-wide TranslationUnitCache, so
+    the same statements are only parsed once, and a session_key lets an
+    editing session reparse its previous unit instead of starting over.
+    Addresses are mocked, counting up from CLANG_ADDRESS_BASE on every call.
+
+    Args:
+        statement (str): C statements, parsed as the body of a function.
+        session_key (str): Optional key of the editing session the code belongs to.
+
+    Returns:
+        list: Dictionaries with "variable", "value", "type" and "address".
+    """
     code = f"void temp() {{ {statement} }}"
-    index = Index.create()
-    translation_unit = index.parse('example.c', args=['-std=c11'], unsaved_files=[('example.c', code)])
+    with get_translation_unit_cache().translation_unit(code, session_key=session_key) as translation_unit:
+        return _collect_declarations(translation_unit, code)
+
+
+def _collect_declarations(translation_unit, code):
+    address_base = CLANG_ADDRESS_BASE
     type_size = {
         "int": 4,
         "float": 4,
@@ -364,7 +358,7 @@ def parse_with_clang(statement):
 
         # Helper function to parse arrays
     def parse_array(node):
-        global address_base
+        nonlocal address_base
         element_type = node.type.element_type.spelling  # Determine the type of array elements
         element_size = type_size.get(element_type, 4)  # Get the size of the array elements
         array_size = node.type.element_count or 0  # Get the size if explicitly specified
@@ -401,7 +395,7 @@ def parse_with_clang(statement):
 
     # Recursive function to visit all nodes
     def visit_node(node):
-        global address_base
+        nonlocal address_base
         if node.kind == CursorKind.VAR_DECL:  # Check if it's a variable declaration
             var_name = node.spelling
             var_type = node.type.spelling
@@ -478,58 +472,85 @@ def extract_current_line(output):
 
 
 def extract_function_name(output):
-    """Extract the function name from GDB output."""
-    for line in output.splitlines():
-        if " at " in line and "," in line:
-            parts = line.split(",")
-            if len(parts) > 1 and " at " in parts[1]:
-                function_part = parts[1].strip()
-                if "(" in function_part and ")" in function_part:
-                    return function_part.split("(", 1)[0].strip()
+    """Extract the function name from the first frame line (e.g. "sq (n=3) at test_temp.c:4") in GDB output."""
+    for token in tokenize(output):
+        if token.kind == 'FRAME':
+            return token.match.group('function')
     return None
 
-count = 1
-def get_address(gdb_process, variable):
-    global count
-    gdb_process.sendline(f"print &{variable}")
-    while True:
+def extract_line_number(output):
+    """The line gdb stopped at: the last source line it printed (e.g. "5\t    x = 1;"), or None."""
+    line = None
+    for token in tokenize(output):
+        if token.kind == 'SOURCE':
+            line = int(token.match.group('line_no'))
+    return line
 
-        line = gdb_process.before
-        # print(line)
+def parse_backtrace(output):
+    """Frames of a `bt` listing, innermost first, as {"level", "function", "line"}."""
+    return [
+        {"level": level, "function": match.group('function'), "line": int(match.group('line'))}
+        for level, match in enumerate(token.match for token in tokenize(output) if token.kind == 'FRAME')
+    ]
 
-        if line.startswith(f"${count}"):
-            output = line
-            count += 1
-            break
-        
-    
-    address = line.split("0x")[-1]
-    return f"0x{address.strip()}" 
-    return address
+PRINT_ADDRESS_RE = re.compile(r'^(?:\(gdb\)\s*)?\$\d+\s*=.*?(0x[0-9a-fA-F]+)', re.MULTILINE)
+WHATIS_RE = re.compile(r'^(?:\(gdb\)\s*)?type = ([^\n]+)', re.MULTILINE)
+PRINT_INT_RE = re.compile(r'^(?:\(gdb\)\s*)?\$\d+\s*=\s*(\d+)', re.MULTILINE)
+
+
+def get_address(session, variable):
+    """
+    Asks GDB for the address of a variable through a debugging session.
+
+    Args:
+        session: A GDBSession; its run_command waits for the reply without spinning.
+        variable (str): The variable name.
+
+    Returns:
+        str: The hex address (e.g. '0x61ff1c'), or None if GDB could not take it.
+    """
+    output = session.run_command(f"print &{variable}")
+    match = PRINT_ADDRESS_RE.search(output)
+    return match.group(1) if match else None
 
 
-def extract_memory_state(gdb_process, output):
+def get_type(session, variable):
+    """
+    Asks GDB for the type and size of a variable through a debugging session.
+
+    Returns:
+        tuple: (type name, sizeof in bytes); either is None if GDB could not tell.
+    """
+    type_match = WHATIS_RE.search(session.run_command(f"whatis {variable}"))
+    size_match = PRINT_INT_RE.search(session.run_command(f"print sizeof({variable})"))
+    return (type_match.group(1).strip() if type_match else None,
+            int(size_match.group(1)) if size_match else None)
+
+
+def extract_memory_state(session, output):
     """Extract local variables and their values from GDB output."""
     """
         The `memory_state` dictionary holds the current state of variables in memory. Each key-value pair in the dictionary represents a variable's name and its corresponding information.
 
         Structure:
         {
-            'variable_name': (value, address)
+            'variable_name': (value, address, type, size, tree)
         }
 
         - `variable_name`: A string representing the name of the variable in the C program (e.g., 'a', 'x', 'b', etc.).
         - `value`: A string representing the current value of the variable. This could be an integer, floating-point number, array, or any other type.
         - `address`: A string representing the memory address where the variable is stored. The address is shown as a hexadecimal string (e.g., '0x61ff1c') or may include additional context like the function or location of the address in some cases (e.g., '0x4019db <__do_global_ctors+43>').
+        - `type`, `size`: The gdb type name and sizeof, only asked for arrays and structs (None otherwise).
+        - `tree`: The value parsed by gdb_values.parse_value, with every element's and member's address.
 
         Example:
             {
-                'a': ('2920448', '0x61ff1c'),
-                'x': ('0', '0x61ff1c'),
-                'y': ('7286096', '0x61ff1c'),
-                'b': ('5.88661943e-039', '0x61ff18'),
-                'n1': ('{-2, 6422280, 1990296173, 4200832, 6422356}', '0x61ff14'),
-                'ptr': ('0x4019db <__do_global_ctors+43>', '0x61ff10')
+                'a': ('2920448', '0x61ff1c', None, None, {'kind': 'int', 'value': 2920448, 'address': '0x61ff1c'}),
+                'n1': ('{-2, 6422280, 1990296173}', '0x61ff10', 'int [3]', 12,
+                       {'kind': 'array', 'length': 3, 'stride': 4, 'address': '0x61ff10', 'elements': [
+                           {'kind': 'int', 'value': -2, 'index': 0, 'address': '0x61ff10'}, ...]}),
+                'ptr': ('0x4019db', '0x61ff08', None, None,
+                        {'kind': 'pointer', 'value': '0x4019db', 'symbol': '__do_global_ctors+43', 'address': '0x61ff08'})
             }
 
         Notes:
@@ -538,37 +559,48 @@ def extract_memory_state(gdb_process, output):
             -  Some addresses may include additional debugging information (e.g., function names, offsets).
         """
     memory_state = {}
-    lines = output.splitlines()
+    # Only `name = value` lines: prompts, echoed source and info frame lines never match
+    for var_name, var_value in parse_locals(output):
+        address = session.get_address(var_name)
+        var_type = size = None
+        if var_value.lstrip()[:1] in ('{', '"'):  # Element addresses of arrays need the real element size
+            var_type, size = session.get_type(var_name)
+        value, address, tree = format_memory_entry(var_value, address, var_type, size)
+        memory_state[var_name] = (value, address, var_type, size, tree)
 
-    for line in lines:
-        # Skip lines starting with "(gdb)" or containing code like "4    int a",
-        # or containing eip or stack trace information
-        if line.startswith("(gdb)") and "=" not in line:
-            continue
-        if "int " in line or line.startswith("4\t") or "eip" in line:
-            continue
+    return memory_state
 
-        if line.startswith("(gdb)") and "=" in line:
-            line = line[len("(gdb)"):].strip()
-
-        # Filter out lines that don't contain "=" (skip non-variable lines)
-        if "=" in line:
-            try:
-                var_name, var_value = line.split("=", 1)
-                var_name = var_name.strip()
-                var_value = var_value.strip()
-                if '<__do_global_' in var_value:
-                    var_value = var_value.split()[0]
-                if '.' in var_value and '{' not in var_value:
-                    var_value = float(var_value)
-                    var_value = format(var_value,".3f")
-                address = get_address(gdb_process, var_name)
-                if '{' in var_value:
-                    address = int(address, 16)  # Convert hex address to an integer
-                    address = [hex(address + (i * 4)) for i in range(len(var_value))]
-                memory_state[var_name] = var_value, address
-                print(memory_state)
-            except ValueError:
-                continue  # Skip lines that don't split correctly
 
-    return memory_state
+def format_memory_entry(var_value, address, var_type=None, size=None, layout=None):
+    """
+    Shapes a raw gdb value and its address into a memory_state entry.
+
+    Args:
+        var_value (str): The value as printed by gdb (e.g. '10', '{1, 2, 3}').
+        address (str): The hex address of the variable (e.g. '0x61ff1c').
+        var_type (str): gdb's type name, e.g. 'int [3]'.
+        size (int): sizeof the variable.
+        layout (dict): Element sizes and member offsets (see declaration_index.type_layout);
+            without it they are worked out from var_type and size where possible.
+
+    Returns:
+        tuple: (value, address, tree), with floats rounded to 3 decimals and
+        tree the parsed value with an address on every element and member
+        (None if gdb printed something the parser does not know).
+    """
+    var_value = var_value.strip()
+    if '<__do_global_' in var_value:
+        var_value = var_value.split()[0]
+    if '.' in var_value and '{' not in var_value:
+        try:
+            var_value = format(float(var_value), ".3f")
+        except ValueError:
+            pass  # Not a number, e.g. a string containing a dot
+    try:
+        tree = parse_value(var_value)
+    except GDBValueError as e:
+        print(f"Could not parse gdb value: {e}")
+        tree = None
+    if tree is not None and address:
+        attach_addresses(tree, int(address, 16), layout or layout_from_type(var_type, size))
+    return var_value, address, tree
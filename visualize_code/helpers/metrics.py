@@ -0,0 +1,87 @@
+from contextlib import contextmanager
+import bisect
+import threading
+import time
+
+
+class LatencyHistogram:
+    """
+    Thread-safe latency histogram with fixed millisecond buckets.
+
+    Percentiles are reported as the upper bound of the bucket they fall in,
+    which is plenty to tell "low milliseconds" from "waiting on a timer".
+    """
+
+    BUCKETS_MS = (0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = [0] * (len(self.BUCKETS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def record(self, seconds):
+        elapsed_ms = seconds * 1000
+        index = bisect.bisect_left(self.BUCKETS_MS, elapsed_ms)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total_ms += elapsed_ms
+            self.max_ms = max(self.max_ms, elapsed_ms)
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(time.perf_counter() - start)
+
+    def percentile(self, fraction):
+        with self._lock:
+            counts, count, max_ms = list(self.counts), self.count, self.max_ms
+        if not count:
+            return 0.0
+        threshold = fraction * count
+        seen = 0
+        for index, bucket_count in enumerate(counts):
+            seen += bucket_count
+            if seen >= threshold:
+                return self.BUCKETS_MS[index] if index < len(self.BUCKETS_MS) else max_ms
+        return max_ms
+
+    def snapshot(self):
+        with self._lock:
+            counts, count = list(self.counts), self.count
+            avg_ms = self.total_ms / count if count else 0.0
+            max_ms = self.max_ms
+        buckets = {f"<={bound}ms": counts[index] for index, bound in enumerate(self.BUCKETS_MS)}
+        buckets[f">{self.BUCKETS_MS[-1]}ms"] = counts[-1]
+        return {
+            "count": count,
+            "avg_ms": round(avg_ms, 3),
+            "max_ms": round(max_ms, 3),
+            "p50_ms": self.percentile(0.50),
+            "p95_ms": self.percentile(0.95),
+            "p99_ms": self.percentile(0.99),
+            "buckets": buckets,
+        }
+
+
+_histograms = {}
+_histograms_lock = threading.Lock()
+
+
+def get_histogram(name):
+    """Return the process-wide histogram called name, creating it on first use."""
+    with _histograms_lock:
+        if name not in _histograms:
+            _histograms[name] = LatencyHistogram()
+        return _histograms[name]
+
+
+def histogram_snapshots():
+    with _histograms_lock:
+        histograms = dict(_histograms)
+    return {name: histogram.snapshot() for name, histogram in histograms.items()}
@@ -0,0 +1,47 @@
+from asgiref.sync import sync_to_async
+from .compile_cache import acompile_c_code, compile_c_code
+from .heap_tracker import build_heap_shim
+from .sandbox import arun_sandboxed, describe, run_sandboxed
+from .workspace import Workspace
+
+
+def compile_and_run(c_code):
+    """
+    Compiles and runs c_code in a private workspace, under the sandbox limits.
+
+    Args:
+        c_code (str): The C code submitted by the user.
+
+    Returns:
+        dict: {"output", "verdict"} after a run, plus "error" when the run hit a
+        limit or was killed, or just {"error": gcc diagnostics}.
+    """
+    with Workspace() as workspace:
+        binary = workspace.path('tempfile.out')
+        compile_result = compile_c_code(c_code, binary, source_name='tempfile.c')
+        if compile_result.returncode != 0:
+            return {"error": compile_result.stderr}
+
+        # The shim tells the sandbox when an allocation failed under the memory limit
+        preload = build_heap_shim(workspace)
+        return run_response(run_sandboxed([binary], workspace.root, preload=preload))
+
+
+async def acompile_and_run(c_code):
+    """Async counterpart of compile_and_run: gcc and the program are awaited on the event loop."""
+    with Workspace() as workspace:
+        binary = workspace.path('tempfile.out')
+        compile_result = await acompile_c_code(c_code, binary, source_name='tempfile.c')
+        if compile_result.returncode != 0:
+            return {"error": compile_result.stderr}
+
+        preload = await sync_to_async(build_heap_shim, thread_sensitive=False)(workspace)
+        return run_response(await arun_sandboxed([binary], workspace.root, preload=preload))
+
+
+def run_response(result):
+    """The view-facing dict for a sandbox RunResult."""
+    response = {"output": result.output, "verdict": result.verdict}
+    if result.verdict != "ok":
+        response["error"] = describe(result)
+    return response
@@ -0,0 +1,274 @@
+"""
+Resource-limited execution of submitted programs.
+
+The program runs in its own session (so its whole process group can be
+killed) with rlimits on CPU time, address space, process count, file size
+and core dumps. stdout and stderr go to a file in the working directory, so
+RLIMIT_FSIZE also caps how much output it can produce. The run ends with a
+structured verdict instead of hanging a worker:
+
+    ok            exited on its own (any exit status)
+    timeout       wall-clock or CPU limit reached
+    memory-limit  died abnormally after an allocation failed, or with peak
+                  memory close to the limit
+    output-limit  wrote more than the output limit
+    signal        killed by any other signal
+"""
+from django.conf import settings
+from collections import namedtuple
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+import time
+
+try:
+    import resource
+except ImportError:  # Windows: no rlimits, only the wall-clock timeout applies
+    resource = None
+
+SANDBOX_EXEC_SCRIPT = os.path.join(os.path.dirname(__file__), 'gdb_scripts', 'sandbox_exec.py')
+# Environment variable the exec-wrapper turns into the program's LD_PRELOAD
+PRELOAD_ENV = 'SANDBOX_PRELOAD'
+OUTPUT_FILE = '.sandbox-output'
+
+# Abnormal exits with peak RSS above this fraction of the memory limit count as memory-limit
+MEMORY_LIMIT_THRESHOLD = 0.8
+
+# max_processes is an RLIMIT_NPROC: counted per uid, so it includes the server's
+# own threads, gdb and other runs of the same user, and is no per-program cap
+SandboxLimits = namedtuple('SandboxLimits', ['wall_time', 'cpu_time', 'memory_bytes', 'max_processes', 'max_output_bytes'])
+RunResult = namedtuple('RunResult', ['verdict', 'returncode', 'signal', 'output', 'wall_time', 'cpu_time', 'max_rss'])
+
+VERDICT_MESSAGES = {
+    "timeout": "Time limit exceeded.",
+    "memory-limit": "Memory limit exceeded.",
+    "output-limit": "Output limit exceeded.",
+    "signal": "Program was killed by {signal}.",
+}
+
+
+def get_sandbox_limits():
+    """SandboxLimits from settings."""
+    return SandboxLimits(
+        wall_time=getattr(settings, 'SANDBOX_WALL_TIME', 5),
+        cpu_time=getattr(settings, 'SANDBOX_CPU_TIME', 2),
+        memory_bytes=getattr(settings, 'SANDBOX_MEMORY_BYTES', 256 * 1024 * 1024),
+        max_processes=getattr(settings, 'SANDBOX_MAX_PROCESSES', 256),
+        max_output_bytes=getattr(settings, 'SANDBOX_MAX_OUTPUT_BYTES', 1024 * 1024),
+    )
+
+
+def rlimits(limits):
+    """
+    The (resource, (soft, hard)) pairs applied to a sandboxed process. Zero means unlimited.
+
+    RLIMIT_NPROC fails fork once the whole uid has that many tasks, so a
+    busy server leaves a program fewer than max_processes (see the README).
+    """
+    if resource is None:
+        return []
+    pairs = [(resource.RLIMIT_CORE, (0, 0))]
+    if limits.cpu_time:
+        # SIGXCPU at the soft limit, SIGKILL a second later if it is ignored
+        pairs.append((resource.RLIMIT_CPU, (limits.cpu_time, limits.cpu_time + 1)))
+    if limits.memory_bytes:
+        pairs.append((resource.RLIMIT_AS, (limits.memory_bytes, limits.memory_bytes)))
+    if limits.max_processes:
+        pairs.append((resource.RLIMIT_NPROC, (limits.max_processes, limits.max_processes)))
+    if limits.max_output_bytes:
+        pairs.append((resource.RLIMIT_FSIZE, (limits.max_output_bytes, limits.max_output_bytes)))
+    return pairs
+
+
+def wrapper_arguments(limits):
+    """The limit arguments of gdb_scripts/sandbox_exec.py, in its order."""
+    return [str(limits.cpu_time), str(limits.memory_bytes), str(limits.max_processes), str(limits.max_output_bytes)]
+
+
+def exec_wrapper_command(limits=None):
+    """
+    Command line for gdb's `set exec-wrapper`, which applies the same limits
+    to a debugged program before gdb takes control of it.
+    """
+    limits = limits or get_sandbox_limits()
+    return " ".join([sys.executable, SANDBOX_EXEC_SCRIPT] + wrapper_arguments(limits) + ["--"])
+
+
+def verdict_for_signal(signal_name):
+    """Maps a signal name such as 'SIGXCPU' to the verdict it stands for."""
+    if signal_name == 'SIGXCPU':
+        return "timeout"
+    if signal_name == 'SIGXFSZ':
+        return "output-limit"
+    return "signal"
+
+
+def describe(result):
+    """A user-facing message for a RunResult that is not ok, or None."""
+    if result.verdict == "ok":
+        return None
+    return VERDICT_MESSAGES[result.verdict].format(signal=result.signal)
+
+
+def run_sandboxed(argv, cwd, limits=None, preload=None):
+    """
+    Runs argv in cwd under the sandbox limits.
+
+    Args:
+        argv (list): Program and arguments.
+        cwd (str): Working directory; the output file is written there.
+        limits (SandboxLimits): Defaults to get_sandbox_limits().
+        preload (str): The heap shim (heap_tracker.build_heap_shim), which
+            reports failed allocations; without it a memory-limit verdict
+            needs the peak RSS near the limit.
+
+    Returns:
+        RunResult: The verdict, exit status, captured output and resource usage.
+    """
+    limits = limits or get_sandbox_limits()
+    process, started, report = _spawn(argv, cwd, limits, preload)
+    deadline = started + limits.wall_time
+    delay = 0.001
+    status = _reap(process)
+    while status is None and time.monotonic() < deadline:
+        time.sleep(min(delay, max(deadline - time.monotonic(), 0)))
+        delay = min(delay * 2, 0.05)
+        status = _reap(process)
+    return _finish(process, status, started, report, cwd, limits)
+
+
+async def arun_sandboxed(argv, cwd, limits=None, preload=None):
+    """Async counterpart of run_sandboxed; waits on the event loop instead of a thread."""
+    limits = limits or get_sandbox_limits()
+    process, started, report = _spawn(argv, cwd, limits, preload)
+    deadline = started + limits.wall_time
+    delay = 0.001
+    status = _reap(process)
+    while status is None and time.monotonic() < deadline:
+        await asyncio.sleep(min(delay, max(deadline - time.monotonic(), 0)))
+        delay = min(delay * 2, 0.05)
+        status = _reap(process)
+    return _finish(process, status, started, report, cwd, limits)
+
+
+def _spawn(argv, cwd, limits, preload=None):
+    """
+    Starts argv, or the exec-wrapper supervising it when there is a memory
+    limit to judge. A child's ru_maxrss starts at the RSS of the process that
+    forked it (fork and exec keep the high-water mark), so the server's own
+    size would hide the program's; the wrapper is small and reports the
+    program's peak, and whether the preloaded shim saw an allocation fail,
+    on a pipe.
+
+    Returns:
+        tuple: (Popen, start time, read end of the report pipe or None).
+    """
+    pairs = rlimits(limits)
+
+    def apply_limits():
+        for limit, values in pairs:
+            resource.setrlimit(limit, values)
+
+    report = None
+    pass_fds = ()
+    preexec_fn = apply_limits if pairs else None
+    env = None
+    if pairs and limits.memory_bytes:
+        report, report_writer = os.pipe()
+        os.set_blocking(report, False)
+        pass_fds = (report_writer,)
+        preexec_fn = None  # The wrapper applies the limits to the program only
+        argv = ([sys.executable, '-I', '-S', SANDBOX_EXEC_SCRIPT, '--report', str(report_writer)]
+                + wrapper_arguments(limits) + ['--'] + list(argv))
+        if preload:
+            env = dict(os.environ, **{PRELOAD_ENV: preload})
+    try:
+        with open(os.path.join(cwd, OUTPUT_FILE), 'wb') as output:
+            process = subprocess.Popen(
+                argv, cwd=cwd, stdin=subprocess.DEVNULL, stdout=output, stderr=subprocess.STDOUT,
+                start_new_session=True, preexec_fn=preexec_fn, pass_fds=pass_fds, env=env,
+            )
+    except BaseException:
+        if report is not None:
+            os.close(report)
+        raise
+    finally:
+        for fd in pass_fds:
+            os.close(fd)
+    return process, time.monotonic(), report
+
+
+def _read_report(report):
+    """
+    The wrapper's report from its pipe.
+
+    Returns:
+        tuple: (the program's own peak RSS in bytes, whether an allocation
+        failed), or (None, False) if the wrapper sent none.
+    """
+    if report is None:
+        return None, False
+    try:
+        peak_kib, allocation_failed = os.read(report, 64).split()
+        return int(peak_kib) * 1024, allocation_failed == b'1'
+    except (BlockingIOError, ValueError):
+        return None, False  # Killed before the program exited
+    finally:
+        os.close(report)
+
+
+def _reap(process, block=False):
+    """Returns (wait status, rusage) once the process has exited, else None."""
+    try:
+        pid, status, usage = os.wait4(process.pid, 0 if block else os.WNOHANG)
+    except ChildProcessError:
+        return None
+    if pid == 0:
+        return None
+    process.returncode = os.waitstatus_to_exitcode(status)  # Keep Popen from waiting again
+    return status, usage
+
+
+def _finish(process, status, started, report, cwd, limits):
+    timed_out = status is None
+    # Also takes down anything the program forked and left behind
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+    if timed_out:
+        status = _reap(process, block=True)
+    wall_time = time.monotonic() - started
+
+    raw_status, usage = status if status else (0, None)
+    cpu_time = usage.ru_utime + usage.ru_stime if usage else 0.0
+    max_rss, allocation_failed = _read_report(report)
+    if max_rss is None:
+        max_rss = usage.ru_maxrss * 1024 if usage else 0
+    signal_name = None
+    if os.WIFSIGNALED(raw_status):
+        signal_name = signal.Signals(os.WTERMSIG(raw_status)).name
+        returncode = -os.WTERMSIG(raw_status)
+    else:
+        returncode = os.WEXITSTATUS(raw_status)
+
+    output_path = os.path.join(cwd, OUTPUT_FILE)
+    with open(output_path, 'rb') as file:
+        output = file.read(limits.max_output_bytes or -1).decode('utf-8', errors='replace')
+        output_exceeded = bool(limits.max_output_bytes) and bool(file.read(1))
+    os.remove(output_path)
+
+    if timed_out or signal_name == 'SIGXCPU':
+        verdict = "timeout"
+    elif signal_name == 'SIGXFSZ' or output_exceeded:
+        verdict = "output-limit"
+    elif ((signal_name or returncode) and limits.memory_bytes
+          and (allocation_failed or max_rss >= MEMORY_LIMIT_THRESHOLD * limits.memory_bytes)):
+        verdict = "memory-limit"
+    elif signal_name:
+        verdict = verdict_for_signal(signal_name)
+    else:
+        verdict = "ok"
+    return RunResult(verdict, returncode, signal_name, output, round(wall_time, 3), round(cpu_time, 3), max_rss)
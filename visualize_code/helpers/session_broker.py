@@ -0,0 +1,246 @@
+"""
+Out-of-process debugging session broker.
+
+A broker process owns the gdb sessions and web workers talk to it over a
+local Unix socket, so any worker can serve any step of any session. With
+several brokers, sessions are sharded by a stable hash of the session id.
+
+Wire format: every message is a 4-byte big-endian length followed by that
+many bytes of UTF-8 JSON. Requests look like
+{"op": "start" | "step" | "back" | "goto" | "rewind" | "resync" | "elements" | "frame" | "memory" |
+        "stop" | "stats" | "stream_open" | "stream_ack" | "stream_wait" | "stream_close",
+ "session_id": ..., ...}
+and the reply is the same dict the in-process call would have returned.
+"""
+from django.conf import settings
+from .executor import ExecutorBusy
+import json
+import os
+import socket
+import socketserver
+import struct
+import threading
+import zlib
+
+_HEADER = struct.Struct('>I')
+MAX_MESSAGE_BYTES = 16 * 1024 * 1024
+# Operations that change nothing when run twice, which makes them safe to resend after a lost reply
+IDEMPOTENT_OPS = frozenset({"resync", "elements", "frame", "memory", "stats", "stream_ack", "stream_wait",
+                            "stream_close"})
+
+
+class BrokerError(Exception):
+    """Raised when the broker cannot be reached or breaks the protocol."""
+
+
+def send_message(sock, message):
+    payload = json.dumps(message, separators=(',', ':')).encode('utf-8')
+    sock.sendall(_HEADER.pack(len(payload)) + payload)
+
+
+def recv_message(sock):
+    """Reads one framed message, or returns None if the peer closed the connection."""
+    header = _recv_exactly(sock, _HEADER.size)
+    if header is None:
+        return None
+    (length,) = _HEADER.unpack(header)
+    if length > MAX_MESSAGE_BYTES:
+        raise BrokerError(f"Message of {length} bytes exceeds the {MAX_MESSAGE_BYTES} byte limit.")
+    payload = _recv_exactly(sock, length)
+    if payload is None:
+        raise BrokerError("Connection closed in the middle of a message.")
+    return json.loads(payload)
+
+
+def _recv_exactly(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(size)
+        if not chunk:
+            if chunks:
+                raise BrokerError("Connection closed in the middle of a message.")
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def handle_request(request):
+    """Runs one broker request against this process's sessions."""
+    from .gdb_helper import (
+        back_session, elements_session, frame_session, goto_session, memory_session, resync_session, rewind_session,
+        start_session, step_session, stop_session,
+    )
+    from .session_manager import get_session_manager
+    from .step_stream import get_ack_board
+
+    op = request.get("op")
+    session_id = request.get("session_id")
+    try:
+        if op == "start":
+            return start_session(
+                session_id, request.get("c_code", ""), owner=request.get("owner"), mode=request.get("mode")
+            )
+        if op == "step":
+            return step_session(
+                session_id, delta=request.get("delta", False), seq=request.get("seq"), kind=request.get("kind", "over")
+            )
+        if op == "back":
+            return back_session(session_id, delta=request.get("delta", False), seq=request.get("seq"))
+        if op == "goto":
+            return goto_session(
+                session_id, request.get("step"), delta=request.get("delta", False), seq=request.get("seq")
+            )
+        if op == "rewind":
+            return rewind_session(
+                session_id, line=request.get("line"), delta=request.get("delta", False), seq=request.get("seq")
+            )
+        if op == "resync":
+            return resync_session(session_id)
+        if op == "elements":
+            return elements_session(session_id, request.get("variable"), request.get("start", 0), request.get("count"))
+        if op == "frame":
+            return frame_session(session_id, request.get("level", 0))
+        if op == "memory":
+            return memory_session(session_id, request.get("address"), request.get("length"))
+        if op == "stop":
+            return stop_session(session_id)
+        if op == "stats":
+            return get_session_manager().stats()
+        # Step stream acknowledgements, posted to whichever web worker, waited for by the one streaming
+        if op == "stream_open":
+            return {"generation": get_ack_board().open(session_id)}
+        if op == "stream_ack":
+            return get_ack_board().ack(session_id, request.get("id", 0))
+        if op == "stream_wait":
+            return get_ack_board().wait(session_id, request.get("generation"), request.get("acked", 0),
+                                        min(request.get("timeout", 0), 10))
+        if op == "stream_close":
+            get_ack_board().close(session_id, request.get("generation"))
+            return {}
+        return {"error": f"Unknown broker operation {op!r}."}
+    except ExecutorBusy as busy:
+        return {"error": str(busy), "busy": True, "retry_after": busy.retry_after}
+
+
+class _BrokerHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        # One connection carries many requests from the same web worker thread
+        while True:
+            try:
+                request = recv_message(self.request)
+            except (BrokerError, OSError, ValueError) as e:
+                print(f"Dropping broker connection: {e}")
+                return
+            if request is None:
+                return
+            try:
+                response = handle_request(request)
+            except Exception as e:
+                response = {"error": str(e)}
+            try:
+                send_message(self.request, response)
+            except OSError:
+                return
+
+
+class SessionBroker(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path):
+        if os.path.exists(socket_path):
+            os.remove(socket_path)  # Stale socket from a previous run
+        super().__init__(socket_path, _BrokerHandler)
+        os.chmod(socket_path, 0o660)
+
+
+class BrokerClient:
+    """
+    Talks to one or more brokers. Each thread keeps its own connection per
+    shard. A request that could not be sent, e.g. because the broker
+    restarted since the connection was opened, is retried once on a fresh
+    connection. Once it has been sent, only IDEMPOTENT_OPS are retried: the
+    broker may have run a step or start before the reply was lost, and
+    sending it again would run it twice.
+    """
+
+    def __init__(self, socket_paths, timeout=30):
+        self.socket_paths = list(socket_paths)
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def shard_for(self, session_id):
+        """Stable across processes, unlike hash()."""
+        return zlib.crc32((session_id or '').encode('utf-8')) % len(self.socket_paths)
+
+    def call(self, op, session_id=None, **payload):
+        shard = self.shard_for(session_id)
+        request = {"op": op, "session_id": session_id, **payload}
+        for attempt in range(2):
+            sent = False
+            try:
+                sock = self._connection(shard)
+                send_message(sock, request)
+                sent = True
+                response = recv_message(sock)
+                if response is None:
+                    raise BrokerError("Broker closed the connection.")
+            except (OSError, BrokerError) as e:
+                self._drop(shard)
+                if attempt or (sent and op not in IDEMPOTENT_OPS):
+                    raise BrokerError(f"Session broker unavailable: {e}")
+                continue
+            if response.get("busy"):
+                raise ExecutorBusy(response.get("retry_after", 1))
+            return response
+
+    def stats(self):
+        return [self._call_shard(shard, {"op": "stats"}) for shard in range(len(self.socket_paths))]
+
+    def _call_shard(self, shard, request):
+        try:
+            sock = self._connection(shard)
+            send_message(sock, request)
+            return recv_message(sock)
+        except (OSError, BrokerError) as e:
+            self._drop(shard)
+            return {"error": f"Session broker unavailable: {e}"}
+
+    def _connection(self, shard):
+        connections = self._connections()
+        if shard not in connections:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            try:
+                sock.connect(self.socket_paths[shard])
+            except OSError as e:
+                sock.close()
+                raise BrokerError(f"Session broker unavailable: {e}")
+            connections[shard] = sock
+        return connections[shard]
+
+    def _drop(self, shard):
+        sock = self._connections().pop(shard, None)
+        if sock is not None:
+            sock.close()
+
+    def _connections(self):
+        if not hasattr(self._local, 'connections'):
+            self._local.connections = {}
+        return self._local.connections
+
+
+_broker_client = None
+_broker_client_lock = threading.Lock()
+
+
+def get_broker_client():
+    """Return the BrokerClient for DEBUG_SESSION_BROKER_SOCKETS, or None to keep sessions in-process."""
+    global _broker_client
+    socket_paths = getattr(settings, 'DEBUG_SESSION_BROKER_SOCKETS', None)
+    if not socket_paths:
+        return None
+    with _broker_client_lock:
+        if _broker_client is None or _broker_client.socket_paths != list(socket_paths):
+            _broker_client = BrokerClient(socket_paths, timeout=getattr(settings, 'DEBUG_SESSION_BROKER_TIMEOUT', 30))
+        return _broker_client
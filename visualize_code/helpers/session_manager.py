@@ -0,0 +1,270 @@
+from django.conf import settings
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+import asyncio
+import functools
+import threading
+import time
+
+try:
+    import psutil
+except ImportError:  # Memory accounting is skipped without psutil
+    psutil = None
+
+
+class SessionBusy(Exception):
+    """Raised when another request kept a session's lock for longer than DEBUG_SESSION_LOCK_TIMEOUT."""
+
+    def __init__(self):
+        super().__init__("The debugging session is busy with another step, please retry.")
+
+
+def lock_timeout():
+    return getattr(settings, 'DEBUG_SESSION_LOCK_TIMEOUT', 60)
+
+
+@contextmanager
+def hold(session):
+    """
+    Holds session.lock, which every request that drives the session's gdb
+    takes (steps, whether posted or streamed, rewinds, memory reads and
+    teardown), so two of them never talk to the same gdb at once.
+
+    Raises:
+        SessionBusy: The lock was not free within DEBUG_SESSION_LOCK_TIMEOUT.
+    """
+    if not session.lock.acquire(timeout=lock_timeout()):
+        raise SessionBusy()
+    try:
+        yield session
+    finally:
+        session.lock.release()
+
+
+@asynccontextmanager
+async def ahold(session):
+    """Async counterpart of hold; a contended lock is waited for on a worker thread, not on the event loop."""
+    if not session.lock.acquire(blocking=False):
+        waiting = asyncio.get_running_loop().run_in_executor(
+            None, functools.partial(session.lock.acquire, timeout=lock_timeout()))
+        try:
+            acquired = await asyncio.shield(waiting)
+        except asyncio.CancelledError:
+            # The thread may still get the lock; hand it straight back
+            waiting.add_done_callback(lambda done: done.result() and session.lock.release())
+            raise
+        if not acquired:
+            raise SessionBusy()
+    try:
+        yield session
+    finally:
+        session.lock.release()
+
+
+def stop_when_idle(session):
+    """
+    Stops session once the request holding its lock, if any, is done. A
+    request still holding it after DEBUG_SESSION_LOCK_TIMEOUT is stuck in a
+    hung gdb, and the session is stopped anyway rather than leaked.
+    """
+    acquired = session.lock.acquire(timeout=lock_timeout())
+    if not acquired:
+        print("Stopping a debugging session whose lock is still held")
+    try:
+        return session.stop_debugging()
+    finally:
+        if acquired:
+            session.lock.release()
+
+
+class _Entry:
+    def __init__(self, session, owner):
+        self.session = session
+        self.owner = owner
+        self.created = time.monotonic()
+        self.last_used = self.created
+
+
+class SessionManager:
+    """
+    Owns every live debugging session in this process.
+
+    Sessions are kept in least-recently-used order. Adding a session beyond
+    the global cap or the per-user cap stops the least recently used one
+    (the user's own oldest session for the per-user cap), and a background
+    reaper stops sessions nobody has touched for idle_timeout seconds, so
+    abandoned tabs cannot leak gdb processes. Both wait for the session's
+    lock (see hold), so a session is never torn down in the middle of a step.
+    """
+
+    def __init__(self, idle_timeout, max_sessions, max_per_user, reap_interval):
+        self.idle_timeout = idle_timeout
+        self.max_sessions = max_sessions
+        self.max_per_user = max_per_user
+        self.reap_interval = reap_interval
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self._reaper = None
+        self._stop_reaper = threading.Event()
+        self.started = 0
+        self.stopped = 0
+        self.evicted_idle = 0
+        self.evicted_capacity = 0
+
+    def add(self, session_id, session, owner=None):
+        """Registers a session, stopping whatever it replaces or pushes over a cap."""
+        victims = []
+        with self._lock:
+            replaced = self._sessions.pop(session_id, None)
+            if replaced is not None:
+                victims.append(replaced.session)
+
+            owned = [key for key, entry in self._sessions.items() if entry.owner == owner]
+            while owner is not None and owned and len(owned) >= self.max_per_user:
+                victims.append(self._sessions.pop(owned.pop(0)).session)
+                self.evicted_capacity += 1
+            while self._sessions and len(self._sessions) >= self.max_sessions:
+                victims.append(self._sessions.popitem(last=False)[1].session)
+                self.evicted_capacity += 1
+
+            self._sessions[session_id] = _Entry(session, owner)
+            self.started += 1
+        self._stop_all(victims)
+
+    def get(self, session_id):
+        """Returns the session and marks it as just used, or None."""
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            entry.last_used = time.monotonic()
+            self._sessions.move_to_end(session_id)
+            return entry.session
+
+    def pop(self, session_id):
+        with self._lock:
+            entry = self._sessions.pop(session_id, None)
+            if entry is not None:
+                self.stopped += 1
+            return entry.session if entry else None
+
+    def reap(self):
+        """Stops every session idle for longer than idle_timeout. Returns how many."""
+        deadline = time.monotonic() - self.idle_timeout
+        victims = []
+        with self._lock:
+            # LRU order: the idle ones are all at the front
+            for session_id, entry in list(self._sessions.items()):
+                if entry.last_used > deadline:
+                    break
+                victims.append(self._sessions.pop(session_id).session)
+                self.evicted_idle += 1
+        self._stop_all(victims)
+        return len(victims)
+
+    def start_reaper(self):
+        with self._lock:
+            if self._reaper is not None:
+                return
+            self._reaper = threading.Thread(target=self._reap_loop, name='ccv-session-reaper', daemon=True)
+        self._reaper.start()
+
+    def shutdown(self):
+        """Stops the reaper and every session."""
+        self._stop_reaper.set()
+        with self._lock:
+            victims = [entry.session for entry in self._sessions.values()]
+            self._sessions.clear()
+        self._stop_all(victims)
+
+    def stats(self):
+        with self._lock:
+            entries = list(self._sessions.values())
+            counters = {
+                "started": self.started,
+                "stopped": self.stopped,
+                "evicted_idle": self.evicted_idle,
+                "evicted_capacity": self.evicted_capacity,
+            }
+        now = time.monotonic()
+        pids = [pid for pid in (getattr(entry.session, 'gdb_pid', None) for entry in entries) if pid]
+        return {
+            "sessions": len(entries),
+            "owners": len({entry.owner for entry in entries}),
+            "oldest_idle_s": round(max((now - entry.last_used for entry in entries), default=0), 1),
+            "gdb_processes": len(pids),
+            "memory_bytes": _memory_of(pids),
+            "threads": threading.active_count(),
+            "limits": {
+                "idle_timeout_s": self.idle_timeout,
+                "max_sessions": self.max_sessions,
+                "max_per_user": self.max_per_user,
+            },
+            **counters,
+        }
+
+    def _reap_loop(self):
+        while not self._stop_reaper.wait(self.reap_interval):
+            try:
+                self.reap()
+            except Exception as e:
+                print(f"Unexpected error while reaping debugging sessions: {e}")
+
+    def _stop_all(self, sessions):
+        for session in sessions:
+            try:
+                # A step may still be using the session's gdb; tear it down once the step is done
+                stop_when_idle(session)
+            except Exception as e:
+                print(f"Failed to stop debugging session: {e}")
+            with self._lock:
+                self.stopped += 1
+
+
+def _memory_of(pids):
+    """Resident memory of the given gdb processes and their inferiors, if psutil is available."""
+    if psutil is None:
+        return None
+    total = 0
+    for pid in pids:
+        try:
+            process = psutil.Process(pid)
+            for member in [process, *process.children(recursive=True)]:
+                total += member.memory_info().rss
+        except psutil.Error:
+            continue
+    return total
+
+
+def session_owner(request):
+    """
+    Who a debugging session counts against for the per-user cap: the user
+    when logged in, otherwise the browser session. Keying anonymous users by
+    address instead (DEBUG_SESSION_OWNER_BY_IP) puts everyone behind one
+    reverse proxy or NAT under a single cap, so it is opt-in.
+    """
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return f"user:{user.pk}"
+    if getattr(settings, 'DEBUG_SESSION_OWNER_BY_IP', False):
+        return f"ip:{request.META.get('REMOTE_ADDR', '')}"
+    return f"session:{request.session.session_key}"
+
+
+_session_manager = None
+_session_manager_lock = threading.Lock()
+
+
+def get_session_manager():
+    """Return the process-wide SessionManager, starting its reaper on first use."""
+    global _session_manager
+    with _session_manager_lock:
+        if _session_manager is None:
+            _session_manager = SessionManager(
+                idle_timeout=getattr(settings, 'DEBUG_SESSION_IDLE_TIMEOUT', 600),
+                max_sessions=getattr(settings, 'DEBUG_SESSION_MAX', 50),
+                max_per_user=getattr(settings, 'DEBUG_SESSION_MAX_PER_USER', 2),
+                reap_interval=getattr(settings, 'DEBUG_SESSION_REAP_INTERVAL', 30),
+            )
+            _session_manager.start_reaper()
+        return _session_manager
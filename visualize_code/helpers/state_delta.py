@@ -0,0 +1,90 @@
+import threading
+
+
+def diff_memory_state(previous, current):
+    """
+    Compares two memory_state dicts.
+
+    Args:
+        previous (dict): The memory_state the client already has.
+        current (dict): The memory_state of the new step.
+
+    Returns:
+        dict: {"added": {name: entry}, "changed": {name: entry}, "removed": [name, ...]}
+    """
+    added = {}
+    changed = {}
+    for name, entry in current.items():
+        if name not in previous:
+            added[name] = entry
+        elif previous[name] != entry:
+            changed[name] = entry
+    removed = [name for name in previous if name not in current]
+    return {"added": added, "changed": changed, "removed": removed}
+
+
+def apply_memory_delta(state, delta):
+    """Returns a new memory_state with a diff_memory_state delta applied to state."""
+    state = dict(state)
+    for name in delta.get("removed", ()):
+        state.pop(name, None)
+    state.update(delta.get("added", {}))
+    state.update(delta.get("changed", {}))
+    return state
+
+
+class MemoryDeltaEncoder:
+    """
+    Tracks the last step response sent to a session's client and numbers
+    steps with a sequence number, so a step can be sent either in full or as
+    a memory_delta against the state the client already holds.
+
+    A delta is only sent when the client's seq matches the last one sent;
+    otherwise (a lost response, a reload) the client gets a full snapshot.
+    """
+
+    def __init__(self):
+        self.seq = -1
+        self.last_response = None
+        self._lock = threading.Lock()
+
+    def encode(self, response, delta=False, client_seq=None):
+        """
+        Numbers a step response and, when asked for, replaces its memory_state
+        with a delta against the previous step.
+
+        Args:
+            response (dict): Step response with a full memory_state.
+            delta (bool): Whether the client wants a delta.
+            client_seq (int): The last seq the client applied.
+
+        Returns:
+            dict: The response with "seq" set, and "memory_delta" and "base_seq" in place of "memory_state" for deltas.
+        """
+        if "error" in response or "memory_state" not in response:
+            return response
+
+        with self._lock:
+            previous = self.last_response
+            base_seq = self.seq
+            self.seq += 1
+            self.last_response = response
+            seq = self.seq
+
+        if not delta or previous is None or client_seq != base_seq:
+            return dict(response, seq=seq, full=True)
+
+        encoded = {key: value for key, value in response.items() if key != "memory_state"}
+        encoded.update(
+            seq=seq,
+            base_seq=base_seq,
+            memory_delta=diff_memory_state(previous["memory_state"], response["memory_state"]),
+        )
+        return encoded
+
+    def snapshot(self):
+        """The full last response, for clients resynchronising their state."""
+        with self._lock:
+            if self.last_response is None:
+                return {"error": "Debugging session not started."}
+            return dict(self.last_response, seq=self.seq, full=True)
@@ -0,0 +1,254 @@
+"""
+Server-Sent Events stream of debugging steps.
+
+The server steps the session by itself, either at a fixed rate ("play") or
+as fast as it can ("run"), until the program ends. Each event carries the
+usual step response, with memory_state replaced by a memory_delta against
+the previous event the client received.
+
+Flow control: the client acknowledges the id of every event it has rendered
+(POST /stream_ack/, which may reach any web worker, see AckBoard). At most `window` events are unacknowledged at a time;
+while the window is full the server keeps stepping but holds only the newest
+step, and sends it, with "coalesced" set to the number of steps skipped,
+as soon as the client catches up.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from .gdb_helper import astep_session
+from .session_broker import get_broker_client
+from .state_delta import diff_memory_state
+import asyncio
+import itertools
+import json
+import threading
+import time
+
+
+class AckBoard:
+    """
+    The latest event id acknowledged for each session's open stream. The
+    stream is served by one web worker while its acks may be posted to any
+    other, so with the session broker configured the board that counts is
+    the broker's (see BrokerAckBoard); without it, this process's.
+
+    Opening a stream for a session replaces the one it had: each stream gets
+    a new generation, and wait() tells the old one it was replaced.
+    """
+
+    def __init__(self):
+        self._streams = {}  # session_id -> [generation, acked]
+        self._generations = itertools.count(1)
+        self._changed = threading.Condition()
+
+    def open(self, session_id):
+        with self._changed:
+            generation = next(self._generations)
+            self._streams[session_id] = [generation, 0]
+            self._changed.notify_all()
+            return generation
+
+    def ack(self, session_id, event_id):
+        """Records that the client has rendered event_id."""
+        with self._changed:
+            entry = self._streams.get(session_id)
+            if entry is None:
+                return {"error": "No active step stream."}
+            entry[1] = max(entry[1], event_id)
+            self._changed.notify_all()
+            return {"acked": entry[1]}
+
+    def wait(self, session_id, generation, acked, timeout):
+        """
+        Waits up to timeout seconds for an ack past acked; 0 just looks.
+
+        Returns:
+            dict: {"acked": latest acked id, "replaced": True if another stream took over the session}.
+        """
+        deadline = time.monotonic() + timeout
+        with self._changed:
+            while True:
+                entry = self._streams.get(session_id)
+                if entry is None or entry[0] != generation:
+                    return {"acked": acked, "replaced": True}
+                remaining = deadline - time.monotonic()
+                if entry[1] > acked or remaining <= 0:
+                    return {"acked": entry[1], "replaced": False}
+                self._changed.wait(remaining)
+
+    def close(self, session_id, generation):
+        with self._changed:
+            entry = self._streams.get(session_id)
+            if entry is not None and entry[0] == generation:
+                del self._streams[session_id]
+                self._changed.notify_all()
+
+
+class BrokerAckBoard:
+    """The AckBoard of the broker that holds the session, which every web worker reaches."""
+
+    def __init__(self, broker):
+        self.broker = broker
+
+    def open(self, session_id):
+        return self.broker.call("stream_open", session_id)["generation"]
+
+    def ack(self, session_id, event_id):
+        return self.broker.call("stream_ack", session_id, id=event_id)
+
+    def wait(self, session_id, generation, acked, timeout):
+        return self.broker.call("stream_wait", session_id, generation=generation, acked=acked, timeout=timeout)
+
+    def close(self, session_id, generation):
+        self.broker.call("stream_close", session_id, generation=generation)
+
+
+_ack_board = AckBoard()
+
+
+def get_ack_board():
+    """This process's AckBoard; the broker serves its stream_* operations from it."""
+    return _ack_board
+
+
+def _board():
+    broker = get_broker_client()
+    return BrokerAckBoard(broker) if broker else get_ack_board()
+
+
+def ack_stream(session_id, event_id):
+    """Acknowledges a session's stream events up to event_id, from any web worker."""
+    return _board().ack(session_id, event_id)
+
+
+class StepStream:
+    """Acknowledgement window of one session's event stream, kept in step with its AckBoard."""
+
+    def __init__(self, session_id, board, window, ack_timeout):
+        self.session_id = session_id
+        self.board = board
+        self.window = max(1, window)
+        self.ack_timeout = ack_timeout
+        self.generation = None
+        self.sent = 0
+        self.acked = 0
+        self.last_ack = time.monotonic()
+        self.closed = False
+
+    async def open(self):
+        self.generation = await sync_to_async(self.board.open, thread_sensitive=False)(self.session_id)
+
+    async def close(self):
+        self.closed = True
+        await sync_to_async(self.board.close, thread_sensitive=False)(self.session_id, self.generation)
+
+    def has_credit(self):
+        return self.sent - self.acked < self.window
+
+    async def refresh(self, timeout=0):
+        """Picks up the acks posted so far, waiting up to timeout for a new one; notices replacement."""
+        state = await sync_to_async(self.board.wait, thread_sensitive=False)(
+            self.session_id, self.generation, self.acked, max(timeout, 0))
+        if state.get("replaced"):
+            self.closed = True
+        acked = min(state.get("acked", 0), self.sent)
+        if acked > self.acked:
+            self.acked = acked
+            self.last_ack = time.monotonic()
+
+    async def wait_for_credit(self, timeout):
+        if not self.has_credit():
+            await self.refresh(timeout)
+        return self.has_credit() and not self.closed
+
+    def stalled(self):
+        """True once the client has held a full window for longer than ack_timeout."""
+        return not self.has_credit() and time.monotonic() - self.last_ack > self.ack_timeout
+
+
+async def _step(session_id):
+    broker = get_broker_client()
+    if broker:
+        return await sync_to_async(broker.call, thread_sensitive=False)("step", session_id)
+    return await astep_session(session_id)
+
+
+def format_event(event, data, event_id=None):
+    lines = [f"id: {event_id}"] if event_id is not None else []
+    lines += [f"event: {event}", f"data: {json.dumps(data, separators=(',', ':'))}"]
+    return "\n".join(lines) + "\n\n"
+
+
+async def stream_steps(session_id, rate=None):
+    """
+    Steps session_id until the program ends and yields SSE-formatted events.
+
+    Args:
+        session_id (str): Debugging session to drive.
+        rate (float): Steps per second, or None to run to the end as fast as the client keeps up.
+
+    Yields:
+        str: "step" events, then one "end" event.
+    """
+    stream = StepStream(
+        session_id, _board(),
+        window=getattr(settings, 'DEBUG_STREAM_WINDOW', 4),
+        ack_timeout=getattr(settings, 'DEBUG_STREAM_ACK_TIMEOUT', 30),
+    )
+    await stream.open()
+    interval = 1 / rate if rate else 0
+    loop = asyncio.get_running_loop()
+    last_state = None
+    last_seq = None
+    pending = None
+    skipped = 0
+
+    def encode(response):
+        nonlocal last_state, last_seq
+        stream.sent += 1
+        if "error" in response or "memory_state" not in response:
+            return format_event("step", response, stream.sent)
+        event = {key: value for key, value in response.items() if key not in ("memory_state", "full")}
+        if last_state is None:
+            event["memory_state"] = response["memory_state"]
+        else:
+            event["base_seq"] = last_seq
+            event["memory_delta"] = diff_memory_state(last_state, response["memory_state"])
+        event["coalesced"] = skipped
+        last_state = response["memory_state"]
+        last_seq = response.get("seq")
+        return format_event("step", event, stream.sent)
+
+    reason = "completed"
+    try:
+        while True:
+            started = loop.time()
+            await stream.refresh()
+            if stream.closed:
+                reason = "replaced"  # One stream per session; the newest wins
+                break
+            response = await _step(session_id)
+            finished = "error" in response or response.get("status") != "running"
+            if pending is not None:
+                skipped += 1
+            pending = response
+
+            if finished or stream.has_credit():
+                yield encode(pending)
+                pending, skipped = None, 0
+            if finished:
+                reason = "error" if "error" in response else "completed"
+                break
+            if stream.stalled():
+                reason = "client-stalled"
+                break
+
+            delay = interval - (loop.time() - started)
+            if pending is not None and delay > 0 and await stream.wait_for_credit(delay):
+                yield encode(pending)
+                pending, skipped = None, 0
+            delay = interval - (loop.time() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        yield format_event("end", {"reason": reason, "seq": last_seq})
+    finally:
+        await stream.close()
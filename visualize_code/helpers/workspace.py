@@ -0,0 +1,48 @@
+from django.conf import settings
+import os
+import shutil
+import tempfile
+import weakref
+
+
+class Workspace:
+    """
+    Private scratch directory for one compile/run or one debugging session.
+
+    Every request gets its own directory, so concurrent users never overwrite
+    each other's source files or binaries. The directory is removed by
+    cleanup(), when used as a context manager on exit, and as a last resort
+    when the Workspace object is garbage collected or the process exits.
+    """
+
+    def __init__(self, prefix='ccv-'):
+        root = getattr(settings, 'BUILD_WORKSPACE_ROOT', None)
+        if root:
+            os.makedirs(root, exist_ok=True)
+        self.root = tempfile.mkdtemp(prefix=prefix, dir=root)
+        self._finalizer = weakref.finalize(self, shutil.rmtree, self.root, True)
+
+    def path(self, name):
+        """Return the absolute path of name inside the workspace."""
+        return os.path.join(self.root, name)
+
+    def write(self, name, content):
+        """Write a text file into the workspace and return its path."""
+        path = self.path(name)
+        with open(path, 'w') as file:
+            file.write(content)
+        return path
+
+    @property
+    def alive(self):
+        return self._finalizer.alive
+
+    def cleanup(self):
+        """Remove the workspace directory and everything in it. Safe to call twice."""
+        self._finalizer()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.cleanup()
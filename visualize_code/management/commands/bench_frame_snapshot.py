@@ -0,0 +1,64 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from visualize_code.helpers.compile_cache import compile_c_code
+from visualize_code.helpers.gdb_pool import FRAME_SNAPSHOT_SCRIPT
+from visualize_code.helpers.gdb_mi import MIController, mi_quote
+from visualize_code.helpers.workspace import Workspace
+import time
+
+
+def make_program(local_count):
+    declarations = "\n".join(f"    int v{i} = {i};" for i in range(local_count))
+    return f"int main() {{\n{declarations}\n    return 0;\n}}\n", local_count + 2
+
+
+class Command(BaseCommand):
+    help = ("Compares the per-step cost of reading locals with one `print &var` "
+            "per variable against the batched frame-snapshot query.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--locals', type=int, nargs='+', default=[1, 8, 32, 128])
+        parser.add_argument('--repeat', type=int, default=50)
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'locals':>8} {'per-variable ms':>16} {'snapshot ms':>12} {'speedup':>8}")
+        for local_count in options['locals']:
+            per_variable, snapshot = self.measure(local_count, options['repeat'])
+            self.stdout.write(
+                f"{local_count:>8} {per_variable:>16.2f} {snapshot:>12.2f} {per_variable / snapshot:>7.1f}x"
+            )
+
+    def measure(self, local_count, repeat):
+        c_code, return_line = make_program(local_count)
+        with Workspace(prefix='ccv-bench-') as workspace:
+            binary = workspace.path('test_temp.out')
+            workspace.write('test_temp.c', c_code)
+            compile_result = compile_c_code(c_code, binary, source_name='test_temp.c')
+            if compile_result.returncode != 0:
+                raise CommandError(compile_result.stderr)
+
+            controller = MIController(gdb_path=getattr(settings, 'GDB_PATH', 'gdb'), cwd=workspace.root)
+            try:
+                controller.command(f"-file-exec-and-symbols {mi_quote(binary)}")
+                controller.console(f"source {FRAME_SNAPSHOT_SCRIPT}")
+                controller.command(f"-break-insert test_temp.c:{return_line}")
+                controller.execute("-exec-run")
+
+                def per_variable_step():
+                    results, _ = controller.command("-stack-list-variables --all-values")
+                    for variable in results["variables"]:
+                        controller.command(f"-data-evaluate-expression {mi_quote('&' + variable['name'])}")
+
+                def snapshot_step():
+                    controller.console("frame-snapshot")
+
+                return self.time_ms(per_variable_step, repeat), self.time_ms(snapshot_step, repeat)
+            finally:
+                controller.close()
+
+    def time_ms(self, step, repeat):
+        step()  # Warm up gdb's symbol and value caches
+        start = time.perf_counter()
+        for _ in range(repeat):
+            step()
+        return (time.perf_counter() - start) / repeat * 1000
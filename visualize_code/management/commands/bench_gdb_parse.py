@@ -0,0 +1,111 @@
+from django.core.management.base import BaseCommand, CommandError
+from visualize_code.helpers.gdb_output import iter_declarations, parse_locals
+import re
+import time
+
+
+def make_info_locals(variable_count):
+    """A synthetic `info locals` dump with scalars, floats, arrays, pointers and echoed prompts."""
+    lines = ["(gdb) info locals"]
+    for i in range(variable_count):
+        kind = i % 4
+        if kind == 0:
+            lines.append(f"v{i} = {i}")
+        elif kind == 1:
+            lines.append(f"f{i} = {i}.5")
+        elif kind == 2:
+            lines.append(f"arr{i} = {{" + ", ".join(str(n) for n in range(64)) + "}")
+        else:
+            lines.append(f"p{i} = 0x4019db <__do_global_ctors+43>")
+    lines.append("(gdb) ")
+    return "\n".join(lines) + "\n"
+
+
+def make_listing(line_count):
+    """A synthetic source listing as printed by `list`/`next`."""
+    statements = ["int x{} = {};", "int arr{}[4] = {{1, 2, 3, {}}};", "char *p{} = &c{};", "x{} += {};"]
+    return "".join(f"{n}\t    {statements[n % 4].format(n, n)}\n" for n in range(1, line_count + 1))
+
+
+def legacy_locals(output):
+    # extract_memory_state before the tokenizer, without the per-variable gdb round trip
+    found = []
+    for line in output.splitlines():
+        if line.startswith("(gdb)") and "=" not in line:
+            continue
+        if "int " in line or line.startswith("4\t") or "eip" in line:
+            continue
+        if line.startswith("(gdb)") and "=" in line:
+            line = line[len("(gdb)"):].strip()
+        if "=" in line:
+            try:
+                var_name, var_value = line.split("=", 1)
+                found.append((var_name.strip(), var_value))
+            except ValueError:
+                continue
+    return found
+
+
+def legacy_declarations(output):
+    # parse_gdb_output before the tokenizer: three inline patterns tried on every line
+    found = []
+    for line in output.splitlines():
+        if re.match(r'^\s*\d+\s+(int|float|char)\s+([\w]+)\s*=\s*(.+);$', line):
+            found.append(line)
+        if re.match(r'^\s*\d+\s+(int|float|char)\s+([\w]+)\s*\[\d*\]\s*=\s*\{\s*([^}]*)\s*\};$', line):
+            found.append(line)
+        if re.match(r'^\s*\d+\s+(int|float|char|double|long|short)\s*\*\s*([\w]+)\s*=\s*([^;]+);$', line):
+            found.append(line)
+    return found
+
+
+def tokenized_declarations(output):
+    return [match.group(0) for match in iter_declarations(output)]
+
+
+class Command(BaseCommand):
+    help = ("Compares the substring/regex-per-line gdb output parsing with the "
+            "precompiled single-pass tokenizer on large info locals dumps and listings.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--variables', type=int, nargs='+', default=[100, 1000, 10000])
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--transcript', help="A captured `info locals` transcript to time instead.")
+
+    def handle(self, *args, **options):
+        if options['transcript']:
+            try:
+                with open(options['transcript']) as file:
+                    inputs = [("transcript", file.read())]
+            except OSError as e:
+                raise CommandError(str(e))
+        else:
+            inputs = [(f"{count} locals", make_info_locals(count)) for count in options['variables']]
+
+        self.stdout.write(f"{'input':>16} {'MB':>6} {'legacy MB/s':>12} {'tokenizer MB/s':>15} {'speedup':>8}")
+        for label, output in inputs:
+            if [name for name, _ in legacy_locals(output)] != [name for name, _ in parse_locals(output)]:
+                self.stderr.write(f"{label}: the two parsers disagree on this input")
+            self.report(label, output, legacy_locals, parse_locals, options['repeat'])
+
+        for count in options['variables']:
+            listing = make_listing(count)
+            if len(legacy_declarations(listing)) != len(tokenized_declarations(listing)):
+                self.stderr.write(f"{count} src lines: the two parsers disagree on this input")
+            self.report(f"{count} src lines", listing, legacy_declarations, tokenized_declarations, options['repeat'])
+
+    def report(self, label, output, legacy, tokenizer, repeat):
+        megabytes = len(output.encode('utf-8')) / 1e6
+        legacy_seconds = self.time(legacy, output, repeat)
+        tokenizer_seconds = self.time(tokenizer, output, repeat)
+        self.stdout.write(
+            f"{label:>16} {megabytes:>6.2f} {megabytes / legacy_seconds:>12.1f} "
+            f"{megabytes / tokenizer_seconds:>15.1f} {legacy_seconds / tokenizer_seconds:>7.1f}x"
+        )
+
+    def time(self, parse, output, repeat):
+        parse(output)  # Warm up the regex caches
+        start = time.perf_counter()
+        for _ in range(repeat):
+            parse(output)
+        return (time.perf_counter() - start) / repeat
@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand, CommandError
+from visualize_code.helpers.gdb_helper import MIGDBSession
+import time
+
+LOOP_PROGRAM = """int main() {
+    int total = 0;
+    for (int i = 0; i < 100000; i++) {
+        total += i;
+    }
+    return total;
+}
+"""
+
+
+class Command(BaseCommand):
+    help = ("Compares rewinding a debugging session through gdb checkpoints "
+            "against re-running the program and replaying every step.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--steps', type=int, default=400, help="Step to rewind from.")
+        parser.add_argument('--distances', type=int, nargs='+', default=[1, 10, 100, 300])
+        parser.add_argument('--interval', type=int, default=25, help="Checkpoint interval.")
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'distance':>8} {'checkpoint ms':>14} {'replay ms':>10} {'speedup':>8}")
+        for distance in options['distances']:
+            if distance > options['steps']:
+                raise CommandError(f"Cannot rewind {distance} steps from step {options['steps']}.")
+            checkpoint = self.measure(options['steps'], distance, options['interval'])
+            replay = self.measure(options['steps'], distance, 0)
+            self.stdout.write(f"{distance:>8} {checkpoint:>14.1f} {replay:>10.1f} {replay / checkpoint:>7.1f}x")
+
+    def measure(self, steps, distance, interval):
+        session = MIGDBSession('bench-rewind')
+        session.checkpoint_interval = interval
+        try:
+            response = session.start_debugging(LOOP_PROGRAM)
+            if "error" in response:
+                raise CommandError(response["error"])
+            for _ in range(steps):
+                session.step_forward()
+
+            start = time.perf_counter()
+            response = session.rewind_to(steps - distance)
+            elapsed = (time.perf_counter() - start) * 1000
+            if "error" in response:
+                raise CommandError(response["error"])
+            return elapsed
+        finally:
+            session.stop_debugging()
@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from visualize_code.helpers.session_broker import SessionBroker
+from visualize_code.helpers.session_manager import get_session_manager
+
+
+class Command(BaseCommand):
+    help = ("Runs a debugging session broker that owns gdb sessions for all web "
+            "workers. Start one per entry in DEBUG_SESSION_BROKER_SOCKETS.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shard', type=int, default=0,
+                            help="Index into DEBUG_SESSION_BROKER_SOCKETS to listen on.")
+        parser.add_argument('--socket', help="Listen on this path instead of a configured shard.")
+
+    def handle(self, *args, **options):
+        socket_path = options['socket']
+        if not socket_path:
+            socket_paths = getattr(settings, 'DEBUG_SESSION_BROKER_SOCKETS', [])
+            if not 0 <= options['shard'] < len(socket_paths):
+                raise CommandError("Set DEBUG_SESSION_BROKER_SOCKETS or pass --socket.")
+            socket_path = socket_paths[options['shard']]
+
+        broker = SessionBroker(socket_path)
+        self.stdout.write(f"Session broker listening on {socket_path}")
+        try:
+            broker.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            broker.server_close()
+            get_session_manager().shutdown()
@@ -1,3 +1,1566 @@
-from django.test import TestCase
+from asgiref.sync import async_to_sync, sync_to_async
+from django.test import TestCase, RequestFactory, override_settings
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+import asyncio
+import ctypes
+import json
+import os
+import shutil
+import socket
+import struct
+import subprocess
+import tempfile
+import threading
+import time
+import unittest
+
+from . import views
+from .helpers.clang_cache import TranslationUnitCache
+from .helpers.compile_cache import CompileCache
+from .helpers.declaration_index import get_declaration_index
+from .helpers.executor import BuildExecutor, ExecutorBusy
+from .helpers.gdb_helper import GDBSession, MIGDBSession, TraceSession, astep_session, step_session
+from .helpers.gdb_mi import parse_mi_record
+from .helpers.heap_tracker import EVENT_ALLOC, EVENT_FREE, EVENT_REALLOC, RING_ENV, HeapMap, HeapRing, build_heap_shim
+from .helpers.history import StepHistory
+from .helpers.inferior_memory import MemorySnapshot, plan_reads
+from .helpers.memory_decode import decode_elements, decode_value, format_value, hexdump
+from .helpers.gdb_pool import GDBPool
+from .helpers.gdb_output import parse_locals, tokenize
+from .helpers.gdb_values import GDBValueError, parse_value
+from .helpers.memory_helper import (extract_function_name, extract_line_number, extract_memory_data, extract_memory_state,
+                                    format_memory_entry, parse_backtrace, parse_gdb_output, parse_with_clang)
+from .helpers.metrics import LatencyHistogram
+from .helpers.sandbox import PRELOAD_ENV, SandboxLimits, arun_sandboxed, exec_wrapper_command, run_sandboxed
+from .helpers.session_broker import BrokerClient, BrokerError, SessionBroker, recv_message
+from .helpers.session_manager import SessionManager, get_session_manager, session_owner
+from .helpers.state_delta import MemoryDeltaEncoder, apply_memory_delta
+from .helpers.step_stream import BrokerAckBoard, ack_stream, stream_steps
+from .helpers.workspace import Workspace
 
 # Create your tests here.
+
+HAS_GCC = shutil.which('gcc') is not None
+HAS_GDB = shutil.which('gdb') is not None
+
+
+class WorkspaceTests(TestCase):
+    def test_workspaces_are_private_and_cleaned_up(self):
+        workspaces = [Workspace() for _ in range(20)]
+        roots = {workspace.root for workspace in workspaces}
+        self.assertEqual(len(roots), 20)
+
+        for workspace in workspaces:
+            workspace.write('tempfile.c', 'int main() { return 0; }')
+            workspace.cleanup()
+            workspace.cleanup()
+            self.assertFalse(os.path.exists(workspace.root))
+
+    def test_context_manager_cleans_up_on_error(self):
+        with self.assertRaises(RuntimeError):
+            with Workspace() as workspace:
+                workspace.write('tempfile.c', '')
+                raise RuntimeError("boom")
+        self.assertFalse(os.path.exists(workspace.root))
+
+
+@unittest.skipUnless(HAS_GCC, "gcc is required to compile submissions")
+class CompileCacheTests(TestCase):
+    PROGRAM = 'int main() { return 0; }\n'
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir, True)
+        self.addCleanup(shutil.rmtree, self.output_dir, True)
+        self.cache = CompileCache(self.cache_dir, 64 * 1024 * 1024)
+
+    def output(self, name='out'):
+        return os.path.join(self.output_dir, name)
+
+    def test_identical_source_is_a_hit(self):
+        first = self.cache.compile(self.PROGRAM, self.output('first'))
+        second = self.cache.compile(self.PROGRAM, self.output('second'))
+        self.assertEqual((first.returncode, first.cached), (0, False))
+        self.assertEqual((second.returncode, second.cached), (0, True))
+        self.assertTrue(os.path.exists(self.output('second')))
+        stats = self.cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["entries"]), (1, 1, 1))
+
+    def test_failed_compile_is_cached_with_its_stderr(self):
+        first = self.cache.compile('int main() { return }\n', self.output())
+        self.assertNotEqual(first.returncode, 0)
+        self.assertIn('tempfile.c', first.stderr)
+        second = self.cache.compile('int main() { return }\n', self.output())
+        self.assertEqual((second.returncode, second.stderr, second.cached), (first.returncode, first.stderr, True))
+        self.assertFalse(os.path.exists(self.output()))
+
+    def test_compiler_version_and_flags_are_part_of_the_key(self):
+        key = self.cache.make_key(self.PROGRAM, 'tempfile.c', ('-g',))
+        self.assertNotEqual(self.cache.make_key(self.PROGRAM, 'tempfile.c', ('-g', '-O2')), key)
+        self.assertNotEqual(self.cache.make_key(self.PROGRAM, 'other.c', ('-g',)), key)
+        with mock.patch('visualize_code.helpers.compile_cache.compiler_version', lambda compiler='gcc': 'gcc (test) 99'):
+            self.assertNotEqual(self.cache.make_key(self.PROGRAM, 'tempfile.c', ('-g',)), key)
+
+    def test_evict_drops_the_least_recently_used_entries(self):
+        programs = [f'int main() {{ return {number}; }}\n' for number in range(3)]
+        keys = [self.cache.make_key(program, 'tempfile.c', ('-g',)) for program in programs]
+        for program in programs:
+            self.cache.compile(program, self.output())
+        for last_used, key in zip((300, 100, 200), keys):  # The second program is the oldest
+            os.utime(os.path.join(self.cache_dir, key, 'meta.json'), (last_used, last_used))
+
+        self.cache.max_bytes = self.cache.stats()["bytes"] - 1
+        self.cache.evict()
+        self.assertEqual(sorted(name for name in os.listdir(self.cache_dir) if len(name) == 64), sorted([keys[0], keys[2]]))
+        self.assertEqual(self.cache.stats()["evictions"], 1)
+
+        self.cache.max_bytes = 0
+        self.cache.evict()
+        self.assertEqual(self.cache.stats()["entries"], 0)
+
+    def test_losing_the_publish_race_still_returns_the_result(self):
+        self.cache.compile(self.PROGRAM, self.output('first'))
+        # Another worker published the entry while this one was compiling
+        with mock.patch.object(CompileCache, '_lookup', return_value=None):
+            result = self.cache.compile(self.PROGRAM, self.output('second'))
+        self.assertEqual((result.returncode, result.cached), (0, False))
+        self.assertTrue(os.path.exists(self.output('second')))
+        self.assertEqual([name for name in os.listdir(self.cache_dir) if name != '.lock'],
+                         [self.cache.make_key(self.PROGRAM, 'tempfile.c', ('-g',))])
+
+
+@unittest.skipUnless(HAS_GCC, "gcc is required to compile submissions")
+class ConcurrentRunCodeTests(TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.workspace_root = tempfile.mkdtemp()
+        self.factory = RequestFactory()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+        shutil.rmtree(self.workspace_root, ignore_errors=True)
+
+    def run_code(self, number):
+        c_code = '#include <stdio.h>\nint main() { printf("%d\\n", ' + str(number) + '); return 0; }\n'
+        request = self.factory.post('/', {'action': 'run_code', 'c_code': c_code})
+        response = async_to_sync(views.home)(request)
+        return number, response.content.decode()
+
+    def test_concurrent_submissions_do_not_collide(self):
+        with override_settings(COMPILE_CACHE_DIR=self.cache_dir, BUILD_WORKSPACE_ROOT=self.workspace_root):
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                results = list(executor.map(self.run_code, range(32)))
+
+        for number, content in results:
+            self.assertIn(f'<code class="language-c line-numbers">{number}\n</code>', content)
+        self.assertEqual(os.listdir(self.workspace_root), [])
+        self.assertFalse(os.path.exists('tempfile.c'))
+        self.assertFalse(os.path.exists('tempfile.out'))
+
+    async def test_identical_async_compiles_build_once(self):
+        cache = CompileCache(self.cache_dir, 64 * 1024 * 1024)
+        c_code = 'int main() { return 0; }\n'
+        outputs = [os.path.join(self.workspace_root, f'out{i}') for i in range(8)]
+        results = await asyncio.gather(*[cache.acompile(c_code, output) for output in outputs])
+
+        self.assertTrue(all(result.returncode == 0 for result in results))
+        self.assertTrue(all(os.path.exists(output) for output in outputs))
+        self.assertEqual(cache.stats()["misses"], 1)
+
+    async def test_async_compile_keeps_blocking_work_off_the_loop(self):
+        cache = CompileCache(self.cache_dir, 64 * 1024 * 1024)
+        threads = []
+
+        def version(compiler='gcc'):
+            threads.append(threading.get_ident())
+            return 'gcc (test) 1.0'
+
+        copy_threads = []
+        real_copy2 = shutil.copy2
+
+        def copy2(source, destination):
+            copy_threads.append(threading.get_ident())
+            return real_copy2(source, destination)
+
+        with mock.patch('visualize_code.helpers.compile_cache.compiler_version', version), \
+                mock.patch.object(CompileCache, 'evict', lambda cache: threads.append(threading.get_ident())), \
+                mock.patch('visualize_code.helpers.compile_cache.shutil.copy2', copy2):
+            result = await cache.acompile('int main() { return 0; }\n', os.path.join(self.workspace_root, 'out'))
+            hit = await cache.acompile('int main() { return 0; }\n', os.path.join(self.workspace_root, 'hit'))
+        self.assertEqual((result.returncode, result.cached, hit.cached), (0, False, True))
+        self.assertEqual(len(threads), 3)  # Both keys, and eviction after the miss only
+        self.assertNotIn(threading.get_ident(), threads)
+        self.assertEqual(len(copy_threads), 2)  # Published by the miss, copied out by the hit
+        self.assertNotIn(threading.get_ident(), copy_threads)
+
+
+@unittest.skipUnless(HAS_GCC and os.name == 'posix', "gcc and rlimits are required to run submissions")
+class SandboxTests(TestCase):
+    LIMITS = SandboxLimits(wall_time=3, cpu_time=1, memory_bytes=64 * 1024 * 1024, max_processes=0, max_output_bytes=4096)
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, True)
+
+    def build(self, body):
+        source = os.path.join(self.directory, 'program.c')
+        with open(source, 'w') as file:
+            file.write('#include <stdio.h>\n#include <stdlib.h>\n#include <string.h>\n#include <unistd.h>\n' + body)
+        binary = os.path.join(self.directory, 'program.out')
+        subprocess.run(['gcc', source, '-o', binary], check=True)
+        return [binary]
+
+    def test_normal_run(self):
+        result = run_sandboxed(self.build('int main() { printf("hi\\n"); return 3; }'), self.directory, self.LIMITS)
+        self.assertEqual((result.verdict, result.returncode, result.output), ("ok", 3, "hi\n"))
+        self.assertFalse(os.path.exists(os.path.join(self.directory, '.sandbox-output')))
+
+    def test_cpu_limit(self):
+        result = run_sandboxed(self.build('int main() { for (;;); }'), self.directory, self.LIMITS)
+        self.assertEqual(result.verdict, "timeout")
+        self.assertGreaterEqual(result.cpu_time, 0.9)
+
+    def test_wall_limit_kills_the_process_group(self):
+        argv = self.build('int main() { if (fork() == 0) { printf("%d\\n", getpid()); fflush(stdout); } sleep(60); }')
+        limits = self.LIMITS._replace(wall_time=0.5)
+        started = time.monotonic()
+        result = run_sandboxed(argv, self.directory, limits)
+        self.assertEqual(result.verdict, "timeout")
+        self.assertLess(time.monotonic() - started, 5)
+        # The forked child was killed with its parent (gone, or a zombie waiting for its new parent)
+        child = int(result.output)
+        state = None
+        for _ in range(100):  # SIGKILL can take a moment to land
+            try:
+                with open(f'/proc/{child}/stat') as file:
+                    state = file.read().rsplit(')', 1)[1].split()[0]
+            except FileNotFoundError:
+                break
+            if state == 'Z':
+                break
+            time.sleep(0.01)
+        else:
+            self.fail(f"process {child} is still {state}")
+
+    def test_output_limit(self):
+        result = run_sandboxed(self.build('int main() { for (;;) printf("spam spam spam\\n"); }'), self.directory, self.LIMITS)
+        self.assertEqual(result.verdict, "output-limit")
+        self.assertEqual(len(result.output), 4096)
+
+    def test_memory_limit(self):
+        body = 'int main() { for (;;) { char *p = malloc(1 << 20); memset(p, 1, 1 << 20); } }'
+        result = run_sandboxed(self.build(body), self.directory, self.LIMITS)
+        self.assertEqual((result.verdict, result.signal), ("memory-limit", "SIGSEGV"))
+
+    def test_single_oversized_allocation_is_a_memory_limit(self):
+        workspace = Workspace()
+        self.addCleanup(workspace.cleanup)
+        with override_settings(COMPILE_CACHE_DIR=self.directory):
+            preload = build_heap_shim(workspace)
+        body = 'int main() { char *p = malloc(512 << 20); p[0] = 1; return 0; }'
+        result = run_sandboxed(self.build(body), self.directory, self.LIMITS, preload=preload)
+        self.assertEqual((result.verdict, result.signal), ("memory-limit", "SIGSEGV"))
+        self.assertLess(result.max_rss, self.LIMITS.memory_bytes / 2)  # The allocation never became resident
+
+        # A program that checks for NULL and gives up cleanly is not a memory-limit
+        body = 'int main() { if (!malloc(512 << 20)) { puts("no memory"); return 0; } return 1; }'
+        result = run_sandboxed(self.build(body), self.directory, self.LIMITS, preload=preload)
+        self.assertEqual((result.verdict, result.output), ("ok", "no memory\n"))
+
+    def test_memory_limit_below_the_servers_own_rss(self):
+        import resource
+        ballast = bytearray(2 * self.LIMITS.memory_bytes)  # Zero-filled, so every page is resident
+        self.assertGreater(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024, self.LIMITS.memory_bytes)
+        failing = run_sandboxed(self.build('int main() { return 1; }'), self.directory, self.LIMITS)
+        self.assertEqual((failing.verdict, failing.returncode), ("ok", 1))
+        self.assertLess(failing.max_rss, self.LIMITS.memory_bytes / 2)
+        body = 'int main() { for (;;) { char *p = malloc(1 << 20); memset(p, 1, 1 << 20); } }'
+        exhausted = run_sandboxed(self.build(body), self.directory, self.LIMITS)
+        self.assertEqual((exhausted.verdict, exhausted.signal), ("memory-limit", "SIGSEGV"))
+        del ballast
+
+    async def test_async_run(self):
+        result = await arun_sandboxed(self.build('int main() { for (;;); }'), self.directory, self.LIMITS)
+        self.assertEqual(result.verdict, "timeout")
+
+    @override_settings(SANDBOX_CPU_TIME=1)
+    def test_run_code_reports_the_verdict(self):
+        c_code = '#include <stdio.h>\nint main() { printf("started\\n"); fflush(stdout); for (;;); }\n'
+        request = RequestFactory().post('/', {'action': 'run_code', 'c_code': c_code})
+        with override_settings(COMPILE_CACHE_DIR=self.directory):
+            content = async_to_sync(views.home)(request).content.decode()
+        self.assertIn('<pre class="error-box">Time limit exceeded.</pre>', content)
+        self.assertIn('started', content)
+
+
+class TranslationUnitCacheTests(TestCase):
+    def test_same_source_is_parsed_once(self):
+        cache = TranslationUnitCache(max_entries=2)
+        with cache.translation_unit('int a = 1;') as first:
+            pass
+        with cache.translation_unit('int a = 1;') as second:
+            self.assertIs(first, second)
+        self.assertEqual((cache.stats()["parses"], cache.stats()["hits"]), (1, 1))
+
+    def test_sessions_reparse_their_previous_unit(self):
+        cache = TranslationUnitCache(max_entries=4)
+        with cache.translation_unit('int a = 1;', session_key='s') as unit:
+            pass
+        with cache.translation_unit('int a = 1; int b = 2;', session_key='s') as edited:
+            self.assertIs(edited, unit)
+            self.assertEqual([cursor.spelling for cursor in edited.cursor.get_children()], ['a', 'b'])
+        self.assertEqual((cache.stats()["parses"], cache.stats()["reparses"]), (1, 1))
+
+    def test_shared_units_are_not_rewritten(self):
+        cache = TranslationUnitCache(max_entries=4)
+        with cache.translation_unit('int a = 1;', session_key='s'):
+            pass
+        with cache.translation_unit('int a = 1;', session_key='t'):
+            pass
+        with cache.translation_unit('int a = 2;', session_key='s'):
+            pass
+        self.assertEqual((cache.stats()["parses"], cache.stats()["reparses"]), (2, 0))
+
+    def test_lru_eviction(self):
+        cache = TranslationUnitCache(max_entries=2)
+        for code in ('int a;', 'int b;', 'int c;', 'int a;'):
+            with cache.translation_unit(code):
+                pass
+        self.assertEqual(cache.stats()["evictions"], 2)
+        self.assertEqual(cache.stats()["parses"], 4)
+
+    def test_parse_with_clang_addresses_do_not_drift(self):
+        statement = 'int a = 1; int arr[2] = {3, 4};'
+        self.assertEqual(parse_with_clang(statement), parse_with_clang(statement))
+        self.assertEqual(parse_with_clang(statement)[1]["address"], ['0x001004', '0x001008'])
+
+
+class DeclarationIndexTests(TestCase):
+    PROGRAM = (
+        '#include <stdio.h>\n'                          # 1
+        'double scale = 1.5;\n'                         # 2
+        'int square(int n) { return n * n; }\n'         # 3
+        'int main() {\n'                                # 4
+        '    int total = 0;\n'                          # 5
+        '    long grid[2][3] = {{1, 2, 3}, {4, 5, 6}};\n'  # 6
+        '    for (int i = 0; i < 3; i++) {\n'           # 7
+        '        int total = i;\n'                      # 8
+        '    }\n'                                       # 9
+        '    char later = 65;\n'                        # 10
+        '    printf("%d\\n", total);\n'                 # 11
+        '    return 0;\n'                               # 12
+        '}\n'                                           # 13
+    )
+
+    def test_declarations(self):
+        index = get_declaration_index(self.PROGRAM)
+        names = [(declaration.function, declaration.name) for declaration in index.declarations]
+        self.assertEqual(names, [(None, 'scale'), ('square', 'n'), ('main', 'total'), ('main', 'grid'),
+                                 ('main', 'i'), ('main', 'total'), ('main', 'later')])
+        grid = index.lookup('grid', 'main')
+        self.assertEqual((grid.size, grid.element_type, grid.element_size, grid.element_count), (48, 'long[3]', 24, 2))
+        self.assertEqual(grid.initializer, [['1', '2', '3'], ['4', '5', '6']])
+        self.assertEqual(index.lookup('n', 'square').kind, "parameter")
+        self.assertEqual(index.lookup('i', 'main').scope, (7, 9))
+        self.assertIs(get_declaration_index(self.PROGRAM), index)
+
+    def test_lookup_by_line(self):
+        index = get_declaration_index(self.PROGRAM)
+        self.assertEqual(index.lookup('total', 'main', 8).line, 8)
+        self.assertEqual(index.lookup('total', 'main', 11).line, 5)
+        self.assertIsNone(index.lookup('later', 'main', 6))
+        self.assertEqual(index.lookup('scale', 'main', 5).kind, "global")
+
+    def test_extract_memory_data(self):
+        memory_data = extract_memory_data(self.PROGRAM)
+        self.assertEqual(memory_data[0], {"variable": "scale", "value": "1.5", "type": "double", "address": "0x001000"})
+        # scale is a double at 0x1000, total an int at 0x1008, then grid's two rows 8-byte aligned
+        grid = next(entry for entry in memory_data if entry["variable"] == "grid")
+        self.assertEqual((grid["type"], grid["address"]), ("long[3][]", ["0x001010", "0x001028"]))
+
+    def test_snapshot_skips_variables_not_declared_yet(self):
+        session = MIGDBSession('index')
+        session.declarations = get_declaration_index(self.PROGRAM)
+        variables = [
+            {"name": name, "type": "int", "value": "0", "address": "0x10", "size": 4}
+            for name in ("total", "later", "unknown")
+        ]
+        response = session.snapshot({"frame": {}}, {"function": "main", "line": 6, "variables": variables})
+        self.assertEqual(sorted(response["memory_state"]), ["total", "unknown"])
+
+
+class BuildExecutorTests(TestCase):
+    def fill(self, executor, count):
+        release = threading.Event()
+        started = threading.Event()
+
+        def block():
+            started.set()
+            release.wait()
+
+        futures = [executor.submit(block) for _ in range(count)]
+        started.wait(timeout=5)
+        return release, futures
+
+    def test_full_queue_is_rejected_with_retry_after(self):
+        executor = BuildExecutor(max_workers=1, max_queue=1)
+        release, futures = self.fill(executor, 2)
+        try:
+            with self.assertRaises(ExecutorBusy) as raised:
+                executor.submit(release.wait)
+            self.assertGreaterEqual(raised.exception.retry_after, 1)
+
+            stats = executor.stats()
+            self.assertEqual(stats["queue_depth"], 1)
+            self.assertEqual(stats["running"], 1)
+            self.assertEqual(stats["rejected"], 1)
+        finally:
+            release.set()
+        for future in futures:
+            future.result(timeout=5)
+
+        self.assertEqual(executor.stats()["completed"], 2)
+        self.assertTrue(executor.run(lambda: True))
+
+    def test_async_jobs_share_the_queue(self):
+        executor = BuildExecutor(max_workers=1, max_queue=0)
+
+        async def job(value):
+            await asyncio.sleep(0)
+            return value
+
+        release, futures = self.fill(executor, 1)
+        try:
+            with self.assertRaises(ExecutorBusy):
+                async_to_sync(executor.arun)(job, 1)
+        finally:
+            release.set()
+        futures[0].result(timeout=5)
+
+        self.assertEqual(async_to_sync(executor.arun)(job, 2), 2)
+        stats = executor.stats()
+        self.assertEqual((stats["rejected"], stats["completed"], stats["running"]), (1, 2, 0))
+
+    def test_async_jobs_from_many_event_loops_share_the_worker_limit(self):
+        executor = BuildExecutor(max_workers=2, max_queue=10)
+        lock = threading.Lock()
+        counts = {"running": 0, "peak": 0}
+
+        async def job():
+            with lock:
+                counts["running"] += 1
+                counts["peak"] = max(counts["peak"], counts["running"])
+            await asyncio.sleep(0.05)
+            with lock:
+                counts["running"] -= 1
+
+        # Each thread's async_to_sync call runs on an event loop of its own, as under WSGI
+        with ThreadPoolExecutor(max_workers=6) as pool:
+            for future in [pool.submit(async_to_sync(executor.arun), job) for _ in range(6)]:
+                future.result(timeout=10)
+        self.assertEqual(counts["peak"], 2)
+        self.assertEqual(executor.stats()["completed"], 6)
+
+    def test_run_code_answers_busy_when_queue_is_full(self):
+        executor = BuildExecutor(max_workers=1, max_queue=0)
+        release, futures = self.fill(executor, 1)
+        try:
+            request = RequestFactory().post('/', {'action': 'run_code', 'c_code': 'int main() { return 0; }'})
+            with mock.patch.object(views, 'get_build_executor', return_value=executor):
+                response = async_to_sync(views.home)(request)
+        finally:
+            release.set()
+        futures[0].result(timeout=5)
+
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response)
+
+
+class MIRecordParserTests(TestCase):
+    def test_result_record_with_token_and_nested_values(self):
+        record = parse_mi_record(
+            '7^done,variables=[{name="a",value="10"},{name="s",value="\\"hi\\\\n\\""}]'
+        )
+        self.assertEqual(record["type"], "result")
+        self.assertEqual(record["token"], 7)
+        self.assertEqual(record["class"], "done")
+        self.assertEqual(record["results"]["variables"], [
+            {"name": "a", "value": "10"},
+            {"name": "s", "value": '"hi\\n"'},
+        ])
+
+    def test_stopped_record(self):
+        record = parse_mi_record(
+            '*stopped,reason="end-stepping-range",frame={addr="0x1139",func="main",args=[],'
+            'file="test_temp.c",line="5"},thread-id="1"'
+        )
+        self.assertEqual(record["type"], "exec")
+        self.assertEqual(record["class"], "stopped")
+        self.assertEqual(record["results"]["frame"]["line"], "5")
+        self.assertEqual(record["results"]["frame"]["args"], [])
+
+    def test_stream_records_and_prompt(self):
+        self.assertEqual(parse_mi_record('~"$1 = 5\\n"'), {"type": "console", "payload": "$1 = 5\n"})
+        self.assertEqual(parse_mi_record('~"\\303\\251"')["payload"], "\u00e9")
+        self.assertEqual(parse_mi_record('(gdb) '), {"type": "prompt"})
+        self.assertEqual(parse_mi_record('hello from printf')["type"], "unknown")
+
+
+class GDBOutputTests(TestCase):
+    OUTPUT = (
+        '(gdb) Breakpoint 1, main () at test_temp.c:5\n'
+        '5\t    int x = 10;\n'
+        '(gdb) x = 10\n'
+        'arr = {1, 2, 3}\n'
+        'ptr = 0x4019db <__do_global_ctors+43>\n'
+        '$1 = (int *) 0x61ff1c\n'
+        '#1  0x0000555555555189 in sq (n=3, m=4) at test_temp.c:4\n'
+        ' eip = 0x401 in main (test_temp.c:5); saved eip = 0x402\n'
+    )
+
+    def test_tokenize(self):
+        kinds = [token.kind for token in tokenize(self.OUTPUT)]
+        self.assertEqual(kinds, ['FRAME', 'SOURCE', 'LOCAL', 'LOCAL', 'LOCAL', 'HISTORY', 'FRAME', 'OTHER'])
+
+    def test_parse_locals(self):
+        self.assertEqual(parse_locals(self.OUTPUT), [
+            ('x', '10'), ('arr', '{1, 2, 3}'), ('ptr', '0x4019db <__do_global_ctors+43>'),
+        ])
+
+    def test_extract_function_name(self):
+        self.assertEqual(extract_function_name(self.OUTPUT), 'main')
+        self.assertEqual(extract_function_name(self.OUTPUT.split('\n', 1)[1]), 'sq')
+
+    def test_backtrace_and_line_number(self):
+        listing = '#0  sq (n=3) at test_temp.c:4\n#1  0x0000555555555171 in main () at test_temp.c:10\n(gdb) '
+        self.assertEqual(parse_backtrace(listing), [{"level": 0, "function": "sq", "line": 4},
+                                                    {"level": 1, "function": "main", "line": 10}])
+        self.assertEqual(extract_line_number('main () at test_temp.c:9\n9\t    return 0;\n(gdb) '), 9)
+        self.assertIsNone(extract_line_number('Run till exit from #0  sq (n=3) at test_temp.c:4\n'))
+
+    def test_parse_gdb_output(self):
+        listing = '5\t    int x = 10;\n6\t    int arr[3] = {};\n7\t    int *p = &x;\n8\t    x += 1;\n'
+        x, arr, p = parse_gdb_output(listing)
+        self.assertEqual((x["variable"], x["value"], x["type"]), ('x', '10', 'int'))
+        self.assertEqual((arr["value"], len(arr["address"])), (['0', '0', '0'], 3))
+        self.assertEqual((p["type"], p["value"]), ('int*', x["address"]))
+
+
+class GDBValueTests(TestCase):
+    def test_scalars(self):
+        self.assertEqual(parse_value('-12'), {"kind": "int", "value": -12})
+        self.assertEqual(parse_value('2.5'), {"kind": "float", "value": 2.5})
+        self.assertEqual(parse_value("65 'A'"), {"kind": "char", "value": 65, "char": "A"})
+        self.assertEqual(parse_value('true'), {"kind": "bool", "value": True})
+        self.assertEqual(parse_value('<optimized out>'), {"kind": "text", "value": "<optimized out>"})
+        self.assertEqual(parse_value('RED'), {"kind": "text", "value": "RED"})
+
+    def test_pointers(self):
+        self.assertEqual(parse_value('(int *) 0x7ffc10'), {"kind": "pointer", "value": "0x7ffc10", "type": "int *"})
+        self.assertEqual(parse_value('0x4019db <__do_global_ctors+43>'),
+                         {"kind": "pointer", "value": "0x4019db", "symbol": "__do_global_ctors+43"})
+        self.assertEqual(parse_value('0x402004 "hi"')["target"], '"hi"')
+        self.assertEqual(parse_value('{int (int)} 0x401136 <square>'),
+                         {"kind": "pointer", "value": "0x401136", "symbol": "square", "type": "int (int)"})
+
+    def test_nested_aggregates(self):
+        tree = parse_value('{p = {x = 1, y = 2}, xs = {3, 0 <repeats 98 times>, 4}, name = 0x0}')
+        self.assertEqual(tree["kind"], "struct")
+        self.assertEqual(tree["fields"]["p"]["fields"]["y"], {"kind": "int", "value": 2})
+        xs = tree["fields"]["xs"]
+        self.assertEqual(xs["length"], 100)
+        self.assertEqual([(element["index"], element.get("repeat", 1)) for element in xs["elements"]],
+                         [(0, 1), (1, 98), (99, 1)])
+        self.assertTrue(parse_value('{1, 2, 3...}')["truncated"])
+
+    def test_char_arrays(self):
+        tree = parse_value("\"hi\", '\\000' <repeats 14 times>")
+        self.assertEqual(tree["length"], 16)
+        self.assertEqual(tree["elements"][1], {"kind": "char", "value": 0, "char": "\0", "repeat": 14, "index": 2})
+        self.assertEqual(parse_value("{10 '\\n', 39 '\\''}")["elements"][1]["char"], "'")
+
+    def test_errors(self):
+        for text in ('{1, 2', '1}', '<repeats 3 times>'):
+            with self.assertRaises(GDBValueError):
+                parse_value(text)
+
+    def test_element_addresses(self):
+        value, address, tree = format_memory_entry('{{1, 2, 3}, {4, 5, 6}}', '0x1000', 'long [2][3]', 48)
+        self.assertEqual(address, '0x1000')
+        self.assertEqual(tree["stride"], 24)
+        self.assertEqual([element["address"] for element in tree["elements"][1]["elements"]],
+                         ['0x1018', '0x1020', '0x1028'])
+        # A run's address is its first element's; later ones follow at the stride
+        _, _, tree = format_memory_entry('{7, 0 <repeats 999 times>}', '0x2000', 'short [1000]', 2000)
+        self.assertEqual((tree["elements"][1]["address"], tree["stride"]), ('0x2002', 2))
+
+    def test_member_addresses_from_declaration(self):
+        index = get_declaration_index(
+            'struct point { char tag; double xy[2]; };\n'
+            'int main() { struct point p = {1, {2, 3}}; return 0; }\n')
+        layout = index.lookup('p', 'main').layout
+        _, _, tree = format_memory_entry("{tag = 1 '\\001', xy = {2, 3}}", '0x100', 'struct point', 24, layout)
+        self.assertEqual(tree["fields"]["tag"]["address"], '0x100')
+        self.assertEqual([element["address"] for element in tree["fields"]["xy"]["elements"]], ['0x108', '0x110'])
+
+    def test_large_aggregates_stay_linear(self):
+        text = '{' + ', '.join(f'{{x = {i}, y = {i}.5}}' for i in range(20000)) + '}'
+        started = time.perf_counter()
+        tree = parse_value(text)
+        self.assertEqual(tree["length"], 20000)
+        self.assertLess(time.perf_counter() - started, 2)
+        deep = '{' * 5000 + '1' + '}' * 5000  # No recursion, so nesting depth is not limited
+        self.assertEqual(parse_value(deep)["length"], 1)
+
+
+class LatencyHistogramTests(TestCase):
+    def test_percentiles_and_buckets(self):
+        histogram = LatencyHistogram()
+        for _ in range(90):
+            histogram.record(0.0008)
+        for _ in range(10):
+            histogram.record(0.150)
+
+        snapshot = histogram.snapshot()
+        self.assertEqual(snapshot["count"], 100)
+        self.assertEqual(snapshot["p50_ms"], 1)
+        self.assertEqual(snapshot["p95_ms"], 200)
+        self.assertEqual(snapshot["buckets"]["<=1ms"], 90)
+        self.assertEqual(snapshot["buckets"]["<=200ms"], 10)
+        self.assertAlmostEqual(snapshot["max_ms"], 150, places=3)
+
+
+@unittest.skipUnless(HAS_GDB, "gdb is required for the process pool")
+class GDBPoolTests(TestCase):
+    def test_processes_are_reused_then_recycled(self):
+        pool = GDBPool(size=1, max_uses=2)
+        self.addCleanup(pool.close)
+        workspace = Workspace()
+        self.addCleanup(workspace.cleanup)
+
+        first = pool.acquire(workspace.root)
+        pool.release(first)
+        second = pool.acquire(workspace.root)
+        self.assertIs(first, second)
+        pool.release(second)
+
+        stats = pool.stats()
+        self.assertEqual(stats["reused"], 1)
+        self.assertEqual(stats["recycled"], 1)
+        self.assertTrue(second.exited.wait(timeout=5))
+
+
+class FakeSession:
+    def __init__(self):
+        self.stopped = False
+        self.lock = threading.Lock()
+
+    def stop_debugging(self):
+        self.stopped = True
+        return {"message": "Debugging session ended successfully."}
+
+
+class SlowSession:
+    """A session whose steps take a while and count how many of them run at once."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.history = StepHistory()
+        self.delta_encoder = MemoryDeltaEncoder()
+        self.running = 0
+        self.peak = 0
+        self.steps = 0
+
+    def step_forward(self, kind="over"):
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        time.sleep(0.02)
+        self.running -= 1
+        self.steps += 1
+        return {"current_line": self.steps, "function_name": "main", "memory_state": {}, "status": "running"}
+
+    def stop_debugging(self):
+        return {"message": "Debugging session ended successfully."}
+
+
+class SessionLockTests(TestCase):
+    def setUp(self):
+        self.session = SlowSession()
+        get_session_manager().add('locked', self.session)
+        self.addCleanup(get_session_manager().pop, 'locked')
+
+    def test_posted_and_streamed_steps_take_turns(self):
+        with ThreadPoolExecutor(max_workers=6) as pool:
+            futures = [pool.submit(step_session, 'locked') for _ in range(3)]
+            futures += [pool.submit(async_to_sync(astep_session), 'locked') for _ in range(3)]
+            for future in futures:
+                self.assertNotIn("error", future.result(timeout=10))
+        self.assertEqual((self.session.steps, self.session.peak), (6, 1))
+
+    @override_settings(DEBUG_SESSION_LOCK_TIMEOUT=0.05)
+    def test_a_step_gives_up_when_the_session_stays_busy(self):
+        with self.session.lock:
+            self.assertIn("busy", step_session('locked')["error"])
+            self.assertIn("busy", async_to_sync(astep_session)('locked')["error"])
+        self.assertEqual(self.session.steps, 0)
+
+
+class SessionManagerTests(TestCase):
+    def make_manager(self, **limits):
+        options = {"idle_timeout": 600, "max_sessions": 3, "max_per_user": 2, "reap_interval": 30}
+        options.update(limits)
+        return SessionManager(**options)
+
+    def test_caps_stop_least_recently_used_sessions(self):
+        manager = self.make_manager()
+        sessions = {name: FakeSession() for name in "abcd"}
+        manager.add("a", sessions["a"], owner="alice")
+        manager.add("b", sessions["b"], owner="alice")
+        manager.get("a")
+        manager.add("c", sessions["c"], owner="alice")
+        self.assertTrue(sessions["b"].stopped)
+        self.assertFalse(sessions["a"].stopped)
+
+        manager.add("d", sessions["d"], owner="bob")
+        manager.add("e", FakeSession(), owner="carol")
+        self.assertTrue(sessions["a"].stopped)
+        self.assertIsNone(manager.get("a"))
+        self.assertEqual(manager.stats()["sessions"], 3)
+        self.assertEqual(manager.stats()["evicted_capacity"], 2)
+
+    def test_replacing_a_session_stops_the_old_one(self):
+        manager = self.make_manager()
+        old, new = FakeSession(), FakeSession()
+        manager.add("a", old, owner="alice")
+        manager.add("a", new, owner="alice")
+        self.assertTrue(old.stopped)
+        self.assertIs(manager.get("a"), new)
+
+    def test_reap_stops_idle_sessions(self):
+        manager = self.make_manager(idle_timeout=0)
+        session = FakeSession()
+        manager.add("a", session, owner="alice")
+        self.assertEqual(manager.reap(), 1)
+        self.assertTrue(session.stopped)
+        self.assertIsNone(manager.get("a"))
+        self.assertEqual(manager.stats()["evicted_idle"], 1)
+
+    def test_eviction_waits_for_a_running_step(self):
+        manager = self.make_manager(idle_timeout=0)
+        session = FakeSession()
+        manager.add("a", session, owner="alice")
+        session.lock.acquire()  # A step is using the session's gdb
+        reaper = threading.Thread(target=manager.reap)
+        reaper.start()
+        time.sleep(0.05)
+        self.assertFalse(session.stopped)
+        session.lock.release()
+        reaper.join(timeout=5)
+        self.assertTrue(session.stopped)
+
+    def test_anonymous_owners_are_browser_sessions(self):
+        requests = []
+        for key in ("first", "second"):
+            request = RequestFactory().post('/', REMOTE_ADDR='10.0.0.1')  # Same classroom NAT
+            request.session = mock.Mock(session_key=key)
+            requests.append(request)
+        self.assertEqual([session_owner(request) for request in requests], ["session:first", "session:second"])
+        with override_settings(DEBUG_SESSION_OWNER_BY_IP=True):
+            self.assertEqual({session_owner(request) for request in requests}, {"ip:10.0.0.1"})
+
+
+class FakeRecorder:
+    """Stands in for MIGDBSession: a program whose steps are lines 1..steps."""
+
+    def __init__(self, steps):
+        self.steps = steps
+        self.line = 0
+        self.stopped = False
+
+    def start_debugging(self, c_code):
+        return self.step_forward()
+
+    def step_forward(self):
+        self.line += 1
+        if self.line > self.steps:
+            return {"current_line": None, "function_name": None, "memory_state": {}, "status": "completed"}
+        return {"current_line": self.line, "function_name": "main", "memory_state": {}, "status": "running"}
+
+    def stop_debugging(self):
+        self.stopped = True
+
+
+class TraceSessionTests(TestCase):
+    def record(self, steps, step_limit=100):
+        recorder = FakeRecorder(steps)
+        session = TraceSession('trace', step_limit=step_limit)
+        with mock.patch('visualize_code.helpers.gdb_helper.MIGDBSession', return_value=recorder):
+            first = session.start_debugging('int main() { return 0; }')
+        return session, recorder, first
+
+    def test_replays_recorded_steps_without_gdb(self):
+        session, recorder, first = self.record(3)
+        self.assertTrue(recorder.stopped)
+        self.assertIsNone(session.gdb_pid)
+        self.assertEqual(first["current_line"], 1)
+        self.assertEqual(first["trace_length"], 4)
+        self.assertFalse(first["truncated"])
+        lines = [session.step_forward()["current_line"] for _ in range(3)]
+        self.assertEqual(lines, [2, 3, None])
+        self.assertEqual(session.step_forward()["status"], "completed")
+
+    def test_step_limit_truncates_trace(self):
+        session, recorder, first = self.record(1000, step_limit=5)
+        self.assertEqual(first["trace_length"], 5)
+        self.assertTrue(first["truncated"])
+        self.assertTrue(recorder.stopped)
+
+
+class MemoryDeltaEncoderTests(TestCase):
+    def step(self, line, memory_state):
+        return {"current_line": line, "function_name": "main", "memory_state": memory_state, "status": "running"}
+
+    def test_delta_contains_only_differences(self):
+        encoder = MemoryDeltaEncoder()
+        big = ("{" + ", ".join(["0"] * 1000) + "}", "0x1000", "int [1000]", 4000)
+        first = encoder.encode(self.step(1, {"arr": big, "i": ("0", "0x2000", "int", 4), "old": ("1", "0x3000", "int", 4)}))
+        self.assertEqual(first["seq"], 0)
+        self.assertTrue(first["full"])
+
+        current = {"arr": big, "i": ("1", "0x2000", "int", 4), "new": ("2", "0x4000", "int", 4)}
+        second = encoder.encode(self.step(2, current), delta=True, client_seq=0)
+        self.assertNotIn("memory_state", second)
+        self.assertEqual((second["seq"], second["base_seq"]), (1, 0))
+        self.assertEqual(second["memory_delta"], {
+            "added": {"new": ("2", "0x4000", "int", 4)},
+            "changed": {"i": ("1", "0x2000", "int", 4)},
+            "removed": ["old"],
+        })
+        self.assertEqual(apply_memory_delta(first["memory_state"], second["memory_delta"]), current)
+
+    def test_out_of_sync_client_gets_full_state(self):
+        encoder = MemoryDeltaEncoder()
+        encoder.encode(self.step(1, {"i": ("0", "0x2000", "int", 4)}))
+        encoder.encode(self.step(2, {"i": ("1", "0x2000", "int", 4)}), delta=True, client_seq=0)
+        response = encoder.encode(self.step(3, {"i": ("2", "0x2000", "int", 4)}), delta=True, client_seq=0)
+        self.assertTrue(response["full"])
+        self.assertEqual(response["memory_state"], {"i": ("2", "0x2000", "int", 4)})
+        self.assertEqual(encoder.snapshot()["seq"], 2)
+
+    def test_errors_pass_through_unnumbered(self):
+        encoder = MemoryDeltaEncoder()
+        self.assertEqual(encoder.encode({"error": "boom"}, delta=True), {"error": "boom"})
+        self.assertEqual(encoder.seq, -1)
+
+
+@unittest.skipUnless(HAS_GCC and os.name == 'posix', "gcc and LD_PRELOAD are required to track the heap")
+class HeapTrackerTests(TestCase):
+    PROGRAM = """
+#include <stdlib.h>
+int main() {
+    char *a = malloc(100);
+    int *b = calloc(4, sizeof(int));
+    a = realloc(a, 200);
+    free(b);
+    b = malloc(16);
+    return 0;
+}
+"""
+
+    def setUp(self):
+        self.workspace = Workspace()
+        self.addCleanup(self.workspace.cleanup)
+        cache = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache, True)
+        settings = override_settings(COMPILE_CACHE_DIR=cache)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def run_tracked(self, ring):
+        library = build_heap_shim(self.workspace)
+        self.assertIsNotNone(library)
+        self.workspace.write('program.c', self.PROGRAM)
+        binary = self.workspace.path('program.out')
+        subprocess.run(['gcc', self.workspace.path('program.c'), '-o', binary], check=True)
+        env = dict(os.environ, **{PRELOAD_ENV: library, RING_ENV: ring.path})
+        # Through the exec-wrapper, as gdb starts it: the wrapper's own allocations must not be logged
+        subprocess.run(exec_wrapper_command(SandboxLimits(0, 0, 0, 0, 0)).split() + [binary], env=env, check=True)
+
+    def test_shim_logs_the_programs_allocations(self):
+        ring = HeapRing(self.workspace.path('.heap-ring'), 64)
+        self.addCleanup(ring.close)
+        self.run_tracked(ring)
+        events = ring.drain()
+        self.assertEqual([(kind, size) for kind, _, size, _ in events],
+                         [(EVENT_ALLOC, 100), (EVENT_ALLOC, 16), (EVENT_REALLOC, 200), (EVENT_FREE, 0), (EVENT_ALLOC, 16)])
+        self.assertEqual(events[2][3], events[0][1])  # realloc's old address is the first malloc's
+
+        heap = HeapMap()
+        heap.apply(events)
+        summary = heap.summary(10)
+        self.assertEqual((summary["count"], summary["bytes"], summary["allocations"], summary["frees"]), (2, 216, 3, 1))
+        self.assertEqual(ring.drain(), [])
+
+    def test_overflowing_the_ring_counts_lost_events(self):
+        ring = HeapRing(self.workspace.path('.heap-ring'), 3)  # Rounded up to 4
+        self.addCleanup(ring.close)
+        self.run_tracked(ring)
+        self.assertEqual((ring.capacity, len(ring.drain()), ring.lost), (4, 4, 1))
+
+    def test_heap_map_and_history(self):
+        heap = HeapMap()
+        heap.apply([(EVENT_ALLOC, 0x20, 8, 0), (EVENT_ALLOC, 0x10, 4, 0), (EVENT_FREE, 0x999, 0, 0)])
+        before = heap.copy()
+        heap.apply([(EVENT_REALLOC, 0x30, 12, 0x10)])
+        self.assertEqual(heap.summary(1)["blocks"], [{"address": "0x20", "size": 8}])
+        self.assertEqual((heap.summary(1)["count"], heap.summary(1)["bytes"]), (2, 20))
+        self.assertEqual(before.blocks, {0x20: 8, 0x10: 4})
+        self.assertIs(heap.summary(1), heap.summary(1))
+
+        history = StepHistory(keyframe_interval=2)
+        for step in range(3):
+            history.record({"current_line": step, "function_name": "main", "memory_state": {}, "status": "running",
+                            "heap": heap.summary(5)})
+        self.assertEqual(history.get(1)["heap"]["count"], 2)
+
+    def test_history_keeps_the_backtrace(self):
+        history = StepHistory(keyframe_interval=2)
+        backtrace = [{"level": 0, "function": "sq", "line": 4, "id": "sq:0x2000"}]
+        history.record({"current_line": 4, "function_name": "sq", "memory_state": {}, "status": "running",
+                        "backtrace": backtrace, "backtrace_truncated": True})
+        history.record({"current_line": 5, "function_name": "sq", "memory_state": {}, "status": "running"})
+        self.assertEqual((history.get(0)["backtrace"], history.get(0)["backtrace_truncated"]), (backtrace, True))
+        self.assertNotIn("backtrace", history.get(1))
+
+
+class StepHistoryTests(TestCase):
+    def response(self, step):
+        memory_state = {"i": (str(step), "0x1000", "int", 4)}
+        if step % 3:
+            memory_state["odd"] = ("1", "0x2000", "int", 4)
+        return {"current_line": step + 1, "function_name": "main", "memory_state": memory_state, "status": "running"}
+
+    def test_rebuilds_any_step_from_keyframes(self):
+        history = StepHistory(keyframe_interval=4, max_steps=1000)
+        for step in range(50):
+            self.assertEqual(history.record(self.response(step)), step)
+        self.assertEqual(history.stats()["keyframes"], 13)
+        for step in (0, 1, 3, 4, 17, 49):
+            expected = dict(self.response(step), step=step)
+            self.assertEqual(history.get(step), expected)
+
+    def test_back_and_forward_move_the_cursor(self):
+        history = StepHistory(keyframe_interval=4)
+        for step in range(10):
+            history.record(self.response(step))
+        self.assertTrue(history.at_head())
+        self.assertEqual(history.back()["step"], 8)
+        self.assertEqual(history.move_to(2)["current_line"], 3)
+        self.assertEqual(history.forward()["step"], 3)
+        self.assertFalse(history.at_head())
+        self.assertIn("error", history.move_to(10))
+        history.move_to(0)
+        self.assertIn("error", history.back())
+
+    def test_max_steps_bounds_memory(self):
+        history = StepHistory(keyframe_interval=4, max_steps=20)
+        for step in range(100):
+            history.record(self.response(step))
+        self.assertLessEqual(len(history), 20)
+        self.assertEqual(history.last_step, 99)
+        self.assertEqual(history.first_step % 4, 0)
+        self.assertIn("error", history.get(0))
+        self.assertEqual(history.get(history.first_step)["memory_state"], self.response(history.first_step)["memory_state"])
+
+
+class FakeCheckpointController:
+    """Just enough of MIController for a program whose line advances by one per step."""
+
+    def __init__(self):
+        self.line = 1
+        self.forks = {}
+        self.nexts = 0
+        self.executed = []
+
+    def execute(self, command, timeout=None):
+        self.line = 1 if command == "-exec-run" else self.line + 1
+        self.nexts += command == "-exec-next"
+        self.executed.append(command)
+        return {"reason": "end-stepping-range", "frame": {"line": str(self.line)}}
+
+    def console(self, command):
+        if command == "checkpoint":
+            checkpoint_id = len(self.forks) + 1
+            self.forks[checkpoint_id] = self.line
+            return f"checkpoint {checkpoint_id}: fork returned pid {1000 + checkpoint_id}.\n"
+        if command.startswith("restart "):
+            self.line = self.forks.pop(int(command.split()[1]))
+        if command.startswith("frame-snapshot"):
+            variable = {"name": "line", "type": "int", "value": str(self.line), "address": "0x10", "size": 4}
+            return json.dumps({"function": "main", "line": self.line, "variables": [variable]}) + "\n"
+        return ""
+
+
+class FakeHeapRing:
+    """A HeapRing stand-in for FakeCheckpointController's program, which allocates one block per line."""
+
+    lost = 0
+
+    def __init__(self, controller):
+        self.controller = controller
+        self.drained = 0
+
+    def drain(self):
+        events = [(EVENT_ALLOC, 0x1000 + line * 16, 16, 0) for line in range(self.drained + 1, self.controller.line + 1)]
+        self.drained = self.controller.line
+        return events
+
+
+class FakeMemoryController:
+    """An MIController stand-in stopped in a frame with a large summarized array and an array of structs."""
+
+    BIG = {"name": "big", "type": "int [10000]", "size": 40000, "address": "0x1000", "value": "{0, 1, 2, 3...}",
+           "summary": {"length": 10000, "element_type": "int", "element_size": 4}}
+    POINTS = {"name": "points", "type": "struct point [600]", "size": 4800, "address": "0x20000",
+              "value": "{{x = 0, y = 0}...}", "summary": {"length": 600, "element_type": "struct point", "element_size": 8}}
+
+    def __init__(self):
+        self.commands = []
+
+    def console(self, command):
+        self.commands.append(command)
+        return json.dumps({"function": "main", "line": 5, "variables": [self.BIG, self.POINTS]}) + "\n"
+
+    def command(self, command, timeout=None):
+        self.commands.append(command)
+        if command.startswith("-data-read-memory-bytes"):
+            address, length = command.split()[1:]
+            first = (int(address, 16) - 0x1000) // 4
+            contents = struct.pack(f"={int(length) // 4}i", *range(first, first + int(length) // 4)).hex()
+            return {"memory": [{"begin": address, "offset": "0x0", "contents": contents}]}, ""
+        if command.startswith("-data-evaluate-expression"):
+            return {"value": "{{x = 7, y = 8}, {x = 9, y = 10}}"}, ""
+        raise AssertionError(command)
+
+
+@override_settings(DEBUG_ARRAY_PAGE_MAX=100)
+class ArrayPagingTests(TestCase):
+    def started_session(self):
+        session = MIGDBSession('paging')
+        session.controller = FakeMemoryController()
+        session.snapshot({"frame": {}})
+        return session
+
+    def test_step_sends_a_summary(self):
+        session = self.started_session()
+        self.assertEqual(session.controller.commands, ["frame-snapshot 4096 16 1 64"])
+        tree = session.memory_state["big"][4]
+        self.assertEqual((tree["length"], tree["lazy"], tree["stride"], len(tree["elements"])), (10000, True, 4, 4))
+
+    def test_read_elements_with_one_bulk_read(self):
+        session = self.started_session()
+        page = session.read_elements("big", 5000, 3)
+        self.assertEqual([(node["index"], node["value"], node["address"]) for node in page["elements"]],
+                         [(5000, 5000, hex(0x1000 + 20000)), (5001, 5001, hex(0x1000 + 20004)),
+                          (5002, 5002, hex(0x1000 + 20008))])
+        self.assertEqual(session.controller.commands[-1], f"-data-read-memory-bytes {hex(0x1000 + 20000)} 12")
+
+    def test_ranges_are_clamped(self):
+        session = self.started_session()
+        self.assertEqual(session.read_elements("big", 0, 10 ** 6)["count"], 100)
+        self.assertEqual(session.read_elements("big", 9998, 50)["count"], 2)
+        self.assertEqual(session.read_elements("big", 20000, 5)["elements"], [])
+        self.assertIn("error", session.read_elements("missing", 0, 5))
+
+    def test_struct_elements_fall_back_to_gdb(self):
+        session = self.started_session()
+        page = session.read_elements("points", 10, 2)
+        self.assertEqual(session.controller.commands[-1], '-data-evaluate-expression "points[10]@2"')
+        self.assertEqual([(node["index"], node["address"]) for node in page["elements"]], [(10, '0x20050'), (11, '0x20058')])
+        self.assertEqual(page["elements"][1]["fields"]["y"]["value"], 10)
+
+    def test_decode_elements(self):
+        data = struct.pack("=3b", 104, 105, 0)
+        self.assertEqual([node["char"] for node in decode_elements(data, "char", 1)], ["h", "i", "\0"])
+        self.assertEqual(decode_elements(struct.pack("=2d", 1.5, -2), "const double", 8, 4, 0x10),
+                         [{"kind": "float", "value": 1.5, "index": 4, "address": "0x10"},
+                          {"kind": "float", "value": -2.0, "index": 5, "address": "0x18"}])
+        self.assertEqual(decode_elements(struct.pack("=Q", 0x401136), "int *", 8)[0]["value"], "0x401136")
+        self.assertEqual(decode_elements(struct.pack("=I", 2 ** 32 - 1), "unsigned int", 4)[0]["value"], 2 ** 32 - 1)
+        self.assertIsNone(decode_elements(b"\0" * 8, "struct point", 8))
+
+
+class FakeRawController:
+    """An MIController stand-in whose frame's locals live in a buffer of the test process itself."""
+
+    def __init__(self, variables, frame):
+        self.variables = variables
+        self.frame = frame
+        self.commands = []
+
+    def console(self, command):
+        self.commands.append(command)
+        snapshot = {"function": "main", "line": 8, "variables": self.variables, "pid": os.getpid(), "frame": self.frame}
+        return json.dumps(snapshot) + "\n"
+
+    def command(self, command, timeout=None):
+        self.commands.append(command)
+        if command.startswith("-data-read-memory-bytes"):
+            address, length = command.split()[1:]
+            contents = ctypes.string_at(int(address, 16), int(length)).hex()
+            return {"memory": [{"begin": address, "offset": "0x0", "contents": contents}]}, ""
+        if command.startswith("-data-evaluate-expression"):
+            return {"value": "42"}, ""
+        raise AssertionError(command)
+
+
+class FrameReadTests(TestCase):
+    PROGRAM = (
+        'struct point { char tag; double xy[2]; };\n'   # 1
+        'int main() {\n'                                 # 2
+        '    int n = 5;\n'                               # 3
+        '    struct point p = {65, {1.5, 2.25}};\n'       # 4
+        '    int zeros[20] = {0};\n'                     # 5
+        '    char name[8] = "hi";\n'                     # 6
+        '    int big[2000];\n'                           # 7
+        '    return 0;\n'                                # 8
+        '}\n'                                            # 9
+    )
+
+    def frame(self):
+        """A frame laid out in a buffer of this process: (buffer, its address, frame-snapshot variables)."""
+        buffer = ctypes.create_string_buffer(8192)
+        base = ctypes.addressof(buffer)
+        struct.pack_into("=i", buffer, 0, 5)
+        struct.pack_into("=b7x2d", buffer, 8, 65, 1.5, 2.25)
+        struct.pack_into("=8si", buffer, 112, b"hi", 42)
+        struct.pack_into("=2000i", buffer, 128, *range(2000))
+
+        def variable(name, type_name, offset, size, **extra):
+            return dict(name=name, type=type_name, value=None, address=hex(base + offset), size=size, raw=True, **extra)
+        variables = [
+            variable("n", "int", 0, 4),
+            variable("p", "struct point", 8, 24),
+            variable("zeros", "int [20]", 32, 80),
+            variable("name", "char [8]", 112, 8),
+            variable("mystery", "int", 120, 4),  # Not in the index: left to gdb
+            variable("big", "int [2000]", 128, 8000, summary={"length": 2000, "element_type": "int", "element_size": 4}),
+        ]
+        return buffer, base, variables
+
+    def started_session(self, direct_reads=True):
+        buffer, base, variables = self.frame()
+        session = MIGDBSession('frame')
+        session.direct_reads = direct_reads
+        session.declarations = get_declaration_index(self.PROGRAM)
+        session.controller = FakeRawController(variables, {"low": hex(base), "high": hex(base + 8192)})
+        session.snapshot({"frame": {}})
+        self.addCleanup(session.close_memory)
+        return session, buffer, base
+
+    def check_memory_state(self, session, base):
+        state = session.memory_state
+        self.assertEqual({name: entry[0] for name, entry in state.items() if name != "big"}, {
+            "n": "5", "p": "{tag = 65 'A', xy = {1.5, 2.25}}", "zeros": "{0 <repeats 20 times>}", "name": '"hi"',
+            "mystery": "42",
+        })
+        self.assertEqual(state["p"][4]["fields"]["xy"]["elements"][1]["address"], hex(base + 24))
+        big = state["big"][4]
+        self.assertEqual((big["length"], big["lazy"], len(big["elements"]), big["elements"][15]["value"]), (2000, True, 16, 15))
+        self.assertTrue(state["big"][0].endswith("14, 15...}"))
+
+    @unittest.skipUnless(os.path.exists('/proc/self/mem'), "/proc/<pid>/mem is Linux only")
+    def test_locals_are_decoded_from_proc_mem(self):
+        session, buffer, base = self.started_session()
+        self.check_memory_state(session, base)
+        self.assertEqual(session.controller.commands, ["frame-snapshot 4096 16 1 64", '-data-evaluate-expression "mystery"'])
+        self.assertEqual(session.memory.pid, os.getpid())
+
+    def test_without_proc_mem_one_gdb_read_serves_the_frame(self):
+        session, buffer, base = self.started_session(direct_reads=False)
+        self.check_memory_state(session, base)
+        reads = [command for command in session.controller.commands if command.startswith("-data-read-memory-bytes")]
+        self.assertEqual(reads, [f"-data-read-memory-bytes {hex(base)} {128 + 16 * 4}"])
+
+    def test_dump_memory(self):
+        session, buffer, base = self.started_session(direct_reads=False)
+        dump = session.dump_memory(base + 112, 20)
+        self.assertEqual(dump["rows"][0], {"address": hex(base + 112), "hex": "68 69 00 00 00 00 00 00 2a 00 00 00 00 00 00 00",
+                                           "ascii": "hi......*......."})
+        self.assertEqual([variable["name"] for variable in dump["variables"]], ["name", "mystery", "big"])
+        self.assertEqual(session.dump_memory()["length"], 4096)  # The top of the frame, capped
+        session.snapshot({"frame": {}})
+        session.history.back()
+        self.assertIn("error", session.dump_memory())
+
+    def test_decode_and_format(self):
+        index = get_declaration_index(self.PROGRAM)
+        layout = index.lookup('name', 'main').layout
+        self.assertEqual(format_value(decode_value(b"a\n'\x01" + b"\0" * 4, layout)), '"a\\n\'\\001"')
+        tree = decode_value(struct.pack("=20i", *([7] * 12 + list(range(8)))), index.lookup('zeros', 'main').layout, 0x100)
+        self.assertEqual([(node["index"], node.get("repeat"), node["address"]) for node in tree["elements"][:2]],
+                         [(0, 12, '0x100'), (12, None, '0x130')])
+        self.assertEqual(format_value({"kind": "float", "value": 2.0}), "2.000")
+        self.assertIsNone(decode_value(b"\0" * 8, {"size": 8, "type": "long double"}))
+        self.assertEqual(hexdump(b"AB\x00", 0x10, 2), [{"address": "0x10", "hex": "41 42", "ascii": "AB"},
+                                                      {"address": "0x12", "hex": "00", "ascii": "."}])
+
+    def test_plan_reads(self):
+        self.assertEqual(plan_reads([(100, 8), (0, 4), (4, 4), (2, 1), (5000, 4)], max_gap=100), [(0, 108), (5000, 4)])
+        memory = MemorySnapshot([(0, bytes(range(108))), (5000, b"abcd")])
+        self.assertEqual(memory.slice(100, 3), bytes([100, 101, 102]))
+        self.assertEqual(memory.slice(5001, 2), b"bc")
+        self.assertIsNone(memory.slice(106, 4))
+        self.assertIsNone(memory.slice(200, 1))
+
+
+class FakeStackController:
+    """An MIController stand-in stopped in sq(), called by main(), whose local `total` lives in a buffer of the test process."""
+
+    BACKTRACE = [{"level": 0, "function": "sq", "line": 3, "id": "sq:0x7ffc1000"},
+                 {"level": 1, "function": "main", "line": 9, "id": "main:0x7ffc2000"}]
+
+    def __init__(self, total_address):
+        self.total_address = total_address
+        self.backtrace = self.BACKTRACE
+        self.commands = []
+
+    def console(self, command):
+        self.commands.append(command)
+        if command.endswith(" 0 1"):  # main's frame
+            total = {"name": "total", "type": "int", "value": str(ctypes.c_int.from_address(self.total_address).value),
+                     "address": hex(self.total_address), "size": 4}
+            return json.dumps({"function": "main", "line": 9, "variables": [total]}) + "\n"
+        top = self.backtrace[0]
+        return json.dumps({"function": top["function"], "line": top["line"], "variables": [],
+                           "backtrace": self.backtrace}) + "\n"
+
+    def command(self, command, timeout=None):
+        self.commands.append(command)
+        if command.startswith("-data-read-memory-bytes"):
+            address, length = command.split()[1:]
+            contents = ctypes.string_at(int(address, 16), int(length)).hex()
+            return {"memory": [{"begin": address, "offset": "0x0", "contents": contents}]}, ""
+        raise AssertionError(command)
+
+
+class FrameLocalsTests(TestCase):
+    def started_session(self):
+        total = ctypes.c_int(7)
+        session = MIGDBSession('frames')
+        session.controller = FakeStackController(ctypes.addressof(total))
+        response = session.snapshot({"frame": {}})
+        return session, total, response
+
+    def frame_reads(self, session):
+        return sum(command.endswith(" 0 1") for command in session.controller.commands)
+
+    def test_step_carries_the_backtrace(self):
+        session, total, response = self.started_session()
+        self.assertEqual([frame["function"] for frame in response["backtrace"]], ["sq", "main"])
+        self.assertEqual(session.frame_locals(0)["memory_state"], {})
+        self.assertIn("error", session.frame_locals(2))
+
+    def test_outer_frame_is_cached_while_its_memory_is_unchanged(self):
+        session, total, _ = self.started_session()
+        first = session.frame_locals(1)
+        self.assertEqual((first["function"], first["memory_state"]["total"][0], first["cached"]), ("main", "7", False))
+        session.snapshot({"frame": {}})  # Another step inside sq()
+        second = session.frame_locals(1)
+        self.assertEqual((second["memory_state"]["total"][0], second["cached"]), ("7", True))
+        self.assertEqual(self.frame_reads(session), 1)
+
+        total.value = 8  # sq() wrote through a pointer into main's frame
+        third = session.frame_locals(1)
+        self.assertEqual((third["memory_state"]["total"][0], third["cached"]), ("8", False))
+        self.assertEqual(self.frame_reads(session), 2)
+
+    def test_cache_is_dropped_when_the_frame_runs_again(self):
+        session, total, _ = self.started_session()
+        session.frame_locals(1)
+        self.assertEqual(list(session.frame_cache), ["main:0x7ffc2000"])
+        session.controller.backtrace = [dict(FakeStackController.BACKTRACE[1], level=0)]  # sq() returned
+        session.snapshot({"frame": {}})
+        self.assertEqual(session.frame_cache, {})
+
+
+class FakeConsole(GDBSession):
+    """A GDBSession whose console answers `info frame`, `print &x`, `whatis` and `sizeof` for one local array."""
+
+    def __init__(self):
+        super().__init__('console')
+        self.frame = ("sq", "0x7ffc1000")
+        self.commands = []
+
+    def run_command(self, command):
+        self.commands.append(command)
+        if command == "info frame":
+            return f"Stack level 0, frame at {self.frame[1]}:\n rip = 0x401136 in {self.frame[0]} (main.c:3); saved rip = 0x401170\n"
+        if command.startswith("print &"):
+            return f"$1 = (int (*)[3]) {self.frame[1][:-2]}f0\n"
+        if command.startswith("whatis "):
+            return "type = int [3]\n"
+        if command.startswith("print sizeof"):
+            return "$2 = 12\n"
+        raise AssertionError(command)
+
+    def step(self):
+        self.enter_current_frame()
+        return extract_memory_state(self, "arr = {1, 2, 3}\n")
+
+    def lookups(self, prefix):
+        return sum(command.startswith(prefix) for command in self.commands)
+
+
+class ConsoleFrameCacheTests(TestCase):
+    def test_addresses_are_looked_up_once_per_frame(self):
+        session = FakeConsole()
+        self.assertEqual(session.step()["arr"][1], "0x7ffc10f0")
+        session.step()
+        self.assertEqual((session.lookups("info frame"), session.lookups("print &")), (2, 1))
+
+        session.frame = ("sq", "0x7ffc0fc0")  # sq() called itself
+        self.assertEqual(session.step()["arr"][1], "0x7ffc0ff0")
+        self.assertEqual(session.lookups("print &"), 2)
+
+        session.frame = ("sq", "0x7ffc1000")  # Back in the outer call
+        session.step()
+        self.assertEqual(session.lookups("print &"), 2)
+
+        session.frame = ("main", "0x7ffc1000")  # sq() returned and main() reuses its stack
+        session.step()
+        self.assertEqual(session.lookups("print &"), 3)
+
+    def test_types_are_looked_up_once_per_frame(self):
+        session = FakeConsole()
+        self.assertEqual(session.step()["arr"][2:4], ("int [3]", 12))
+        session.step()
+        self.assertEqual((session.lookups("whatis"), session.lookups("print sizeof")), (1, 1))
+
+        session.frame = ("sq", "0x7ffc0fc0")  # sq() called itself
+        self.assertEqual(session.step()["arr"][2:4], ("int [3]", 12))
+        self.assertEqual((session.lookups("whatis"), session.lookups("print sizeof")), (2, 2))
+
+
+class RewindTests(TestCase):
+    def started_session(self, steps, interval):
+        session = MIGDBSession('rewind')
+        session.checkpoint_interval = interval
+        session.controller = FakeCheckpointController()
+        session.controller.execute("-exec-run")
+        session.step = 0
+        session.take_checkpoint()
+        session.snapshot({"frame": {}})
+        for _ in range(steps):
+            session.step_forward()
+        return session
+
+    def test_rewind_restarts_nearest_checkpoint(self):
+        session = self.started_session(23, interval=5)
+        self.assertEqual(sorted(session.checkpoints), [0, 5, 10, 15, 20])
+        session.controller.nexts = 0
+
+        response = session.rewind_to(17)
+        self.assertEqual((response["step"], response["current_line"]), (17, 18))
+        self.assertEqual(session.controller.nexts, 2)  # From the checkpoint at step 15
+        self.assertEqual(sorted(session.checkpoints), [0, 5, 10, 15])
+        self.assertEqual(session.history.last_step, 17)
+        self.assertEqual(session.step_forward()["step"], 18)
+
+    def test_rewind_without_checkpoints_replays_from_start(self):
+        session = self.started_session(10, interval=0)
+        session.controller.nexts = 0
+        response = session.rewind_to(4)
+        self.assertEqual(response["current_line"], 5)
+        self.assertEqual(session.controller.nexts, 4)
+
+    def test_rewind_restores_the_heap(self):
+        session = MIGDBSession('rewind')
+        session.checkpoint_interval = 5
+        session.controller = FakeCheckpointController()
+        session.heap_ring = FakeHeapRing(session.controller)
+        session.controller.execute("-exec-run")
+        session.step = 0
+        session.take_checkpoint()
+        session.snapshot({"frame": {}})
+        for _ in range(23):
+            session.step_forward()
+        self.assertEqual(session.history.get(23)["heap"]["count"], 24)
+
+        self.assertEqual(session.rewind_to(17)["heap"]["count"], 18)  # One block per line run so far
+        self.assertEqual(sorted(session.heap_checkpoints), [0, 5, 10, 15])
+        self.assertEqual(session.step_forward()["heap"]["count"], 19)
+        self.assertEqual(session.rewind_to(17)["heap"]["count"], 18)  # From the fork re-taken at step 15
+
+    def test_rewind_replays_the_same_kinds_of_steps(self):
+        session = self.started_session(0, interval=0)
+        for kind in ("into", "out", "over"):
+            session.step_forward(kind)
+        self.assertIn("error", session.step_forward("sideways"))
+        session.controller.executed = []
+
+        self.assertEqual(session.rewind_to(2)["step"], 2)
+        self.assertEqual(session.controller.executed, ["-exec-run", "-exec-step", "-exec-finish"])
+        self.assertEqual(session.step_kinds, ["into", "out"])
+
+    def test_async_step_builds_the_snapshot_off_the_loop(self):
+        session = self.started_session(0, interval=0)
+        controller = session.controller
+
+        async def aexecute(command, timeout=None):
+            return controller.execute(command, timeout)
+
+        async def aconsole(command):
+            return controller.console(command)
+        controller.aexecute, controller.aconsole = aexecute, aconsole
+        threads = []
+        snapshot = session.snapshot
+
+        def recording_snapshot(*args):
+            threads.append(threading.get_ident())
+            return snapshot(*args)
+        session.snapshot = recording_snapshot
+
+        async def step():
+            return threading.get_ident(), await session.astep_forward()
+        loop_thread, response = async_to_sync(step)()
+        self.assertEqual(response["current_line"], 2)
+        self.assertEqual(len(threads), 1)
+        self.assertNotEqual(threads[0], loop_thread)
+
+    def test_history_truncate_and_find_line(self):
+        session = self.started_session(10, interval=0)
+        self.assertEqual(session.history.find_line(3, before=10), 2)
+        self.assertIsNone(session.history.find_line(11, before=10))
+        session.history.truncate(6)
+        self.assertEqual(session.history.last_step, 5)
+        self.assertEqual(session.history.get(5)["memory_state"]["line"][0], "6")
+
+
+def fake_program(steps):
+    """A _step stand-in for a program with one variable that counts its steps."""
+    state = {"step": 0}
+
+    async def step(session_id):
+        state["step"] += 1
+        if state["step"] > steps:
+            return {"current_line": None, "function_name": None, "memory_state": {}, "status": "completed",
+                    "seq": state["step"]}
+        memory_state = {"i": (str(state["step"]), "0x10", "int", 4), "fixed": ("1", "0x14", "int", 4)}
+        return {"current_line": state["step"], "function_name": "main", "memory_state": memory_state,
+                "status": "running", "seq": state["step"]}
+    return step
+
+
+@override_settings(DEBUG_STREAM_WINDOW=2, DEBUG_STREAM_ACK_TIMEOUT=30)
+class StepStreamTests(TestCase):
+    async def collect(self, steps, rate=None, ack=False):
+        events = []
+        with mock.patch('visualize_code.helpers.step_stream._step', fake_program(steps)):
+            async for chunk in stream_steps('stream', rate):
+                fields = dict(line.split(': ', 1) for line in chunk.strip().split('\n'))
+                events.append((fields['event'], json.loads(fields['data'])))
+                if ack and 'id' in fields:
+                    ack_stream('stream', int(fields['id']))
+        return events
+
+    async def test_acknowledged_stream_sends_every_step_as_delta(self):
+        events = await self.collect(5, ack=True)
+        self.assertEqual([name for name, _ in events], ["step"] * 6 + ["end"])
+        self.assertIn("memory_state", events[0][1])
+        self.assertEqual(events[1][1]["memory_delta"]["changed"], {"i": ["2", "0x10", "int", 4]})
+        self.assertEqual(events[1][1]["coalesced"], 0)
+        self.assertEqual(events[-1][1]["reason"], "completed")
+
+    async def test_slow_client_gets_coalesced_frames(self):
+        events = await self.collect(50)
+        steps = [data for name, data in events if name == "step"]
+        # Two events fill the window; everything after collapses into the final one
+        self.assertEqual(len(steps), 3)
+        self.assertEqual(steps[-1]["status"], "completed")
+        self.assertEqual(steps[-1]["coalesced"], 48)
+        self.assertIn("error", ack_stream('stream', 1))  # The stream is gone once it ended
+
+    async def test_play_mode_paces_steps(self):
+        started = time.monotonic()
+        events = await self.collect(3, rate=20, ack=True)
+        self.assertGreaterEqual(time.monotonic() - started, 0.15)
+        self.assertEqual(events[-1], ("end", {"reason": "completed", "seq": 4}))
+
+
+@unittest.skipUnless(hasattr(socket, 'AF_UNIX'), "the session broker uses Unix sockets")
+class SessionBrokerTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, True)
+        self.socket_path = os.path.join(self.directory, 'broker.sock')
+        self.broker = SessionBroker(self.socket_path)
+        threading.Thread(target=self.broker.serve_forever, daemon=True).start()
+        self.addCleanup(self.broker.server_close)
+        self.addCleanup(self.broker.shutdown)
+
+    def test_requests_round_trip_over_one_connection(self):
+        client = BrokerClient([self.socket_path])
+        self.assertEqual(client.call("step", "missing"), {"error": "Session not available."})
+        self.assertEqual(client.call("stop", "missing"), {"error": "Session not available."})
+        self.assertIn("sessions", client.stats()[0])
+        self.assertIn("Unknown broker operation", client.call("bogus", "missing")["error"])
+
+    def test_stream_acks_reach_the_stream_from_any_worker(self):
+        # Two clients stand in for two web workers: one streams, the other gets the ack POSTs
+        streaming, acking = BrokerAckBoard(BrokerClient([self.socket_path])), BrokerAckBoard(BrokerClient([self.socket_path]))
+        generation = streaming.open("s")
+        self.assertEqual(acking.ack("s", 3), {"acked": 3})
+        self.assertEqual(streaming.wait("s", generation, 0, 0), {"acked": 3, "replaced": False})
+        acking.open("s")  # The user pressed Play again
+        self.assertTrue(streaming.wait("s", generation, 3, 1)["replaced"])
+
+    def test_stream_is_credited_through_the_broker(self):
+        events = []
+
+        async def collect():
+            with mock.patch('visualize_code.helpers.step_stream._step', fake_program(4)):
+                async for chunk in stream_steps('brokered'):
+                    fields = dict(line.split(': ', 1) for line in chunk.strip().split('\n'))
+                    events.append(fields['event'])
+                    if 'id' in fields:
+                        await sync_to_async(ack_stream, thread_sensitive=False)('brokered', int(fields['id']))
+
+        with override_settings(DEBUG_SESSION_BROKER_SOCKETS=[self.socket_path], DEBUG_STREAM_WINDOW=1):
+            async_to_sync(collect)()
+        self.assertEqual(events, ["step"] * 5 + ["end"])
+
+    def test_only_idempotent_requests_are_resent_after_a_lost_reply(self):
+        path = os.path.join(self.directory, 'mute.sock')
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(path)
+        server.listen()
+        self.addCleanup(server.close)
+        received = []
+
+        def serve():
+            # Reads each request, then drops the connection without a reply
+            while True:
+                try:
+                    connection, _ = server.accept()
+                except OSError:
+                    return
+                with connection:
+                    received.append(recv_message(connection)["op"])
+        threading.Thread(target=serve, daemon=True).start()
+
+        client = BrokerClient([path])
+        with self.assertRaises(BrokerError):
+            client.call("step", "s")
+        self.assertEqual(received, ["step"])  # Not run a second time
+        with self.assertRaises(BrokerError):
+            client.call("resync", "s")
+        self.assertEqual(received, ["step", "resync", "resync"])
+
+    def test_sharding_is_stable(self):
+        client = BrokerClient(['a.sock', 'b.sock', 'c.sock'])
+        shards = {client.shard_for(f"session-{i}") for i in range(50)}
+        self.assertEqual(shards, {0, 1, 2})
+        self.assertEqual(client.shard_for("abc"), BrokerClient(['a', 'b', 'c']).shard_for("abc"))
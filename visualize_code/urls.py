@@ -5,5 +5,16 @@ urlpatterns = [
     path('', views.home, name='home'),
     path('start_debugging/', views.start_debugging, name='start_debugging'),
     path('step_forward/', views.step_forward, name='step_forward'),  # For stepping to the next line
+    path('step_back/', views.step_back, name='step_back'),  # Previous step, from history
+    path('goto_step/', views.goto_step, name='goto_step'),
+    path('step_backward/', views.step_backward, name='step_backward'),  # Rewinds the program itself
+    path('run_back_to_line/', views.run_back_to_line, name='run_back_to_line'),
+    path('stream_steps/', views.stream_steps, name='stream_steps'),  # Server-Sent Events, ASGI only
+    path('stream_ack/', views.stream_ack, name='stream_ack'),
+    path('resync/', views.resync, name='resync'),  # Full snapshot for delta clients
+    path('array_elements/', views.array_elements, name='array_elements'),  # Pages of summarized arrays
+    path('memory_dump/', views.memory_dump, name='memory_dump'),  # Hexdump of the stopped program's memory
+    path('frame_locals/', views.frame_locals, name='frame_locals'),  # Locals of an outer frame, on demand
     path('stop_debugging/', views.stop_debugging, name='stop_debugging'),
+    path('stats/', views.stats, name='stats'),
 ]
\ No newline at end of file
@@ -1,16 +1,35 @@
-from .helpers.gdb_helper import start_debugging_session, step_forward_session, stop_debugging_session
+from .helpers.gdb_helper import (
+    astart_debugging_session, astep_forward_session, astop_debugging_session, resync_debugging_session,
+    step_back_session, goto_step_session, step_backward_session, run_back_to_line_session, array_elements_session,
+    memory_dump_session, frame_locals_session,
+)
+from .helpers.clang_cache import get_translation_unit_cache
+from .helpers.compile_cache import get_compile_cache
+from .helpers.executor import ExecutorBusy, get_build_executor
+from .helpers.gdb_pool import get_gdb_pool
+from .helpers.metrics import histogram_snapshots
+from .helpers.session_broker import get_broker_client
+from .helpers.session_manager import get_session_manager
+from .helpers.run_helper import acompile_and_run
+from .helpers.step_stream import ack_stream, stream_steps as step_events
 from django.shortcuts import render
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
+from django.conf import settings
 from django.utils.safestring import mark_safe
 from django.views.decorators.csrf import csrf_exempt
-import subprocess
+from asgiref.sync import sync_to_async
 import json
-import os
 
-def home(request):
+def async_csrf_exempt(view_func):
+    """csrf_exempt for async views; Django 4.2's decorator hides the coroutine function behind a sync wrapper."""
+    view_func.csrf_exempt = True
+    return view_func
+
+async def home(request):
     """
     Renders the main page for the C code visualization tool.
-    Handles C code submission and compilation.
+    Handles C code submission and compilation without blocking a thread
+    on gcc or the user's program.
     """
     context = {}
     if request.method == 'POST':
@@ -22,78 +41,230 @@ def home(request):
             context['error'] = "No C code provided."
             return render(request, 'visualize_code/home.html', context)
 
-        temp_file = 'tempfile.c'
         try:
-            # Save the submitted C code to a temporary file
-            with open(temp_file, 'w') as file:
-                file.write(c_code)
-
-            # Action: Run the code
+            # Action: Run the code on the bounded build pool
             if action == 'run_code':
-                compile_result = subprocess.run(
-                    ['gcc', '-g', temp_file, '-o', 'tempfile.out'],
-                    capture_output=True, text=True
-                )
-                if compile_result.returncode != 0:
-                    context['error'] = compile_result.stderr
-                else:
-                    execution_result = subprocess.run(['./tempfile.out'], capture_output=True, text=True)
-                    context['output'] = execution_result.stdout
+                context.update(await get_build_executor().arun(acompile_and_run, c_code))
 
             # Action: Visualize memory
             elif action == 'visualize_memory':
                 from .helpers.memory_helper import extract_memory_data
-                memory_data = extract_memory_data(c_code)
+                memory_data = await sync_to_async(extract_memory_data, thread_sensitive=False)(c_code)
                 context['memory_data'] = mark_safe(json.dumps(memory_data))
 
+        except ExecutorBusy as busy:
+            context['error'] = str(busy)
+            response = render(request, 'visualize_code/home.html', context, status=503)
+            response['Retry-After'] = str(busy.retry_after)
+            return response
+
         except Exception as e:
             context['error'] = str(e)
 
-        finally:
-            # Cleanup temporary files
-            if os.path.exists(temp_file):
-                os.remove(temp_file)
-            if os.path.exists('tempfile.out'):
-                os.remove('tempfile.out')
-
     return render(request, 'visualize_code/home.html', context)
 
-@csrf_exempt
-def start_debugging(request):
+@async_csrf_exempt
+async def start_debugging(request):
     """
     Starts a debugging session using GDB.
     """
     if request.method == "POST":
         try:
-            response = start_debugging_session(request)
+            response = await astart_debugging_session(request)
             print(response)
             return JsonResponse(response)
+        except ExecutorBusy as busy:
+            response = JsonResponse({"error": str(busy), "retry_after": busy.retry_after}, status=503)
+            response['Retry-After'] = str(busy.retry_after)
+            return response
         except Exception as e:
             return JsonResponse({"error": str(e)}, status=500)
     return JsonResponse({"error": "Invalid request method. Only POST is allowed."}, status=405)
 
-@csrf_exempt
-def stop_debugging(request):
+@async_csrf_exempt
+async def stop_debugging(request):
     """
     Stops an active debugging session.
     """
     if request.method == "POST":
         try:
-            response = stop_debugging_session(request)
+            response = await astop_debugging_session(request)
             return JsonResponse(response)
         except Exception as e:
             return JsonResponse({"error": str(e)}, status=500)
     return JsonResponse({"error": "Invalid request method. Only POST is allowed."}, status=405)
 
-@csrf_exempt
-def step_forward(request):
+@async_csrf_exempt
+async def step_forward(request):
     """
     Steps forward in the debugging session using GDB.
     """
     if request.method == "POST":
         try:
-            response = step_forward_session(request)
+            response = await astep_forward_session(request)
+            return JsonResponse(response)
+        except Exception as e:
+            return JsonResponse({"error": str(e)}, status=500)
+    return JsonResponse({"error": "Invalid request method. Only POST is allowed."}, status=405)
+
+@csrf_exempt
+def step_back(request):
+    """
+    Shows the previous step from the session's history, without re-running
+    the program.
+    """
+    if request.method == "POST":
+        try:
+            response = step_back_session(request)
+            return JsonResponse(response)
+        except Exception as e:
+            return JsonResponse({"error": str(e)}, status=500)
+    return JsonResponse({"error": "Invalid request method. Only POST is allowed."}, status=405)
+
+@csrf_exempt
+def goto_step(request):
+    """
+    Shows step number `step` from the session's history, without re-running
+    the program.
+    """
+    if request.method == "POST":
+        try:
+            response = goto_step_session(request)
             return JsonResponse(response)
         except Exception as e:
             return JsonResponse({"error": str(e)}, status=500)
     return JsonResponse({"error": "Invalid request method. Only POST is allowed."}, status=405)
+
+@csrf_exempt
+def step_backward(request):
+    """
+    Rewinds the program to the previous step using gdb checkpoints.
+    """
+    if request.method == "POST":
+        try:
+            response = step_backward_session(request)
+            return JsonResponse(response)
+        except Exception as e:
+            return JsonResponse({"error": str(e)}, status=500)
+    return JsonResponse({"error": "Invalid request method. Only POST is allowed."}, status=405)
+
+@csrf_exempt
+def run_back_to_line(request):
+    """
+    Rewinds the program to the last step before this one that stopped on
+    `line`, using gdb checkpoints.
+    """
+    if request.method == "POST":
+        try:
+            response = run_back_to_line_session(request)
+            return JsonResponse(response)
+        except Exception as e:
+            return JsonResponse({"error": str(e)}, status=500)
+    return JsonResponse({"error": "Invalid request method. Only POST is allowed."}, status=405)
+
+async def stream_steps(request):
+    """
+    Streams the session's steps as Server-Sent Events. `?mode=play&rate=N`
+    steps N times per second, `?mode=run` runs to the end as fast as the
+    client acknowledges events (see stream_ack). Needs the ASGI server.
+    """
+    session_id = request.session.session_key
+    rate = None
+    if request.GET.get('mode', 'play') == 'play':
+        try:
+            rate = float(request.GET.get('rate', 2))
+        except ValueError:
+            return JsonResponse({"error": "rate must be a number."}, status=400)
+        rate = min(max(rate, 0.1), getattr(settings, 'DEBUG_STREAM_MAX_RATE', 50))
+
+    response = StreamingHttpResponse(step_events(session_id, rate), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Keep reverse proxies from buffering events
+    return response
+
+@csrf_exempt
+def stream_ack(request):
+    """
+    Acknowledges stream events up to `id`, letting the stream send more.
+    """
+    if request.method == "POST":
+        try:
+            event_id = int(json.loads(request.body).get('id', 0))
+            return JsonResponse(ack_stream(request.session.session_key, event_id))
+        except Exception as e:
+            return JsonResponse({"error": str(e)}, status=500)
+    return JsonResponse({"error": "Invalid request method. Only POST is allowed."}, status=405)
+
+@csrf_exempt
+def array_elements(request):
+    """
+    Returns `count` elements of array `variable` from index `start`, read
+    from the stopped program, for arrays a step only sent a summary of.
+    """
+    if request.method == "POST":
+        try:
+            response = array_elements_session(request)
+            return JsonResponse(response)
+        except Exception as e:
+            return JsonResponse({"error": str(e)}, status=500)
+    return JsonResponse({"error": "Invalid request method. Only POST is allowed."}, status=405)
+
+@csrf_exempt
+def memory_dump(request):
+    """
+    Returns a hexdump of the stopped program's memory: `length` bytes at
+    `address`, or by default the current stack frame, with the locals in it.
+    """
+    if request.method == "POST":
+        try:
+            response = memory_dump_session(request)
+            return JsonResponse(response)
+        except Exception as e:
+            return JsonResponse({"error": str(e)}, status=500)
+    return JsonResponse({"error": "Invalid request method. Only POST is allowed."}, status=405)
+
+@csrf_exempt
+def frame_locals(request):
+    """
+    Returns the locals of frame `level` of the current backtrace (0 is the
+    innermost), which steps leave out for every frame but the current one.
+    """
+    if request.method == "POST":
+        try:
+            response = frame_locals_session(request)
+            return JsonResponse(response)
+        except Exception as e:
+            return JsonResponse({"error": str(e)}, status=500)
+    return JsonResponse({"error": "Invalid request method. Only POST is allowed."}, status=405)
+
+@csrf_exempt
+def resync(request):
+    """
+    Returns the current step of the debugging session with its full
+    memory_state, for clients that lost track of delta responses.
+    """
+    if request.method == "POST":
+        try:
+            response = resync_debugging_session(request)
+            return JsonResponse(response)
+        except Exception as e:
+            return JsonResponse({"error": str(e)}, status=500)
+    return JsonResponse({"error": "Invalid request method. Only POST is allowed."}, status=405)
+
+
+def stats(request):
+    """
+    Reports runtime counters for the compile and libclang caches, build pool,
+    GDB process pool and debugging sessions, and per-command GDB latency
+    histograms.
+    With a session broker, session counters come from each broker shard.
+    """
+    broker = get_broker_client()
+    return JsonResponse({
+        "compile_cache": get_compile_cache().stats(),
+        "clang_cache": get_translation_unit_cache().stats(),
+        "build_executor": get_build_executor().stats(),
+        "gdb_pool": get_gdb_pool().stats(),
+        "sessions": broker.stats() if broker else get_session_manager().stats(),
+        "gdb_latency": histogram_snapshots(),
+    })